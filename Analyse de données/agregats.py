@@ -0,0 +1,181 @@
+# agregats.py
+# Agrégats par business ou par utilisateur (nombre d'avis, moyenne et variance des notes)
+# calculés en streaming.
+#
+# Au lieu de charger tout un fichier famille avec pd.read_json (texte des avis compris),
+# on ne lit que business_id et stars dans chaque ligne brute, par lots, et on met à jour
+# des tableaux numpy (une case par business ou par utilisateur) :
+#   - le lot est agrégé d'un coup avec np.bincount (nombre, somme, écarts au carré) ;
+#   - il est ensuite fusionné aux agrégats déjà calculés avec la formule de Chan
+#     (combinaison de deux couples moyenne / somme des carrés des écarts), qui reste
+#     précise même sur des millions d'avis.
+import json
+import re
+
+import numpy as np
+
+# Lecture rapide des deux champs utiles directement dans la ligne brute (sans json.loads).
+# Les guillemets dans les textes sont échappés (\"), ces motifs ne peuvent donc pas y être trouvés.
+_BUSINESS_ID = re.compile(rb'"business_id":\s*"([^"\\]*)"')
+_STARS = re.compile(rb'"stars":\s*(-?[0-9]+(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)\s*[,}]')
+
+TAILLE_LOT = 100000
+
+
+class AgregatParCle:
+    """Agrégats des notes par clé (business_id, user_id...)."""
+
+    def __init__(self, capacite=1024):
+        self.index = {}           # clé -> case dans les tableaux
+        self.nb_lignes = 0        # tous les avis, même sans note
+        self.nb = np.zeros(capacite, dtype=np.int64)
+        self.moyenne = np.zeros(capacite, dtype=np.float64)
+        self.m2 = np.zeros(capacite, dtype=np.float64)   # somme des carrés des écarts à la moyenne
+
+    def _positions(self, cles):
+        index = self.index
+        positions = np.fromiter(
+            (index.setdefault(cle, len(index)) for cle in cles),
+            dtype=np.int64, count=len(cles)
+        )
+        if len(index) > len(self.nb):
+            capacite = max(len(index), 2 * len(self.nb))
+            for nom in ("nb", "moyenne", "m2"):
+                tableau = np.zeros(capacite, dtype=getattr(self, nom).dtype)
+                tableau[:len(getattr(self, nom))] = getattr(self, nom)
+                setattr(self, nom, tableau)
+        return positions
+
+    def ajouter_lot(self, cles, notes):
+        """cles : liste de str (une par avis) ; notes : tableau float (NaN = avis sans note)."""
+        self.nb_lignes += len(cles)
+        positions = self._positions(cles)
+
+        notees = ~np.isnan(notes)
+        positions, notes = positions[notees], notes[notees]
+        if not len(positions):
+            return
+
+        # Agrégats du lot seul
+        taille = len(self.index)
+        nb_lot = np.bincount(positions, minlength=taille)
+        touches = nb_lot > 0
+        moyenne_lot = np.zeros(taille)
+        moyenne_lot[touches] = np.bincount(positions, weights=notes, minlength=taille)[touches] / nb_lot[touches]
+        m2_lot = np.bincount(positions, weights=(notes - moyenne_lot[positions]) ** 2, minlength=taille)
+
+        # Fusion avec les agrégats précédents (Chan et al.)
+        nb_avant = self.nb[:taille][touches]
+        nb_apres = nb_avant + nb_lot[touches]
+        delta = moyenne_lot[touches] - self.moyenne[:taille][touches]
+        self.moyenne[:taille][touches] += delta * nb_lot[touches] / nb_apres
+        self.m2[:taille][touches] += m2_lot[touches] + delta ** 2 * nb_avant * nb_lot[touches] / nb_apres
+        self.nb[:taille][touches] = nb_apres
+
+    # ----------------------------
+    # RÉSULTATS
+    # ----------------------------
+    def tableaux(self):
+        """(nombre d'avis notés, moyenne, variance) par clé, dans l'ordre de self.index."""
+        taille = len(self.index)
+        nb = self.nb[:taille]
+        moyenne = np.where(nb > 0, self.moyenne[:taille], np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            variance = np.where(nb > 1, self.m2[:taille] / (nb - 1), np.nan)
+        return nb, moyenne, variance
+
+    def moyenne_globale(self):
+        nb, moyenne, _ = self.tableaux()
+        total = nb.sum()
+        return float((nb * np.nan_to_num(moyenne)).sum() / total) if total else float("nan")
+
+    def variance_globale(self):
+        """Variance (n - 1) de toutes les notes, en fusionnant les agrégats des clés (formule de Chan)."""
+        taille = len(self.index)
+        nb = self.nb[:taille]
+        total = nb.sum()
+        if total < 2:
+            return float("nan")
+        notes = nb > 0
+        ecarts = self.moyenne[:taille][notes] - self.moyenne_globale()
+        m2 = self.m2[:taille][notes].sum() + (nb[notes] * ecarts ** 2).sum()
+        return float(m2 / (total - 1))
+
+    def correlation_nb_moyenne(self):
+        """Corrélation de Pearson entre nombre d'avis et note moyenne (clés ayant au moins une note)."""
+        nb, moyenne, _ = self.tableaux()
+        notes = nb > 0
+        if notes.sum() < 2:
+            return float("nan")
+        x, y = nb[notes].astype(np.float64), moyenne[notes]
+        x, y = x - x.mean(), y - y.mean()
+        denominateur = np.sqrt((x * x).sum() * (y * y).sum())
+        return float((x * y).sum() / denominateur) if denominateur else float("nan")
+
+
+# ----------------------------
+# LECTURE
+# ----------------------------
+def _champs_json(ligne):
+    try:
+        obj = json.loads(ligne)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    if not isinstance(obj, dict) or obj.get("business_id") is None:
+        return None
+    note = obj.get("stars")
+    return obj["business_id"], float("nan") if note is None else float(note)
+
+
+def lire_lots_jsonl(chemin, taille_lot=TAILLE_LOT):
+    """Lots (business_ids, notes) d'un fichier JSONL, sans décoder le texte des avis."""
+    ids, notes = [], []
+    with open(chemin, "rb") as f:
+        for ligne in f:
+            bid = _BUSINESS_ID.search(ligne)
+            note = _STARS.search(ligne)
+            if bid and note:
+                ids.append(bid.group(1).decode("utf-8"))
+                notes.append(float(note.group(1)))
+            elif ligne.strip():
+                # Ligne inhabituelle (note nulle, clés dans un autre format...) : vrai parseur JSON
+                champs = _champs_json(ligne)
+                if champs is None:
+                    continue
+                ids.append(champs[0])
+                notes.append(champs[1])
+
+            if len(ids) >= taille_lot:
+                yield ids, np.array(notes, dtype=np.float64)
+                ids, notes = [], []
+    if ids:
+        yield ids, np.array(notes, dtype=np.float64)
+
+
+def lire_cles(chemin, cle):
+    """Ensemble des valeurs d'un champ texte (ex: user_id) d'un fichier JSONL.
+
+    Seul ce champ est extrait de chaque ligne : les autres (listes d'amis...) ne sont jamais décodés.
+    """
+    motif = re.compile(rb'"' + re.escape(cle.encode("utf-8")) + rb'":\s*"([^"\\]*)"')
+    cles = set()
+    with open(chemin, "rb") as f:
+        for ligne in f:
+            trouve = motif.search(ligne)
+            if trouve:
+                cles.add(trouve.group(1).decode("utf-8"))
+            elif ligne.strip():
+                try:
+                    valeur = json.loads(ligne).get(cle)
+                except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+                    continue
+                if valeur is not None:
+                    cles.add(valeur)
+    return cles
+
+
+def agreger(lots):
+    agregat = AgregatParCle()
+    for cles, notes in lots:
+        agregat.ajouter_lot(cles, notes)
+    return agregat
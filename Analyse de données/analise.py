@@ -3,12 +3,17 @@
 # ======================================================
 
 import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from dotenv import load_dotenv
-from sklearn.feature_extraction.text import TfidfVectorizer
+
+# agregats.py et vocabulaire_contrastif.py sont dans le même dossier que ce script
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from agregats import AgregatParCle, lire_cles
+from vocabulaire_contrastif import TOUTES, VocabulaireContrastif, familles_par_business
 
 sns.set(style="whitegrid")
 
@@ -22,27 +27,23 @@ REVIEWS_PATH = os.getenv("INPUT_REVIEWS")
 BUSINESS_PATH = os.getenv("INPUT_BUSINESS")
 USER_PATH = os.getenv("INPUT_USER")
 
-print("Chargement des données...")
-
-# ======================================================
-# LOAD DATA
-# ======================================================
+# Mode d'analyse :
+#   - "streaming" (défaut) : les avis sont lus par blocs et les statistiques sont mises à jour
+#     bloc par bloc ; des fichiers business et users on ne garde que les identifiants.
+#     La mémoire dépend du nombre de business / utilisateurs, pas du nombre d'avis.
+#   - "memoire" : ancien comportement, les trois fichiers sont chargés en entier puis fusionnés
+MODE_ANALYSE = os.getenv("MODE_ANALYSE", "streaming").lower()
 
-reviews = pd.read_json(REVIEWS_PATH, lines=True)
-business = pd.read_json(BUSINESS_PATH, lines=True)
-users = pd.read_json(USER_PATH, lines=True)
+# Nombre d'avis lus à la fois en mode streaming
+TAILLE_BLOC = 100000
 
-print("Reviews shape:", reviews.shape)
-print("Business shape:", business.shape)
-print("Users shape:", users.shape)
+# Nombre de mots affichés par polarité dans l'analyse du vocabulaire (section 5)
+NB_MOTS_VOCABULAIRE = 10
 
 # ======================================================
 # BASIC FEATURE ENGINEERING
 # ======================================================
 
-# Longueur des avis
-reviews["length"] = reviews["text"].apply(len)
-
 # Polarité
 def polarity(stars):
     if stars > 3:
@@ -52,14 +53,166 @@ def polarity(stars):
     else:
         return "neutre"
 
-reviews["polarity"] = reviews["stars"].apply(polarity)
+
+def polarites(stars):
+    # Même résultat que stars.apply(polarity), en une opération sur toute la colonne
+    return pd.Series(np.select([stars > 3, stars < 3], ["positif", "negatif"], "neutre"), index=stars.index)
+
+
+# ======================================================
+# LOAD DATA (MODE MÉMOIRE)
+# ======================================================
+
+def analyser_memoire():
+    reviews = pd.read_json(REVIEWS_PATH, lines=True)
+    business = pd.read_json(BUSINESS_PATH, lines=True)
+    users = pd.read_json(USER_PATH, lines=True)
+
+    print("Reviews shape:", reviews.shape)
+    print("Business shape:", business.shape)
+    print("Users shape:", users.shape)
+
+    # Longueur des avis
+    reviews["length"] = reviews["text"].apply(len)
+    reviews["polarity"] = reviews["stars"].apply(polarity)
+
+    df = reviews.merge(
+        business,
+        on="business_id",
+        suffixes=("_review", "_business")
+    )
+
+    print("\nColonnes après merge business :")
+    print(df.columns)
+
+    # Analyse popularité business vs note moyenne
+    business_stats = df.groupby("business_id").agg(
+        nb_reviews=("stars_review", "count"),
+        avg_rating=("stars_review", "mean")
+    )
+
+    df = df.merge(users, on="user_id")
+
+    print("\nColonnes après merge users :")
+    print(df.columns)
+
+    # Les gros reviewers sont-ils plus sévères ?
+    user_stats = df.groupby("user_id").agg(
+        nb_reviews_written=("stars_review", "count"),
+        avg_given_rating=("stars_review", "mean")
+    )
+
+    # Vocabulaire positif / négatif, sur tout le corpus et par famille
+    familles_business = familles_par_business(BUSINESS_PATH)
+    vocabulaire = VocabulaireContrastif()
+    vocabulaire.ajouter_lot(
+        reviews["text"].tolist(),
+        reviews["polarity"].tolist(),
+        [familles_business.get(b, ()) for b in reviews["business_id"]]
+    )
+
+    return {
+        "repartition_notes": reviews["stars"].value_counts().sort_index(),
+        "longueur_par_note": reviews.groupby("stars")["length"].mean(),
+        "longueur_par_polarite": reviews.groupby("polarity")["length"].mean(),
+        "business_stats": business_stats,
+        "user_stats": user_stats,
+        "vocabulaire": vocabulaire,
+    }
+
+
+# ======================================================
+# LOAD DATA (MODE STREAMING)
+# ======================================================
+
+def additionner(total, partiel):
+    # Somme de deux Series / DataFrames indexés par note ou polarité (None = rien encore)
+    return partiel if total is None else total.add(partiel, fill_value=0)
+
+
+def analyser_streaming():
+    # Dimensions compactes : les identifiants (la jointure interne ne sert qu'à filtrer)
+    # et, pour les business, leurs familles
+    familles_business = familles_par_business(BUSINESS_PATH)
+    ids_users = lire_cles(USER_PATH, "user_id")
+    print("Business :", len(familles_business), "identifiants")
+    print("Users :", len(ids_users), "identifiants")
+
+    repartition = None
+    longueurs_note = None
+    longueurs_polarite = None
+    agregat_business = AgregatParCle()
+    agregat_users = AgregatParCle()
+    vocabulaire = VocabulaireContrastif()
+    nb_avis = 0
+
+    for chunk in pd.read_json(REVIEWS_PATH, lines=True, chunksize=TAILLE_BLOC):
+        nb_avis += len(chunk)
+        longueur = chunk["text"].str.len()
+        polarite = polarites(chunk["stars"])
+
+        repartition = additionner(repartition, chunk["stars"].value_counts())
+        longueurs_note = additionner(longueurs_note, longueur.groupby(chunk["stars"]).agg(["sum", "count"]))
+        longueurs_polarite = additionner(longueurs_polarite, longueur.groupby(polarite).agg(["sum", "count"]))
+
+        vocabulaire.ajouter_lot(
+            chunk["text"].tolist(),
+            polarite.tolist(),
+            [familles_business.get(b, ()) for b in chunk["business_id"]]
+        )
+
+        # Équivalent de reviews.merge(business) puis .merge(users) (jointures internes)
+        avec_business = np.fromiter((b in familles_business for b in chunk["business_id"]), dtype=bool, count=len(chunk))
+        avec_user = avec_business & np.fromiter((u in ids_users for u in chunk["user_id"]), dtype=bool, count=len(chunk))
+        notes = chunk["stars"].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        agregat_business.ajouter_lot(chunk["business_id"][avec_business].tolist(), notes[avec_business])
+        agregat_users.ajouter_lot(chunk["user_id"][avec_user].tolist(), notes[avec_user])
+
+        print(f"   {nb_avis} avis traités...")
+
+    nb, moyenne, _ = agregat_business.tableaux()
+    business_stats = pd.DataFrame(
+        {"nb_reviews": nb, "avg_rating": moyenne},
+        index=pd.Index(list(agregat_business.index), name="business_id")
+    ).sort_index()
+
+    nb, moyenne, _ = agregat_users.tableaux()
+    user_stats = pd.DataFrame(
+        {"nb_reviews_written": nb, "avg_given_rating": moyenne},
+        index=pd.Index(list(agregat_users.index), name="user_id")
+    ).sort_index()
+
+    print("Reviews :", nb_avis, "avis")
+    print("Avis avec business connu :", agregat_business.nb_lignes)
+    print("Avis avec business et user connus :", agregat_users.nb_lignes)
+
+    return {
+        "repartition_notes": repartition.astype("int64").sort_index(),
+        "longueur_par_note": (longueurs_note["sum"] / longueurs_note["count"]).rename("length"),
+        "longueur_par_polarite": (longueurs_polarite["sum"] / longueurs_polarite["count"])
+                                 .rename("length").rename_axis("polarity"),
+        "business_stats": business_stats,
+        "user_stats": user_stats,
+        "vocabulaire": vocabulaire,
+    }
+
+
+print(f"Chargement des données (mode {MODE_ANALYSE})...")
+
+if MODE_ANALYSE == "memoire":
+    resultats = analyser_memoire()
+elif MODE_ANALYSE == "streaming":
+    resultats = analyser_streaming()
+else:
+    raise ValueError(f"❌ MODE_ANALYSE inconnu : {MODE_ANALYSE} (attendu : streaming ou memoire)")
 
 # ======================================================
 # 1️⃣ RÉPARTITION DES NOTES
 # ======================================================
 
 plt.figure()
-reviews["stars"].value_counts().sort_index().plot(kind="bar")
+resultats["repartition_notes"].plot(kind="bar")
 plt.title("Répartition des notes")
 plt.xlabel("Nombre d'étoiles")
 plt.ylabel("Nombre d'avis")
@@ -70,32 +223,20 @@ plt.show()
 # ======================================================
 
 plt.figure()
-reviews.groupby("stars")["length"].mean().plot(kind="bar")
+resultats["longueur_par_note"].plot(kind="bar")
 plt.title("Longueur moyenne des avis par note")
 plt.ylabel("Longueur moyenne (caractere)")
 plt.show()
 
 print("\nLongueur moyenne par polarité :")
-print(reviews.groupby("polarity")["length"].mean())
+print(resultats["longueur_par_polarite"])
 
 # ======================================================
 # 3️⃣ MERGE AVEC BUSINESS
 # ======================================================
 
-df = reviews.merge(
-    business,
-    on="business_id",
-    suffixes=("_review", "_business")
-)
-
-print("\nColonnes après merge business :")
-print(df.columns)
-
 # Analyse popularité business vs note moyenne
-business_stats = df.groupby("business_id").agg(
-    nb_reviews=("stars_review", "count"),
-    avg_rating=("stars_review", "mean")
-)
+business_stats = resultats["business_stats"]
 
 plt.figure()
 plt.scatter(business_stats["nb_reviews"],
@@ -109,16 +250,8 @@ plt.show()
 # 4️⃣ MERGE AVEC USERS
 # ======================================================
 
-df = df.merge(users, on="user_id")
-
-print("\nColonnes après merge users :")
-print(df.columns)
-
 # Les gros reviewers sont-ils plus sévères ?
-user_stats = df.groupby("user_id").agg(
-    nb_reviews_written=("stars_review", "count"),
-    avg_given_rating=("stars_review", "mean")
-)
+user_stats = resultats["user_stats"]
 
 plt.figure()
 plt.scatter(user_stats["nb_reviews_written"],
@@ -129,29 +262,27 @@ plt.ylabel("Note moyenne donnée")
 plt.show()
 
 # ======================================================
-# 5️⃣ ANALYSE VOCABULAIRE TF-IDF
+# 5️⃣ ANALYSE DU VOCABULAIRE POSITIF / NÉGATIF
 # ======================================================
 
-positive_reviews = reviews[reviews["polarity"] == "positif"]["text"]
-negative_reviews = reviews[reviews["polarity"] == "negatif"]["text"]
-
-vectorizer = TfidfVectorizer(
-    stop_words="english",
-    max_features=1000
-)
-
-X_pos = vectorizer.fit_transform(positive_reviews)
-X_neg = vectorizer.fit_transform(negative_reviews)
+# Mots classés par log-odds (voir vocabulaire_contrastif.py), calculés pendant la lecture des avis
+vocabulaire = resultats["vocabulaire"]
+termes = vocabulaire.resume(NB_MOTS_VOCABULAIRE)
+print(f"\nVocabulaire : {len(vocabulaire.vocabulaire)} mots distincts")
 
-words = vectorizer.get_feature_names_out()
+if termes.empty:
+    print("Pas assez d'avis positifs et négatifs pour comparer le vocabulaire.")
+else:
+    tous = termes[termes["famille"] == TOUTES]
 
-top_pos = np.argsort(X_pos.mean(axis=0)).A1[-10:]
-top_neg = np.argsort(X_neg.mean(axis=0)).A1[-10:]
+    print(f"\nTop {NB_MOTS_VOCABULAIRE} mots positifs :")
+    print(tous[tous["polarite"] == "positif"]["terme"].tolist())
 
-print("\nTop 10 mots positifs :")
-print([words[i] for i in top_pos])
+    print(f"\nTop {NB_MOTS_VOCABULAIRE} mots négatifs :")
+    print(tous[tous["polarite"] == "negatif"]["terme"].tolist())
 
-print("\nTop 10 mots négatifs :")
-print([words[i] for i in top_neg])
+    print("\nMots les plus typiques par famille :")
+    for (famille, polarite), groupe in termes.groupby(["famille", "polarite"], sort=False):
+        print(f"  {famille} ({polarite}) : {', '.join(groupe['terme'].head(5))}")
 
 print("\nAnalyse terminée.")
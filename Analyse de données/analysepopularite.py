@@ -1,8 +1,16 @@
 import os
+import sys
+import multiprocessing as mp
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 
+# Les modules partagés du pipeline sont dans le dossier code/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../code"))
+import stockage_parquet
+from agregats import agreger, lire_lots_jsonl
+
 load_dotenv()
 
 # Dossier où se trouvent tes 10 fichiers JSONL
@@ -15,47 +23,73 @@ if not DOSSIER_FAMILLES:
 DOSSIER_GRAPHIQUES = os.path.join(DOSSIER_FAMILLES, "graphs_businessPopulairesNoter")
 os.makedirs(DOSSIER_GRAPHIQUES, exist_ok=True)
 
-resultats_familles = []
-resultats_correlations = []
-
-# Parcours de tous les fichiers JSONL du dossier
-for nom_fichier in os.listdir(DOSSIER_FAMILLES):
-    if not nom_fichier.endswith(".jsonl"):
-        continue
-
-    chemin = os.path.join(DOSSIER_FAMILLES, nom_fichier)
-    print(f"Analyse de {nom_fichier} ...")
-
-    # Chargement du JSONL
-    df = pd.read_json(chemin, lines=True)
+# Mode d'agrégation :
+#   - "streaming" (défaut) : seuls business_id et stars sont lus, les agrégats par business
+#     (nombre d'avis, moyenne, variance) sont mis à jour lot par lot (voir agregats.py) ;
+#     la variance des notes de la famille (colonne variance_note de resume_familles.csv)
+#     est obtenue en fusionnant ces agrégats
+#   - "memoire" : ancien comportement, chaque fichier famille est chargé en entier avec pandas
+MODE_AGREGATION = os.getenv("MODE_AGREGATION", "streaming").lower()
+
+# Nombre de processus (une famille par processus ; défaut = nombre de coeurs)
+NB_PROCESSUS = int(os.getenv("NB_PROCESSUS", "0")) or os.cpu_count() or 1
+
+
+def lister_sources():
+    # Avec LIRE_PARQUET=1 on lit la copie Parquet partitionnée par famille :
+    # seules les colonnes business_id et stars sont décodées (pas le texte des avis)
+    if stockage_parquet.LIRE_PARQUET:
+        dossier_parquet = stockage_parquet.dossier_etape("familles")
+        return [(f"{famille}.jsonl", famille) for famille in stockage_parquet.lister_familles(dossier_parquet)]
+
+    # Tous les fichiers JSONL du dossier
+    return [
+        (nom_fichier, os.path.join(DOSSIER_FAMILLES, nom_fichier))
+        for nom_fichier in os.listdir(DOSSIER_FAMILLES)
+        if nom_fichier.endswith(".jsonl")
+    ]
+
+
+def lots_parquet(famille):
+    dossier_parquet = stockage_parquet.dossier_etape("familles")
+    for df in stockage_parquet.iter_lots(dossier_parquet, colonnes=["business_id", "stars"],
+                                         filtres=[("famille", "==", famille)]):
+        df = df[df["business_id"].notna()]
+        yield df["business_id"].tolist(), df["stars"].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def agreger_famille(tache):
+    # Mode streaming : exécuté dans un processus de travail, une famille à la fois
+    nom_fichier, source = tache
+    lots = lots_parquet(source) if stockage_parquet.LIRE_PARQUET else lire_lots_jsonl(source)
+    agregat = agreger(lots)
+    nb_reviews, mean_stars, _ = agregat.tableaux()
+
+    return nom_fichier, {
+        "nb_total_avis": agregat.nb_lignes,
+        "nb_business": len(agregat.index),
+        "note_moyenne": agregat.moyenne_globale(),
+        "variance_note": agregat.variance_globale(),
+        "correlation": agregat.correlation_nb_moyenne(),
+        "nb_reviews": nb_reviews,
+        "mean_stars": mean_stars,
+    }
+
+
+def agreger_famille_memoire(tache):
+    # Ancien comportement : tout le fichier est chargé avec pandas
+    nom_fichier, source = tache
+    if stockage_parquet.LIRE_PARQUET:
+        df = stockage_parquet.lire_colonnes(
+            stockage_parquet.dossier_etape("familles"),
+            colonnes=["business_id", "stars"],
+            filtres=[("famille", "==", source)]
+        )
+    else:
+        df = pd.read_json(source, lines=True)
 
     if "business_id" not in df.columns or "stars" not in df.columns:
-        print(f"⚠️ Colonnes manquantes dans {nom_fichier}, ignoré.")
-        continue
-
-    # Nom de la famille depuis le nom du fichier
-    famille = nom_fichier.replace(".jsonl", "").replace("_", " ")
-
-    # =========================
-    # 📊 Stats globales famille
-    # =========================
-
-    nb_total_avis = len(df)
-    nb_business = df["business_id"].nunique()
-    note_moyenne = df["stars"].mean()
-
-    resultats_familles.append({
-        "famille": famille,
-        "nb_business": nb_business,
-        "nb_total_avis": nb_total_avis,
-        "note_moyenne": note_moyenne
-    })
-
-    print(f"  {famille} -> business: {nb_business}, avis: {nb_total_avis}, note moyenne: {note_moyenne:.2f}")
-
-    # =========================
-    # 📈 Stats par business
-    # =========================
+        return nom_fichier, None
 
     stats_business = (
         df.groupby("business_id")
@@ -72,85 +106,156 @@ for nom_fichier in os.listdir(DOSSIER_FAMILLES):
     else:
         corr = float("nan")
 
-    resultats_correlations.append({
-        "famille": famille,
+    return nom_fichier, {
+        "nb_total_avis": len(df),
+        "nb_business": df["business_id"].nunique(),
+        "note_moyenne": df["stars"].mean(),
+        "variance_note": df["stars"].var(),
         "correlation": corr,
-        "nb_business": len(stats_business)
-    })
+        "nb_reviews": stats_business["nb_reviews"].to_numpy(),
+        "mean_stars": stats_business["mean_stars"].to_numpy(),
+    }
+
+
+def analyser_familles():
+    sources = lister_sources()
+    fonction = agreger_famille if MODE_AGREGATION == "streaming" else agreger_famille_memoire
+    nb_processus = max(1, min(NB_PROCESSUS, len(sources)))
+    print(f"Analyse de {len(sources)} familles ({MODE_AGREGATION}, {nb_processus} processus)...")
+
+    if nb_processus == 1:
+        yield from map(fonction, sources)
+        return
+
+    # imap garde l'ordre des familles : les CSV sont identiques quel que soit le nombre de processus
+    with mp.Pool(nb_processus) as pool:
+        yield from pool.imap(fonction, sources)
+
+
+def main():
+    if MODE_AGREGATION not in ("streaming", "memoire"):
+        raise ValueError(f"❌ MODE_AGREGATION inconnu : {MODE_AGREGATION} (attendu : streaming ou memoire)")
+
+    resultats_familles = []
+    resultats_correlations = []
+
+    for nom_fichier, stats in analyser_familles():
+        print(f"Analyse de {nom_fichier} ...")
+
+        if stats is None:
+            print(f"⚠️ Colonnes manquantes dans {nom_fichier}, ignoré.")
+            continue
+
+        # Nom de la famille depuis le nom du fichier
+        famille = nom_fichier.replace(".jsonl", "").replace("_", " ")
+
+        # =========================
+        # 📊 Stats globales famille
+        # =========================
+
+        nb_total_avis = stats["nb_total_avis"]
+        nb_business = stats["nb_business"]
+        note_moyenne = stats["note_moyenne"]
+
+        resultats_familles.append({
+            "famille": famille,
+            "nb_business": nb_business,
+            "nb_total_avis": nb_total_avis,
+            "note_moyenne": note_moyenne,
+            "variance_note": stats["variance_note"],
+        })
 
-    print(f"  Corrélation (par business) pour {famille} : {corr}")
+        print(f"  {famille} -> business: {nb_business}, avis: {nb_total_avis}, note moyenne: {note_moyenne:.2f}")
 
-    # Scatter plot par business pour la famille
+        # =========================
+        # 📈 Stats par business
+        # =========================
+
+        corr = stats["correlation"]
+
+        resultats_correlations.append({
+            "famille": famille,
+            "correlation": corr,
+            "nb_business": len(stats["nb_reviews"])
+        })
+
+        print(f"  Corrélation (par business) pour {famille} : {corr}")
+
+        # Scatter plot par business pour la famille
+        plt.figure()
+        plt.scatter(stats["nb_reviews"], stats["mean_stars"])
+        plt.xlabel("Nombre d'avis (par business)")
+        plt.ylabel("Note moyenne (par business)")
+        plt.title(f"Popularité vs Note moyenne - {famille}")
+
+        nom_graph = f"{famille.replace(' ', '_')}_scatter_business.png"
+        chemin_graph = os.path.join(DOSSIER_GRAPHIQUES, nom_graph)
+        plt.tight_layout()
+        plt.savefig(chemin_graph)
+        plt.close()
+
+    # =========================
+    # 📁 DataFrames récap
+    # =========================
+
+    df_familles = pd.DataFrame(resultats_familles)
+    df_correlations = pd.DataFrame(resultats_correlations)
+
+    print("\n=== Résumé par famille ===")
+    print(df_familles)
+
+    print("\n=== Résumé des corrélations par famille ===")
+    print(df_correlations)
+
+    # Sauvegarde CSV
+    chemin_csv_familles = os.path.join(DOSSIER_FAMILLES, "resume_familles.csv")
+    df_familles.to_csv(chemin_csv_familles, index=False, encoding="utf-8")
+
+    chemin_csv_corr = os.path.join(DOSSIER_FAMILLES, "resume_correlations.csv")
+    df_correlations.to_csv(chemin_csv_corr, index=False, encoding="utf-8")
+
+    # =========================
+    # 📊 Graphiques globaux
+    # =========================
+
+    # 1) Nombre de business par famille
+    plt.figure()
+    plt.bar(df_familles["famille"], df_familles["nb_business"])
+    plt.xticks(rotation=45, ha="right")
+    plt.ylabel("Nombre de business")
+    plt.title("Nombre de business par famille")
+    plt.tight_layout()
+    plt.savefig(os.path.join(DOSSIER_GRAPHIQUES, "nb_business_par_famille.png"))
+    plt.close()
+
+    # 2) Note moyenne par famille
     plt.figure()
-    plt.scatter(stats_business["nb_reviews"], stats_business["mean_stars"])
-    plt.xlabel("Nombre d'avis (par business)")
-    plt.ylabel("Note moyenne (par business)")
-    plt.title(f"Popularité vs Note moyenne - {famille}")
+    plt.bar(df_familles["famille"], df_familles["note_moyenne"])
+    plt.xticks(rotation=45, ha="right")
+    plt.ylabel("Note moyenne")
+    plt.title("Note moyenne par famille")
+    plt.tight_layout()
+    plt.savefig(os.path.join(DOSSIER_GRAPHIQUES, "note_moyenne_par_famille.png"))
+    plt.close()
+
+    # 3) Popularité (nb total d'avis) vs note moyenne (par famille)
+    plt.figure()
+    plt.scatter(df_familles["nb_total_avis"], df_familles["note_moyenne"])
+    plt.xlabel("Nombre total d'avis (popularité famille)")
+    plt.ylabel("Note moyenne")
+    plt.title("Popularité vs Note moyenne (par famille)")
+
+    for _, row in df_familles.iterrows():
+        plt.text(row["nb_total_avis"], row["note_moyenne"], row["famille"], fontsize=8)
 
-    nom_graph = f"{famille.replace(' ', '_')}_scatter_business.png"
-    chemin_graph = os.path.join(DOSSIER_GRAPHIQUES, nom_graph)
     plt.tight_layout()
-    plt.savefig(chemin_graph)
+    plt.savefig(os.path.join(DOSSIER_GRAPHIQUES, "popularite_vs_note_moyenne_familles.png"))
     plt.close()
 
-# =========================
-# 📁 DataFrames récap
-# =========================
-
-df_familles = pd.DataFrame(resultats_familles)
-df_correlations = pd.DataFrame(resultats_correlations)
-
-print("\n=== Résumé par famille ===")
-print(df_familles)
-
-print("\n=== Résumé des corrélations par famille ===")
-print(df_correlations)
-
-# Sauvegarde CSV
-chemin_csv_familles = os.path.join(DOSSIER_FAMILLES, "resume_familles.csv")
-df_familles.to_csv(chemin_csv_familles, index=False, encoding="utf-8")
-
-chemin_csv_corr = os.path.join(DOSSIER_FAMILLES, "resume_correlations.csv")
-df_correlations.to_csv(chemin_csv_corr, index=False, encoding="utf-8")
-
-# =========================
-# 📊 Graphiques globaux
-# =========================
-
-# 1) Nombre de business par famille
-plt.figure()
-plt.bar(df_familles["famille"], df_familles["nb_business"])
-plt.xticks(rotation=45, ha="right")
-plt.ylabel("Nombre de business")
-plt.title("Nombre de business par famille")
-plt.tight_layout()
-plt.savefig(os.path.join(DOSSIER_GRAPHIQUES, "nb_business_par_famille.png"))
-plt.close()
-
-# 2) Note moyenne par famille
-plt.figure()
-plt.bar(df_familles["famille"], df_familles["note_moyenne"])
-plt.xticks(rotation=45, ha="right")
-plt.ylabel("Note moyenne")
-plt.title("Note moyenne par famille")
-plt.tight_layout()
-plt.savefig(os.path.join(DOSSIER_GRAPHIQUES, "note_moyenne_par_famille.png"))
-plt.close()
-
-# 3) Popularité (nb total d'avis) vs note moyenne (par famille)
-plt.figure()
-plt.scatter(df_familles["nb_total_avis"], df_familles["note_moyenne"])
-plt.xlabel("Nombre total d'avis (popularité famille)")
-plt.ylabel("Note moyenne")
-plt.title("Popularité vs Note moyenne (par famille)")
-
-for _, row in df_familles.iterrows():
-    plt.text(row["nb_total_avis"], row["note_moyenne"], row["famille"], fontsize=8)
-
-plt.tight_layout()
-plt.savefig(os.path.join(DOSSIER_GRAPHIQUES, "popularite_vs_note_moyenne_familles.png"))
-plt.close()
-
-print(f"\nCSV familles : {chemin_csv_familles}")
-print(f"CSV corrélations : {chemin_csv_corr}")
-print(f"Graphiques sauvegardés dans : {DOSSIER_GRAPHIQUES}")
+    print(f"\nCSV familles : {chemin_csv_familles}")
+    print(f"CSV corrélations : {chemin_csv_corr}")
+    print(f"Graphiques sauvegardés dans : {DOSSIER_GRAPHIQUES}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# vocabulaire_contrastif.py
+# Mots qui distinguent les avis positifs des avis négatifs, sur tout le corpus et par famille.
+#
+# Le corpus est lu une seule fois :
+#   - chaque texte est découpé avec l'analyseur de scikit-learn (mêmes mots que l'ancien
+#     TfidfVectorizer(stop_words="english")) ;
+#   - les mots reçoivent un numéro dans UN vocabulaire partagé qui grandit au fil de la lecture ;
+#   - on additionne, lot par lot, le nombre d'occurrences de chaque mot par groupe
+#     (polarité x famille) dans une matrice creuse scipy.
+#
+# Les mots sont ensuite classés par log-odds avec un a priori de Dirichlet informatif
+# (Monroe, Colaresi & Quinn, 2008, "Fightin' Words") : l'a priori est la fréquence du mot
+# dans tout le corpus, ce qui évite que les mots rares dominent le classement.
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+# Les modules partagés du pipeline sont dans code/ et netoyage de donnée/
+DOSSIER_SCRIPT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DOSSIER_SCRIPT, "../code"))
+sys.path.insert(0, os.path.join(DOSSIER_SCRIPT, "../netoyage de donnée"))
+import normalisation_texte
+from index_familles import FAMILLES, IndexFamilles, charger_categories
+
+POLARITES = ("positif", "negatif")
+TOUTES = "Toutes familles"
+
+# Poids total de l'a priori (en nombre d'occurrences)
+ALPHA_0 = 1000.0
+
+
+def familles_par_business(chemin_business):
+    """dict business_id -> liste des familles, à partir des catégories du fichier business.
+
+    Les catégories sont nettoyées comme dans nettoyageDonnees.py avant d'être comparées
+    au fichier des catégories (mêmes familles que separationEnPlusieurFamilles.py).
+    """
+    nettoyer = normalisation_texte.fonction_profil("nettoyage")
+    index = IndexFamilles(charger_categories())
+    resultat = {}
+    with open(chemin_business, "rb") as f:
+        for ligne in f:
+            try:
+                business = json.loads(ligne)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            business_id = business.get("business_id")
+            if business_id is None:
+                continue
+            masque = index.masque_categories(nettoyer(business.get("categories") or ""))
+            resultat[business_id] = index.familles(masque)
+    return resultat
+
+
+class VocabulaireContrastif:
+
+    def __init__(self):
+        self.analyseur = CountVectorizer(stop_words="english").build_analyzer()
+        self.vocabulaire = {}
+        # Une ligne par (famille, polarité) ; la famille TOUTES regroupe tous les avis
+        self.familles = [TOUTES] + list(FAMILLES)
+        self._ligne_famille = {fam: 2 * i for i, fam in enumerate(self.familles)}
+        self.comptes = sparse.csr_matrix((2 * len(self.familles), 0), dtype=np.int64)
+        self.nb_avis = np.zeros(2 * len(self.familles), dtype=np.int64)
+
+    def ajouter_lot(self, textes, polarites, familles=None):
+        """textes, polarites : une valeur par avis ; familles : une liste de familles par avis (optionnel).
+
+        Les avis neutres (ni "positif" ni "negatif") sont ignorés.
+        """
+        vocabulaire = self.vocabulaire
+        analyseur = self.analyseur
+        lignes, colonnes = [], []
+
+        if familles is None:
+            familles = [()] * len(textes)
+
+        for texte, polarite, familles_avis in zip(textes, polarites, familles):
+            if polarite not in POLARITES or not isinstance(texte, str):
+                continue
+            decalage = POLARITES.index(polarite)
+            lignes_avis = [self._ligne_famille[TOUTES] + decalage]
+            lignes_avis += [self._ligne_famille[fam] + decalage for fam in familles_avis]
+            self.nb_avis[lignes_avis] += 1
+
+            termes = [vocabulaire.setdefault(mot, len(vocabulaire)) for mot in analyseur(texte)]
+            for ligne in lignes_avis:
+                lignes.extend([ligne] * len(termes))
+                colonnes.extend(termes)
+
+        forme = (self.comptes.shape[0], len(vocabulaire))
+        lot = sparse.csr_matrix(
+            (np.ones(len(lignes), dtype=np.int64), (lignes, colonnes)), shape=forme
+        )
+        self.comptes.resize(forme)
+        self.comptes = self.comptes + lot
+
+    # ----------------------------
+    # CLASSEMENT
+    # ----------------------------
+    def scores(self, famille=TOUTES):
+        """z-scores des log-odds positif vs négatif pour chaque mot (positif > 0, négatif < 0)."""
+        ligne = self._ligne_famille[famille]
+        positif = self.comptes[ligne].toarray().ravel().astype(np.float64)
+        negatif = self.comptes[ligne + 1].toarray().ravel().astype(np.float64)
+
+        # A priori : fréquence de chaque mot dans tout le corpus, ramenée à ALPHA_0 occurrences
+        fond = (self.comptes[0] + self.comptes[1]).toarray().ravel().astype(np.float64)
+        alpha = ALPHA_0 * fond / max(fond.sum(), 1.0)
+        alpha_0 = alpha.sum()
+        n_pos, n_neg = positif.sum(), negatif.sum()
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = (np.log(positif + alpha) - np.log(n_pos + alpha_0 - positif - alpha)
+                     - np.log(negatif + alpha) + np.log(n_neg + alpha_0 - negatif - alpha))
+            variance = 1.0 / (positif + alpha) + 1.0 / (negatif + alpha)
+            z = delta / np.sqrt(variance)
+        # Mots absents de cette famille : pas de score
+        z[(positif + negatif) == 0] = 0.0
+        return np.nan_to_num(z), positif, negatif
+
+    def termes_discriminants(self, famille=TOUTES, k=10):
+        """DataFrame des k mots les plus typiques de chaque polarité pour une famille."""
+        z, positif, negatif = self.scores(famille)
+        mots = np.empty(len(self.vocabulaire), dtype=object)
+        for mot, numero in self.vocabulaire.items():
+            mots[numero] = mot
+
+        lignes = []
+        for polarite, ordre in (("positif", np.argsort(-z)), ("negatif", np.argsort(z))):
+            for rang, i in enumerate(ordre[:k], start=1):
+                if (z[i] > 0) != (polarite == "positif"):
+                    break
+                lignes.append({
+                    "famille": famille, "polarite": polarite, "rang": rang, "terme": mots[i],
+                    "score": z[i], "nb_positif": int(positif[i]), "nb_negatif": int(negatif[i]),
+                })
+        return pd.DataFrame(lignes)
+
+    def resume(self, k=10):
+        """Termes discriminants de toutes les familles (familles sans avis ignorées)."""
+        tables = [
+            self.termes_discriminants(famille, k)
+            for famille in self.familles
+            if self.nb_avis[self._ligne_famille[famille]] and self.nb_avis[self._ligne_famille[famille] + 1]
+        ]
+        return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
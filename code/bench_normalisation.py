@@ -0,0 +1,124 @@
+# bench_normalisation.py
+# Compare le module normalisation_texte aux anciens clean_text (copiés ci-dessous à l'identique) :
+#   1. vérifie que chaque profil donne EXACTEMENT le même résultat ;
+#   2. mesure le débit (textes/s et Mo/s) ancien / nouveau (texte par texte) / nouveau (par lot).
+#
+# Les avis sont lus dans BENCH_FICHIER (ou INPUT_REVIEWS), limités à BENCH_NB_AVIS lignes.
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from dotenv import load_dotenv
+
+import normalisation_texte
+
+load_dotenv()
+
+FICHIER_BENCH = os.getenv("BENCH_FICHIER") or os.getenv("INPUT_REVIEWS")
+NB_AVIS = int(os.getenv("BENCH_NB_AVIS", "100000"))
+NB_REPETITIONS = 3
+
+
+# =========================
+# ANCIENNES FONCTIONS (référence)
+# =========================
+def ancien_nettoyage(text):
+    # nettoyageDonnees.py
+    if not text:
+        return ""
+
+    text = unicodedata.normalize("NFKD", text)
+    text = text.encode("ascii", "ignore").decode("ascii")
+    text = re.sub(r"[^a-zA-Z0-9\s.,!?']", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.lower()
+
+
+def ancien_bow(text):
+    # bow.py
+    text = text.lower()
+    text = re.sub(r"http\S+", " ", text)
+    text = re.sub(r"[^a-z\s]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def ancien_prediction(text):
+    # IA_SVM.py et ia prediction_tf-idf.py
+    text = text.lower()
+    text = re.sub(r"http\S+", "", text)
+    text = re.sub(r"[^a-zàâçéèêëîïôûùüÿñæœ\s]", "", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip()
+
+
+REFERENCES = {
+    "nettoyage": ancien_nettoyage,
+    "bow": ancien_bow,
+    "prediction": ancien_prediction,
+}
+
+
+# =========================
+# OUTILS
+# =========================
+def charger_textes():
+    if not FICHIER_BENCH or not os.path.exists(FICHIER_BENCH):
+        print("❌ Fichier d'avis introuvable : définir BENCH_FICHIER ou INPUT_REVIEWS dans le .env")
+        sys.exit(1)
+
+    textes = []
+    with open(FICHIER_BENCH, "r", encoding="utf-8") as f:
+        for line in f:
+            if len(textes) >= NB_AVIS:
+                break
+            try:
+                textes.append(json.loads(line).get("text") or "")
+            except json.JSONDecodeError:
+                continue
+
+    # Quelques cas limites en plus des vrais avis
+    textes += ["", "   ", "Café DÉJÀ vu !!", "http://exemple.com/x?y=1 TEXT", "tab\tet\x1cséparateurs ici", "İstanbul ǅ ﬁn"]
+    return textes
+
+
+def chronometrer(fonction):
+    meilleur = float("inf")
+    for _ in range(NB_REPETITIONS):
+        debut = time.perf_counter()
+        fonction()
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return meilleur
+
+
+# =========================
+# BENCHMARK
+# =========================
+if __name__ == "__main__":
+    textes = charger_textes()
+    mega_octets = sum(len(t.encode("utf-8")) for t in textes) / 1024 / 1024
+    print(f"📂 {len(textes)} textes ({mega_octets:.1f} Mo) lus dans {FICHIER_BENCH}\n")
+
+    for profil, ancienne in REFERENCES.items():
+        nouvelle = normalisation_texte.fonction_profil(profil)
+
+        # 1. Vérification : même résultat que l'ancienne fonction
+        differences = [t for t in textes if ancienne(t) != nouvelle(t)]
+        if differences:
+            print(f"❌ Profil {profil} : {len(differences)} résultats différents, ex: {differences[0][:80]!r}")
+        else:
+            print(f"✅ Profil {profil} : résultats identiques")
+
+        # 2. Débit
+        temps_ancien = chronometrer(lambda: [ancienne(t) for t in textes])
+        temps_nouveau = chronometrer(lambda: [nouvelle(t) for t in textes])
+        temps_lot = chronometrer(lambda: normalisation_texte.normaliser_lot(textes, profil))
+
+        for nom, temps in [("ancien", temps_ancien), ("nouveau", temps_nouveau), ("nouveau (lot)", temps_lot)]:
+            print(
+                f"   {nom:<14} {len(textes) / temps:>12,.0f} textes/s  {mega_octets / temps:>8.1f} Mo/s"
+                f"  (x{temps_ancien / temps:.1f})"
+            )
+        print()
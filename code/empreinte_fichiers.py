@@ -0,0 +1,66 @@
+# empreinte_fichiers.py
+# Empreinte (hash du contenu) d'un fichier ou d'un dossier, avec un cache
+# (taille, date de modification) -> hash pour ne pas relire les gros fichiers inchangés.
+import fnmatch
+import glob
+import os
+from hashlib import blake2b
+
+TAILLE_BLOC = 8 * 1024 * 1024
+
+
+def hash_fichier(chemin, cache=None):
+    """Hash blake2b du contenu d'un fichier.
+
+    cache : dict {chemin: [taille, mtime_ns, hash]} mis à jour sur place (peut être sauvegardé en JSON).
+    """
+    infos = os.stat(chemin)
+    cle = os.path.abspath(chemin)
+    if cache is not None:
+        connu = cache.get(cle)
+        if connu and connu[0] == infos.st_size and connu[1] == infos.st_mtime_ns:
+            return connu[2]
+
+    h = blake2b(digest_size=16)
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(TAILLE_BLOC), b""):
+            h.update(bloc)
+    empreinte = h.hexdigest()
+
+    if cache is not None:
+        cache[cle] = [infos.st_size, infos.st_mtime_ns, empreinte]
+    return empreinte
+
+
+def hash_chemin(chemin, cache=None, motif="*"):
+    """Hash d'un fichier, ou d'un dossier (fichiers correspondant au motif, triés par nom).
+
+    Le motif peut descendre dans les sous-dossiers (ex: "svm/*/courant").
+    Renvoie None si le chemin n'existe pas.
+    """
+    if not chemin or not os.path.exists(chemin):
+        return None
+    if os.path.isfile(chemin):
+        return hash_fichier(chemin, cache)
+
+    h = blake2b(digest_size=16)
+    if "/" in motif:
+        noms = sorted(os.path.relpath(sous_chemin, chemin).replace(os.sep, "/")
+                      for sous_chemin in glob.glob(os.path.join(chemin, motif)))
+    else:
+        noms = sorted(os.listdir(chemin))
+    for nom in noms:
+        sous_chemin = os.path.join(chemin, nom)
+        if os.path.isfile(sous_chemin) and fnmatch.fnmatch(nom, motif):
+            h.update(nom.encode("utf-8"))
+            h.update(hash_fichier(sous_chemin, cache).encode("ascii"))
+    return h.hexdigest()
+
+
+def hash_texte(*morceaux):
+    """Hash court d'une suite de valeurs (paramètres, noms de profils...)."""
+    h = blake2b(digest_size=16)
+    for morceau in morceaux:
+        h.update(repr(morceau).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
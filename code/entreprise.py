@@ -1,7 +1,13 @@
 import pandas as pd
+import io
 import os
 import sys
+import shutil
+import multiprocessing as mp
+from itertools import islice
 from dotenv import load_dotenv
+import stockage_parquet
+from etat_incremental import MODE_INCREMENTAL, EtatIncremental, lire_lignes
 
 # 1. On charge les variables du .env
 load_dotenv()
@@ -11,6 +17,29 @@ FICHIER_AVIS = os.getenv("INPUT_REVIEWS")
 FICHIER_BUSINESS = os.getenv("INPUT_BUSINESS")
 FICHIER_SORTIE = os.getenv("OUTPUT_FILE")
 
+# Mode de fusion :
+#   - "streaming" (défaut) : chaque bloc fusionné est écrit directement dans le fichier de sortie
+#   - "memoire" : ancien comportement, tous les blocs sont gardés en RAM puis écrits d'un coup
+#   - "parallele" : le fichier d'avis est découpé en tranches traitées par plusieurs processus
+MODE_FUSION = os.getenv("MODE_FUSION", "streaming").lower()
+
+# Budget mémoire (en Mo) que l'on s'autorise pour UN bloc d'avis en mode streaming.
+# La taille des blocs est recalculée à chaque bloc à partir de ce budget.
+BUDGET_MEMOIRE_MO = float(os.getenv("BUDGET_MEMOIRE_MO", "512"))
+
+# Mode "parallele" : nombre de processus (défaut = nombre de coeurs)
+NB_PROCESSUS = int(os.getenv("NB_PROCESSUS", "0")) or os.cpu_count() or 1
+# Si "1", on garde les fichiers part-XXXXX.jsonl au lieu de les recoller dans OUTPUT_FILE
+GARDER_PARTIES = os.getenv("FUSION_GARDER_PARTIES", "0") == "1"
+
+# Mode incrémental (MODE_INCREMENTAL=1) : seuls les avis ajoutés à la fin de INPUT_REVIEWS
+# depuis la dernière exécution sont fusionnés, puis ajoutés à la fin de OUTPUT_FILE
+# (position enregistrée dans <OUTPUT_FILE>.etat.json, voir code/etat_incremental.py)
+FICHIER_ETAT = f"{FICHIER_SORTIE}.etat.json"
+
+# Copie optionnelle au format Parquet (ECRIRE_PARQUET=1) dans <DOSSIER_PARQUET>/fusion
+ECRIRE_PARQUET = stockage_parquet.ECRIRE_PARQUET
+
 # --- BLOC DE SÉCURITÉ (Très important) ---
 # Si jamais le .env est mal rempli, on arrête tout de suite pour éviter des erreurs bizarres
 if not FICHIER_AVIS or not FICHIER_BUSINESS:
@@ -18,55 +47,303 @@ if not FICHIER_AVIS or not FICHIER_BUSINESS:
     print("Vérifiez que vous avez bien défini INPUT_REVIEWS et INPUT_BUSINESS.")
     sys.exit(1) # Arrête le script proprement
 
-print(f"📂 Configuration chargée :")
-print(f"   - Avis : {FICHIER_AVIS}")
-print(f"   - Business : {FICHIER_BUSINESS}")
-print("-" * 30)
-
-# --- LA SUITE DE VOTRE SCRIPT RESTE IDENTIQUE ---
-
-print("1. Chargement du dictionnaire des entreprises...")
 # On ne charge QUE les colonnes utiles pour économiser la mémoire (RAM)
 cols_a_garder = ['business_id', 'name', 'categories', 'city', 'stars']
 
-df_business = pd.read_json(FICHIER_BUSINESS, lines=True)
-# On ne garde que les colonnes choisies
-df_business = df_business[cols_a_garder]
+# Taille fixe des blocs en mode "memoire"
+chunk_size = 100000
+
+# Bornes de la taille adaptative des blocs (en nombre d'avis). Le premier bloc fait TAILLE_BLOC_MIN
+# avis : il sert de sonde pour mesurer la taille d'un avis avant de respecter le budget mémoire
+TAILLE_BLOC_MIN = 1000
+TAILLE_BLOC_MAX = 1000000
 
-# On renomme la note du business pour ne pas la confondre avec la note de l'avis
-df_business = df_business.rename(columns={'stars': 'business_rating'})
 
-print(f"   -> {len(df_business)} entreprises chargées en mémoire.")
+def lire_business(chemin):
+    df_business = pd.read_json(chemin, lines=True)
+    # On ne garde que les colonnes choisies
+    df_business = df_business[cols_a_garder]
 
-print("2. Chargement et fusion des avis (Patience...)...")
+    # On renomme la note du business pour ne pas la confondre avec la note de l'avis
+    return df_business.rename(columns={'stars': 'business_rating'})
 
-# Astuce : Si votre fichier d'avis est GIGANTESQUE (plusieurs Go),
-# on le charge par morceaux ("chunks") pour ne pas saturer l'ordi.
-chunk_size = 100000
-chunks = []
 
-# Lecture du fichier d'avis par blocs
-reader = pd.read_json(FICHIER_AVIS, lines=True, chunksize=chunk_size)
+def charger_business():
+    print("1. Chargement du dictionnaire des entreprises...")
+    df_business = lire_business(FICHIER_BUSINESS)
+    print(f"   -> {len(df_business)} entreprises chargées en mémoire.")
+    return df_business
 
-for i, chunk in enumerate(reader):
-    print(f"   Traitement du bloc n°{i+1}...")
 
+def fusionner_bloc(chunk, df_business):
     # C'est ici que la magie opère : on colle les infos business sur les avis
     chunk_merged = pd.merge(chunk, df_business, on='business_id', how='left')
 
     # On remplit les vides si une entreprise n'est pas trouvée
     chunk_merged['categories'] = chunk_merged['categories'].fillna('Inconnu')
+    return chunk_merged
+
+
+def bloc_en_jsonl(chunk_merged):
+    # to_json ne met pas toujours de retour à la ligne final : on l'ajoute
+    # pour pouvoir coller les blocs les uns derrière les autres
+    texte = chunk_merged.to_json(orient='records', lines=True)
+    if texte and not texte.endswith("\n"):
+        texte += "\n"
+    return texte
+
+
+def taille_bloc_adaptee(chunk, budget_mo=BUDGET_MEMOIRE_MO):
+    # On mesure la RAM réellement occupée par le bloc (texte compris)
+    # puis on calcule combien d'avis tiennent dans le budget
+    octets_par_avis = chunk.memory_usage(deep=True).sum() / max(len(chunk), 1)
+    # x3 : le bloc lu + le bloc fusionné + la chaîne JSON produite
+    taille = int(budget_mo * 1024 * 1024 / (3 * octets_par_avis))
+    return max(TAILLE_BLOC_MIN, min(TAILLE_BLOC_MAX, taille))
+
+
+def fusion_memoire(df_business):
+    print("2. Chargement et fusion des avis (Patience...)...")
+
+    # Astuce : Si votre fichier d'avis est GIGANTESQUE (plusieurs Go),
+    # on le charge par morceaux ("chunks") pour ne pas saturer l'ordi.
+    chunks = []
+
+    # Lecture du fichier d'avis par blocs
+    reader = pd.read_json(FICHIER_AVIS, lines=True, chunksize=chunk_size)
+
+    for i, chunk in enumerate(reader):
+        print(f"   Traitement du bloc n°{i+1}...")
+
+        # On ajoute ce bloc traité à la liste
+        chunks.append(fusionner_bloc(chunk, df_business))
+
+    # On recolle tous les morceaux
+    print("3. Finalisation...")
+    df_final = pd.concat(chunks)
+
+    print("4. Sauvegarde dans le nouveau fichier...")
+    df_final.to_json(FICHIER_SORTIE, orient='records', lines=True)
+
+    if ECRIRE_PARQUET:
+        dossier_parquet = stockage_parquet.dossier_etape("fusion")
+        stockage_parquet.preparer_dossier(dossier_parquet)
+        ecrivain = stockage_parquet.EcrivainParquet(os.path.join(dossier_parquet, "part-00000.parquet"))
+        ecrivain.ecrire_df(df_final)
+        ecrivain.fermer()
+        print(f"   Copie Parquet écrite dans {dossier_parquet}")
+
+    print(f"✅ Terminé ! Vous avez un fichier '{FICHIER_SORTIE}' avec {len(df_final)} lignes.")
+    print("Exemple d'une ligne :")
+    print(df_final[['text', 'name', 'categories']].iloc[0])
+
+
+def fusion_streaming(df_business, incremental=False):
+    print("2. Fusion des avis en streaming (écriture bloc par bloc)...")
+    print(f"   Budget mémoire par bloc : {BUDGET_MEMOIRE_MO:.0f} Mo")
+
+    taille = TAILLE_BLOC_MIN  # bloc sonde, puis taille adaptée au budget
+    nb_lignes = 0
+    exemple = None
+
+    # Partie du fichier d'avis à traiter : tout, ou seulement la fin en mode incrémental
+    etat = None
+    debut, fin_avis = 0, os.path.getsize(FICHIER_AVIS)
+    if incremental:
+        etat = EtatIncremental(FICHIER_AVIS, FICHIER_ETAT)
+        debut, fin_avis = etat.demarrer([FICHIER_SORTIE])
+        print(f"   Mode incrémental : {(fin_avis - debut) / 1024 / 1024:.1f} Mo d'avis nouveaux "
+              f"(à partir de l'octet {debut})")
+
+    ecrivain = None
+    numero_partie = etat.numero_partie(debut) if etat else 0
+    if ECRIRE_PARQUET:
+        dossier_parquet = stockage_parquet.dossier_etape("fusion")
+        if debut == 0:
+            stockage_parquet.preparer_dossier(dossier_parquet)
+        ecrivain = stockage_parquet.EcrivainParquet(os.path.join(dossier_parquet, f"part-{numero_partie:05d}.parquet"))
+
+    # On lit nous-mêmes les lignes brutes : ça permet de changer la taille
+    # des blocs en cours de route (pd.read_json garde un chunksize fixe)
+    with open(FICHIER_AVIS, "rb") as fin, \
+         open(FICHIER_SORTIE, "a" if debut else "w", encoding="utf-8") as fout:
+
+        fin.seek(debut)
+        lignes_avis = lire_lignes(fin, fin_avis)
+
+        i = 0
+        while True:
+            lignes = list(islice(lignes_avis, taille))
+            if not lignes:
+                break
+
+            chunk = pd.read_json(io.StringIO(b"".join(lignes).decode("utf-8")), lines=True)
+            del lignes
+
+            chunk_merged = fusionner_bloc(chunk, df_business)
+            fout.write(bloc_en_jsonl(chunk_merged))
+            if ecrivain is not None:
+                ecrivain.ecrire_df(chunk_merged)
+
+            nb_lignes += len(chunk_merged)
+            if exemple is None and len(chunk_merged):
+                exemple = chunk_merged[['text', 'name', 'categories']].iloc[0]
+
+            i += 1
+            nouvelle_taille = taille_bloc_adaptee(chunk)
+            print(f"   Bloc n°{i} : {len(chunk_merged)} avis écrits (prochain bloc : {nouvelle_taille} avis)")
+            taille = nouvelle_taille
+
+    if ecrivain is not None:
+        ecrivain.fermer()
+        print(f"   Copie Parquet écrite dans {stockage_parquet.dossier_etape('fusion')}")
+
+    if etat is not None:
+        # Enregistré seulement une fois tout écrit : après un plantage on reprend au même endroit
+        etat.terminer(fin_avis, [FICHIER_SORTIE], partie=numero_partie)
+        print(f"✅ Terminé ! {nb_lignes} avis ajoutés à la fin de '{FICHIER_SORTIE}'.")
+    else:
+        print(f"✅ Terminé ! Vous avez un fichier '{FICHIER_SORTIE}' avec {nb_lignes} lignes.")
+    if exemple is not None:
+        print("Exemple d'une ligne :")
+        print(exemple)
+
+
+# ----------------------------
+# MODE PARALLÈLE
+# ----------------------------
+# Table business de chaque processus (remplie par init_processus)
+_df_business_processus = None
+
+
+def init_processus(chemin_business):
+    # Chaque processus lit lui-même le fichier business : la table n'est pas copiée (pickle)
+    # depuis le processus principal vers chaque processus, ce qui coûte cher avec spawn
+    global _df_business_processus
+    _df_business_processus = lire_business(chemin_business)
+
+
+def decouper_en_tranches(chemin, nb_tranches):
+    # On coupe le fichier en tranches d'octets de taille à peu près égale,
+    # puis on décale chaque frontière jusqu'au début de la ligne suivante
+    taille_fichier = os.path.getsize(chemin)
+    frontieres = [0]
+
+    with open(chemin, "rb") as f:
+        for k in range(1, nb_tranches):
+            position = max(taille_fichier * k // nb_tranches, frontieres[-1])
+            f.seek(position)
+            if position > 0:
+                f.readline()  # on finit la ligne en cours
+            frontieres.append(min(f.tell(), taille_fichier))
+
+    frontieres.append(taille_fichier)
+    return [(debut, fin) for debut, fin in zip(frontieres, frontieres[1:]) if fin > debut]
+
+
+def fusionner_tranche(tache):
+    numero, debut, fin, chemin_partie, budget_mo = tache
+    taille = TAILLE_BLOC_MIN  # bloc sonde, puis taille adaptée au budget
+    nb_lignes = 0
+
+    ecrivain = None
+    if ECRIRE_PARQUET:
+        chemin_parquet = os.path.join(stockage_parquet.dossier_etape("fusion"), f"part-{numero:05d}.parquet")
+        ecrivain = stockage_parquet.EcrivainParquet(chemin_parquet)
+
+    with open(FICHIER_AVIS, "rb") as fin_avis, \
+         open(chemin_partie, "w", encoding="utf-8") as fout:
+
+        fin_avis.seek(debut)
+        position = debut
+
+        while position < fin:
+            lignes = []
+            while position < fin and len(lignes) < taille:
+                ligne = fin_avis.readline()
+                if not ligne:
+                    break
+                position += len(ligne)
+                lignes.append(ligne)
+            if not lignes:
+                break
+
+            chunk = pd.read_json(io.StringIO(b"".join(lignes).decode("utf-8")), lines=True)
+            del lignes
+
+            chunk_merged = fusionner_bloc(chunk, _df_business_processus)
+            fout.write(bloc_en_jsonl(chunk_merged))
+            if ecrivain is not None:
+                ecrivain.ecrire_df(chunk_merged)
+            nb_lignes += len(chunk_merged)
+
+            taille = taille_bloc_adaptee(chunk, budget_mo)
+
+    if ecrivain is not None:
+        ecrivain.fermer()
+    return numero, nb_lignes
+
+
+def fusion_parallele():
+    print(f"1. Fusion des avis en parallèle sur {NB_PROCESSUS} processus "
+          f"(chacun charge le dictionnaire des entreprises)...")
+
+    # Plus de tranches que de processus : un processus qui finit tôt en reprend une autre
+    tranches = decouper_en_tranches(FICHIER_AVIS, NB_PROCESSUS * 4)
+    dossier_parties = FICHIER_SORTIE + ".parties"
+    os.makedirs(dossier_parties, exist_ok=True)
+    if ECRIRE_PARQUET:
+        stockage_parquet.preparer_dossier(stockage_parquet.dossier_etape("fusion"))
+
+    # Chaque processus a droit à sa part du budget mémoire
+    budget_processus = BUDGET_MEMOIRE_MO / NB_PROCESSUS
+    taches = [
+        (numero, debut, fin, os.path.join(dossier_parties, f"part-{numero:05d}.jsonl"), budget_processus)
+        for numero, (debut, fin) in enumerate(tranches)
+    ]
+    print(f"   {len(taches)} tranches à traiter")
+
+    nb_lignes = 0
+    with mp.Pool(NB_PROCESSUS, initializer=init_processus, initargs=(FICHIER_BUSINESS,)) as pool:
+        for numero, n in pool.imap_unordered(fusionner_tranche, taches):
+            nb_lignes += n
+            print(f"   Tranche n°{numero + 1}/{len(taches)} terminée ({n} avis)")
+
+    if GARDER_PARTIES:
+        print(f"✅ Terminé ! {nb_lignes} lignes réparties dans les fichiers de {dossier_parties}")
+        return
+
+    # On recolle les parties DANS L'ORDRE : le fichier final est identique au mode séquentiel
+    print("2. Assemblage des parties...")
+    with open(FICHIER_SORTIE, "wb") as fout:
+        for tache in taches:
+            with open(tache[3], "rb") as fpartie:
+                shutil.copyfileobj(fpartie, fout, 16 * 1024 * 1024)
+            os.remove(tache[3])
+    os.rmdir(dossier_parties)
 
-    # On ajoute ce bloc traité à la liste (ou on pourrait écrire direct dans le fichier)
-    chunks.append(chunk_merged)
+    print(f"✅ Terminé ! Vous avez un fichier '{FICHIER_SORTIE}' avec {nb_lignes} lignes.")
 
-# On recolle tous les morceaux
-print("3. Finalisation...")
-df_final = pd.concat(chunks)
 
-print("4. Sauvegarde dans le nouveau fichier...")
-df_final.to_json(FICHIER_SORTIE, orient='records', lines=True)
+if __name__ == "__main__":
+    print(f"📂 Configuration chargée :")
+    print(f"   - Avis : {FICHIER_AVIS}")
+    print(f"   - Business : {FICHIER_BUSINESS}")
+    print(f"   - Mode de fusion : {MODE_FUSION}{' (incrémental)' if MODE_INCREMENTAL else ''}")
+    print("-" * 30)
 
-print(f"✅ Terminé ! Vous avez un fichier '{FICHIER_SORTIE}' avec {len(df_final)} lignes.")
-print("Exemple d'une ligne :")
-print(df_final[['text', 'name', 'categories']].iloc[0])
\ No newline at end of file
+    if MODE_INCREMENTAL:
+        # L'ajout en fin de fichier ne se fait qu'en streaming
+        if MODE_FUSION != "streaming":
+            print(f"⚠️  MODE_INCREMENTAL=1 : fusion en streaming au lieu de {MODE_FUSION}")
+        fusion_streaming(charger_business(), incremental=True)
+    elif MODE_FUSION == "memoire":
+        fusion_memoire(charger_business())
+    elif MODE_FUSION == "streaming":
+        fusion_streaming(charger_business())
+    elif MODE_FUSION == "parallele":
+        # Les processus chargent eux-mêmes le fichier business
+        fusion_parallele()
+    else:
+        print(f"❌ ERREUR : MODE_FUSION inconnu : {MODE_FUSION} (attendu : streaming, memoire ou parallele)")
+        sys.exit(1)
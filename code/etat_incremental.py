@@ -0,0 +1,120 @@
+# etat_incremental.py
+# Mode incrémental (MODE_INCREMENTAL=1) : on ne traite que les lignes AJOUTÉES à la fin
+# du fichier d'entrée depuis la dernière exécution, et on les ajoute aux sorties.
+#
+# Pour chaque étape, un petit fichier d'état JSON garde :
+#   - la position (en octets) jusqu'où l'entrée a été traitée ;
+#   - le hash du début de l'entrée : si le fichier a été remplacé (et pas seulement allongé),
+#     on repart de zéro ;
+#   - la taille de chaque sortie à la fin de l'exécution : si une exécution plante au milieu,
+#     la suivante coupe les sorties à cette taille avant de reprendre (pas de lignes en double).
+#
+# Les copies Parquet ne peuvent pas être complétées : chaque ajout écrit un nouveau
+# fichier part-XXXXX.parquet à côté des précédents.
+import json
+import os
+from hashlib import blake2b
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODE_INCREMENTAL = os.getenv("MODE_INCREMENTAL", "0") == "1"
+
+# Nombre d'octets du début de l'entrée utilisés pour vérifier que c'est le même fichier
+TAILLE_PREFIXE = 64 * 1024
+
+
+def fin_lignes_completes(chemin):
+    """Position juste après le dernier retour à la ligne (une ligne en cours d'écriture est ignorée)."""
+    taille = os.path.getsize(chemin)
+    with open(chemin, "rb") as f:
+        position = taille
+        while position > 0:
+            debut = max(0, position - TAILLE_PREFIXE)
+            f.seek(debut)
+            bloc = f.read(position - debut)
+            dernier = bloc.rfind(b"\n")
+            if dernier != -1:
+                return debut + dernier + 1
+            position = debut
+    return 0
+
+
+def _hash_prefixe(chemin, longueur):
+    with open(chemin, "rb") as f:
+        return blake2b(f.read(longueur), digest_size=16).hexdigest()
+
+
+class EtatIncremental:
+
+    def __init__(self, chemin_entree, chemin_etat):
+        self.chemin_entree = chemin_entree
+        self.chemin_etat = chemin_etat
+        self.donnees = {}
+        if os.path.exists(chemin_etat):
+            with open(chemin_etat, "r", encoding="utf-8") as f:
+                self.donnees = json.load(f)
+
+    def demarrer(self, sorties):
+        """Renvoie (debut, fin) : la partie de l'entrée à traiter.
+
+        sorties : chemins des fichiers de sortie de l'étape. Ils sont coupés à la taille
+        enregistrée à la fin de la dernière exécution réussie (ou vidés si on repart de zéro).
+        """
+        fin = fin_lignes_completes(self.chemin_entree)
+        debut = self.donnees.get("position", 0)
+        longueur_prefixe = self.donnees.get("longueur_prefixe", 0)
+
+        meme_fichier = (
+            debut <= fin
+            and longueur_prefixe <= os.path.getsize(self.chemin_entree)
+            and _hash_prefixe(self.chemin_entree, longueur_prefixe) == self.donnees.get("hash_prefixe")
+        )
+        if not meme_fichier:
+            if self.donnees:
+                print("⚠️  L'entrée a été remplacée depuis la dernière exécution : on repart de zéro.")
+            self.donnees = {}
+            debut = 0
+
+        tailles = self.donnees.get("tailles_sorties", {})
+        for chemin in sorties:
+            if os.path.exists(chemin):
+                taille = tailles.get(os.path.abspath(chemin), 0)
+                if os.path.getsize(chemin) != taille:
+                    with open(chemin, "r+b") as f:
+                        f.truncate(taille)
+
+        return debut, fin
+
+    def numero_partie(self, debut):
+        """Numéro du fichier Parquet de cet ajout (une reprise après plantage réécrit le même fichier)."""
+        return self.donnees.get("partie", -1) + 1 if debut else 0
+
+    def terminer(self, fin, sorties, **infos):
+        """Enregistre la position atteinte et la taille des sorties (écriture atomique)."""
+        longueur_prefixe = min(TAILLE_PREFIXE, fin)
+        self.donnees = {
+            "entree": os.path.abspath(self.chemin_entree),
+            "position": fin,
+            "longueur_prefixe": longueur_prefixe,
+            "hash_prefixe": _hash_prefixe(self.chemin_entree, longueur_prefixe),
+            "tailles_sorties": {
+                os.path.abspath(chemin): os.path.getsize(chemin) for chemin in sorties if os.path.exists(chemin)
+            },
+            **infos,
+        }
+        temporaire = self.chemin_etat + ".tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump(self.donnees, f, ensure_ascii=False, indent=2)
+        os.replace(temporaire, self.chemin_etat)
+
+
+def lire_lignes(f, fin):
+    """Lignes d'un fichier binaire déjà positionné, jusqu'à la position fin (exclue)."""
+    position = f.tell()
+    while position < fin:
+        ligne = f.readline()
+        if not ligne:
+            break
+        position += len(ligne)
+        yield ligne
@@ -1,7 +1,7 @@
 import json
-import re
 import pandas as pd
 from sklearn import svm
+from sklearn.svm import LinearSVC
 from sklearn.model_selection import train_test_split
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
@@ -9,6 +9,16 @@ from sklearn.metrics import classification_report
 import os
 from dotenv import load_dotenv
 from pathlib import Path
+import sys
+import time
+
+# Les modules partagés du pipeline sont dans le dossier code/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import stockage_parquet
+import normalisation_texte
+import ordonnanceur
+import cache_features
+import artefacts
 
 # =========================
 # CONFIG
@@ -22,34 +32,56 @@ FICHIER_SORTIE = os.getenv("OUTPUT_FILE")
 
 # 1. Définit le chemin du dossier (via variable d'env ou chemin en dur)
 dossier_data = os.getenv("OUTPUT_FILE3")
-path = Path(dossier_data)
 
-FILES = {}
+# svc         : ancien comportement, svm.SVC(kernel="linear") (solveur à noyau, temps ~ quadratique
+#               en nombre d'avis) sur 1000 avis et 1000 termes
+# lineaire    : LinearSVC (solveur primal liblinear, temps ~ linéaire) sur tous les avis de la
+#               famille et tout le vocabulaire (termes vus au moins 2 fois)
+# comparaison : lineaire, puis SVC et LinearSVC sur les mêmes TAILLE_ECHANTILLON_SVC avis
+#               d'entraînement ; durée et accuracy sur le même test dans comparaison_svm.csv
+MODE_SVM = os.getenv("MODE_SVM", "lineaire").lower()
+
+# Nombre d'avis d'entraînement donnés à SVC en mode comparaison
+TAILLE_ECHANTILLON_SVC = 1000
+
+# Nombre moyen de termes (mots + bigrammes) non nuls par avis : sert à estimer la mémoire d'une famille
+TERMES_PAR_AVIS = 200
+# Cache des noyaux de svm.SVC (paramètre cache_size, 200 Mo par défaut)
+CACHE_SVC_MO = 200
+
 
-# 2. Vérifie que le dossier existe
-if path.exists():
-    # 3. Récupère tous les fichiers .json
-    for file_path in path.glob("*.jsonl"):
-        # file_path.stem = nom du fichier sans .json (ex: "Hotels.json" -> "Hotels")
-        # str(file_path) = le chemin complet
-        FILES[file_path.stem] = str(file_path)
+def lister_sources():
+    FILES = {}
 
-print("Fichiers utilisés :", FILES)
+    if stockage_parquet.LIRE_PARQUET:
+        # Une "source" par famille : le dossier Parquet partitionné, filtré sur la famille
+        dossier_parquet = stockage_parquet.dossier_etape("familles")
+        for famille in stockage_parquet.lister_familles(dossier_parquet):
+            FILES[famille] = dossier_parquet
+
+    # 2. Vérifie que le dossier existe
+    elif Path(dossier_data).exists():
+        # 3. Récupère tous les fichiers .json
+        for file_path in Path(dossier_data).glob("*.jsonl"):
+            # file_path.stem = nom du fichier sans .json (ex: "Hotels.json" -> "Hotels")
+            # str(file_path) = le chemin complet
+            FILES[file_path.stem] = str(file_path)
+
+    print("Fichiers utilisés :", FILES)
+    return FILES
 
 
 # =========================
 # FONCTIONS UTILES
 # =========================
 
-def clean_text(text):
-    text = text.lower()
-    text = re.sub(r"http\S+", "", text)
-    text = re.sub(r"[^a-zàâçéèêëîïôûùüÿñæœ\s]", "", text)
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
+def load_dataset(path, famille=None):
+    if stockage_parquet.LIRE_PARQUET:
+        # Seules les colonnes text et stars de la famille sont lues
+        return stockage_parquet.lire_colonnes(
+            path, colonnes=["text", "stars"], filtres=[("famille", "==", famille)]
+        )
 
-
-def load_dataset(path):
     data = []
 
     # Vérification simple si le fichier existe
@@ -74,63 +106,147 @@ def load_dataset(path):
     return pd.DataFrame(data)
 
 
-# =========================
-# BOUCLE PRINCIPALE
-# =========================
+# Paramètres qui changent les features : ils font partie de la clé du cache
+# (taille_echantillon=None : tous les avis de la famille)
+PARAMETRES_FEATURES = {
+    "svc": dict(taille_echantillon=1000, max_features=1000, min_df=1),
+    "lineaire": dict(taille_echantillon=None, max_features=None, min_df=2),
+}
+PARAMETRES_DECOUPAGE = dict(test_size=0.2, random_state=42)
 
-for etablissement, filepath in FILES.items():
 
-    print(f"\n=============================")
-    print(f" MODELE POUR : {etablissement.upper()}")
-    print(f"=============================")
+def creer_vectorizer(parametres):
+    # TF-IDF (UN par type)
+    return TfidfVectorizer(
+        max_features=parametres["max_features"],
+        min_df=parametres["min_df"],
+        ngram_range=(1, 2),
+        stop_words="english"
+    )
+
 
+def calculer_features(filepath, etablissement, parametres):
     # 1. Chargement
-    df = load_dataset(filepath)
+    df = load_dataset(filepath, etablissement)
     print("Nb lignes :", len(df))
     print(df["stars"].value_counts())
 
-    # 2. Nettoyage
-    df["clean_text"] = df["text"].apply(clean_text)
+    # 2. Nettoyage : URLs et caractères hors a-z / lettres accentuées supprimés
+    # (profil "prediction" de code/normalisation_texte.py)
+    df["clean_text"] = normalisation_texte.normaliser_lot(df["text"], "prediction")
 
     # (optionnel) réduire pour aller plus vite
-    df = df.sample(1000, random_state=42)
+    if parametres["taille_echantillon"] is not None:
+        df = df.sample(min(len(df), parametres["taille_echantillon"]), random_state=42)
 
     # 3. Split
     X_train, X_test, y_train, y_test = train_test_split(
         df["clean_text"],
         df["stars"],
-        test_size=0.2,
-        random_state=42,
-        stratify=df["stars"]
+        stratify=df["stars"],
+        **PARAMETRES_DECOUPAGE
     )
 
-    # 4. TF-IDF (UN par type)
-    vectorizer = TfidfVectorizer(
-        max_features=1000,
-        ngram_range=(1, 2),
-        stop_words="english"
-    )
+    # 4. TF-IDF
+    vectorizer = creer_vectorizer(parametres)
 
     X_train_vec = vectorizer.fit_transform(X_train)
     X_test_vec = vectorizer.transform(X_test)
 
-    # 5. Modèle
-    model = svm.SVC(kernel='linear')
+    return vectorizer, {
+        "X_train": X_train_vec, "X_test": X_test_vec,
+        "y_train": y_train.to_numpy(), "y_test": y_test.to_numpy(),
+    }
+
+
+def preparer_features(filepath, etablissement, parametres):
+    """Étapes 1 à 4, lues dans code/machine_learnig/cache_features.py si déjà calculées."""
+    cle = cache_features.cle_features(
+        filepath, "prediction", creer_vectorizer(parametres),
+        famille=etablissement if stockage_parquet.LIRE_PARQUET else None,
+        taille_echantillon=parametres["taille_echantillon"], stratify=True, **PARAMETRES_DECOUPAGE
+    )
+    vectorizer, features = cache_features.obtenir(
+        cle, lambda: calculer_features(filepath, etablissement, parametres)
+    )
+    return vectorizer, features["X_train"], features["X_test"], features["y_train"], features["y_test"]
+
+
+# =========================
+# TÂCHES (une par famille, lancées par code/ordonnanceur.py)
+# =========================
 
+def parametres_features(mode):
+    return PARAMETRES_FEATURES["svc" if mode == "svc" else "lineaire"]
+
+
+def estimer_memoire_mo(nb_lignes, mode):
+    # Matrice TF-IDF creuse (float64 + indice int32 par terme non nul) + cache des noyaux de SVC
+    taille_echantillon = parametres_features(mode)["taille_echantillon"]
+    if taille_echantillon is not None:
+        nb_lignes = min(nb_lignes, taille_echantillon)
+    return CACHE_SVC_MO + ordonnanceur.estimer_memoire_mo(nb_lignes, TERMES_PAR_AVIS, octets_par_valeur=12)
+
+
+def creer_modele(mode):
+    if mode == "svc":
+        return svm.SVC(kernel='linear')
+    return LinearSVC(C=1.0)
+
+
+def mesurer(etablissement, model, X_train_vec, y_train, X_test_vec, y_test):
+    """Entraîne le modèle et renvoie (prédictions, ligne du tableau de comparaison)."""
+    debut = time.time()
     model.fit(X_train_vec, y_train)
+    duree_fit = time.time() - debut
+    y_pred = model.predict(X_test_vec)
+    return y_pred, {
+        "famille": etablissement,
+        "modele": type(model).__name__,
+        "nb_train": X_train_vec.shape[0],
+        "nb_test": X_test_vec.shape[0],
+        "nb_features": X_train_vec.shape[1],
+        "duree_fit_s": round(duree_fit, 3),
+        "accuracy": round(float((y_test == y_pred).mean()), 4),
+    }
+
+
+def comparer(etablissement, X_train_vec, X_test_vec, y_train, y_test):
+    # Mêmes avis d'entraînement pour les deux solveurs (le split est déjà mélangé), même test
+    n = min(TAILLE_ECHANTILLON_SVC, X_train_vec.shape[0])
+    lignes = []
+    for model in (svm.SVC(kernel='linear'), LinearSVC(C=1.0)):
+        _, ligne = mesurer(etablissement, model, X_train_vec[:n], y_train[:n], X_test_vec, y_test)
+        lignes.append(ligne)
+    return lignes
+
+
+def entrainer_famille(etablissement, filepath, mode):
+
+    print(f"\n=============================")
+    print(f" MODELE POUR : {etablissement.upper()}")
+    print(f"=============================")
+
+    # 1 à 4. Chargement, nettoyage, split, TF-IDF
+    vectorizer, X_train_vec, X_test_vec, y_train, y_test = preparer_features(
+        filepath, etablissement, parametres_features(mode)
+    )
+    print("Features (train) :", X_train_vec.shape)
+
+    # 5. Modèle
+    model = creer_modele(mode)
 
     # 6. Évaluation
-    y_pred = model.predict(X_test_vec)
+    y_pred, ligne = mesurer(etablissement, model, X_train_vec, y_train, X_test_vec, y_test)
 
     print("\n--- RESULTATS ---")
     print(classification_report(y_test, y_pred))
 
-    accuracy = (y_test == y_pred).mean()
-    print(f"Accuracy : {accuracy:.4f}")
+    print(f"Accuracy : {ligne['accuracy']:.4f} (entraînement : {ligne['duree_fit_s']:.1f} s)")
 
     # 7. Sauvegarde prédictions
     df_pred = pd.DataFrame({
-        "true_stars": y_test.values,
+        "true_stars": y_test,
         "predicted_stars": y_pred
     })
 
@@ -138,3 +254,51 @@ for etablissement, filepath in FILES.items():
     df_pred.to_csv(output_file, index=False)
 
     print(f"Fichier sauvegardé : {output_file}")
+
+    # Vectorizer + modèle réutilisables par prediction_lot.py (code/machine_learnig/artefacts.py)
+    artefacts.enregistrer(
+        "svm", etablissement, vectorizer, model, profil="prediction",
+        metriques={
+            **ligne,
+            "rapport": classification_report(y_test, y_pred, output_dict=True, zero_division=0),
+        },
+        parametres={"mode": mode, **parametres_features(mode)},
+    )
+
+    lignes = [ligne]
+    if mode == "comparaison":
+        lignes += comparer(etablissement, X_train_vec, X_test_vec, y_train, y_test)
+    return lignes
+
+
+# =========================
+# BOUCLE PRINCIPALE
+# =========================
+
+def main():
+    if MODE_SVM not in ("svc", "lineaire", "comparaison"):
+        raise ValueError(f"❌ MODE_SVM inconnu : {MODE_SVM} (attendu : svc, lineaire ou comparaison)")
+
+    FILES = lister_sources()
+    print("Mode SVM :", MODE_SVM)
+    taches = [
+        ordonnanceur.Tache(
+            etablissement, entrainer_famille, (etablissement, filepath, MODE_SVM),
+            estimer_memoire_mo(ordonnanceur.compter_lignes(filepath, etablissement), MODE_SVM)
+        )
+        for etablissement, filepath in FILES.items()
+    ]
+    rapports = ordonnanceur.executer_taches(taches)
+
+    if MODE_SVM == "comparaison":
+        comparaison = pd.DataFrame(
+            [ligne for rapport in rapports for ligne in rapport["resultat"] or []]
+        ).sort_values(["famille", "nb_train", "modele"])
+        comparaison.to_csv("comparaison_svm.csv", index=False)
+        print("\n--- COMPARAISON SVC / LinearSVC ---")
+        print(comparaison.to_string(index=False))
+        print("Fichier sauvegardé : comparaison_svm.csv")
+
+
+if __name__ == "__main__":
+    main()
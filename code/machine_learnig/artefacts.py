@@ -0,0 +1,171 @@
+# artefacts.py
+# Modèles entraînés sauvegardés sur disque, pour prédire de nouveaux avis sans réentraîner.
+#
+# Chaque entraînement d'une famille écrit une nouvelle version :
+#   <DOSSIER_ARTEFACTS>/<modèle>/<famille>/<version>/vectorizer.joblib
+#                                                   /modele.joblib
+#                                                   /meta.json   (profil de nettoyage, notes possibles,
+#                                                                 paramètres, métriques sur le test)
+#   <DOSSIER_ARTEFACTS>/<modèle>/<famille>/courant   (nom de la dernière version complète)
+# Les versions sont écrites dans un dossier temporaire renommé à la fin : un lecteur ne voit
+# jamais une version à moitié écrite. Les tableaux numpy des modèles (coefficients...) sont
+# relus avec joblib.load(mmap_mode="r") : plusieurs processus partagent les mêmes pages.
+import copy
+import json
+import os
+import sys
+from datetime import datetime
+
+import joblib
+import numpy as np
+from dotenv import load_dotenv
+
+# Les modules partagés du pipeline sont dans le dossier code/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import normalisation_texte
+
+load_dotenv()
+
+DOSSIER_PROJET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+DOSSIER_ARTEFACTS = os.getenv("DOSSIER_ARTEFACTS") or os.path.join(DOSSIER_PROJET, "artefacts")
+
+
+def _json(valeur):
+    # Types numpy (classes_, métriques...) -> types Python pour meta.json
+    if isinstance(valeur, dict):
+        return {str(cle): _json(v) for cle, v in valeur.items()}
+    if isinstance(valeur, (list, tuple)):
+        return [_json(v) for v in valeur]
+    if isinstance(valeur, np.ndarray):
+        return _json(valeur.tolist())
+    if isinstance(valeur, np.generic):
+        return valeur.item()
+    return valeur
+
+
+def dossier_famille(nom_modele, famille):
+    return os.path.join(DOSSIER_ARTEFACTS, nom_modele, famille)
+
+
+# ----------------------------
+# ÉCRITURE
+# ----------------------------
+def enregistrer(nom_modele, famille, vectorizer, modele, profil, metriques=None, parametres=None):
+    """Écrit une nouvelle version et en fait la version courante. Renvoie son dossier."""
+    dossier = dossier_famille(nom_modele, famille)
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    temporaire = os.path.join(dossier, f".{version}.tmp")
+    os.makedirs(temporaire)
+
+    # stop_words_ (termes écartés par max_features / min_df) ne sert pas à prédire et peut être énorme
+    if getattr(vectorizer, "stop_words_", None) is not None:
+        vectorizer = copy.copy(vectorizer)
+        del vectorizer.stop_words_
+    joblib.dump(vectorizer, os.path.join(temporaire, "vectorizer.joblib"))
+    joblib.dump(modele, os.path.join(temporaire, "modele.joblib"))
+    meta = {
+        "modele": nom_modele,
+        "famille": famille,
+        "version": version,
+        "profil": profil,
+        "version_normalisation": normalisation_texte.VERSION,
+        "type_vectorizer": type(vectorizer).__name__,
+        "type_modele": type(modele).__name__,
+        # Notes possibles, dans l'ordre des colonnes de predict_proba / decision_function
+        "classes": getattr(modele, "classes_", []),
+        "parametres": parametres or {},
+        "metriques": metriques or {},
+    }
+    with open(os.path.join(temporaire, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(_json(meta), f, ensure_ascii=False, indent=2)
+
+    os.replace(temporaire, os.path.join(dossier, version))
+
+    # Pointeur vers la dernière version (écriture atomique)
+    pointeur = os.path.join(dossier, "courant")
+    with open(f"{pointeur}.tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(f"{pointeur}.tmp", pointeur)
+
+    print(f"📦 Artefact sauvegardé : {os.path.join(dossier, version)}")
+    return os.path.join(dossier, version)
+
+
+# ----------------------------
+# LECTURE
+# ----------------------------
+def version_courante(nom_modele, famille):
+    pointeur = os.path.join(dossier_famille(nom_modele, famille), "courant")
+    if not os.path.exists(pointeur):
+        return None
+    with open(pointeur, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def lister_familles(nom_modele):
+    """Familles qui ont au moins une version du modèle."""
+    dossier = os.path.join(DOSSIER_ARTEFACTS, nom_modele)
+    if not os.path.isdir(dossier):
+        return []
+    return sorted(famille for famille in os.listdir(dossier) if version_courante(nom_modele, famille))
+
+
+class Artefact:
+    """Un modèle entraîné prêt à prédire : nettoyage + vectorizer + modèle."""
+
+    def __init__(self, dossier):
+        self.dossier = dossier
+        with open(os.path.join(dossier, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.famille = self.meta["famille"]
+        self.profil = self.meta["profil"]
+        self.classes = np.array(self.meta["classes"])
+        self.vectorizer = joblib.load(os.path.join(dossier, "vectorizer.joblib"), mmap_mode="r")
+        self.modele = joblib.load(os.path.join(dossier, "modele.joblib"), mmap_mode="r")
+
+        if self.meta["version_normalisation"] != normalisation_texte.VERSION:
+            print(f"⚠️  {dossier} : entraîné avec une autre version du nettoyage "
+                  f"({self.meta['version_normalisation']} au lieu de {normalisation_texte.VERSION})")
+
+    def nettoyer(self, textes):
+        return normalisation_texte.normaliser_lot(list(textes), self.profil)
+
+    def predire_nettoyes(self, textes_nettoyes):
+        """Notes prédites pour des textes déjà nettoyés avec self.profil (un seul transform pour le lot)."""
+        if not len(textes_nettoyes):
+            return np.empty(0, dtype=self.classes.dtype)
+        return self.modele.predict(self.vectorizer.transform(textes_nettoyes))
+
+    def predire(self, textes):
+        return self.predire_nettoyes(self.nettoyer(textes))
+
+    def probabilites_nettoyes(self, textes_nettoyes):
+        """Probabilité de chaque note (colonnes dans l'ordre de self.classes).
+
+        Pour un modèle sans predict_proba (LinearSVC), softmax des scores de decision_function
+        (un seul score par avis s'il n'y a que deux notes : celui de la seconde classe).
+        """
+        if not len(textes_nettoyes):
+            return np.empty((0, len(self.classes)))
+        X = self.vectorizer.transform(textes_nettoyes)
+        if hasattr(self.modele, "predict_proba"):
+            return self.modele.predict_proba(X)
+        scores = self.modele.decision_function(X)
+        if scores.ndim == 1:
+            scores = np.column_stack([-scores, scores])
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return scores / scores.sum(axis=1, keepdims=True)
+
+
+def charger(nom_modele, famille, version=None):
+    """Artefact d'une famille (version courante par défaut), ou None s'il n'y en a pas."""
+    version = version or version_courante(nom_modele, famille)
+    if version is None:
+        return None
+    return Artefact(os.path.join(dossier_famille(nom_modele, famille), version))
+
+
+def charger_tous(nom_modele):
+    """dict famille -> Artefact (version courante) : tous les modèles chargés une fois au démarrage."""
+    return {famille: charger(nom_modele, famille) for famille in lister_familles(nom_modele)}
+
@@ -1,13 +1,35 @@
 # bow.py
 # Vectorisation Bag-of-Words
+#
+# Deux modes (MODE_BOW) :
+#   - "complet" (défaut) : tout le fichier d'avis est lu par lots. Des processus de travail
+#     découpent les textes en mots et bigrammes et écrivent leurs comptes partiels dans des
+#     fichiers répartis par hash du mot ; chaque partition est ensuite fusionnée seule, puis
+#     min_df / max_features sont appliqués exactement comme CountVectorizer.fit.
+#   - "echantillon" : ancien comportement, seuls les MAX_SAMPLES premiers avis sont chargés
+#     en mémoire et CountVectorizer est entraîné directement dessus.
+# Dans les deux cas on écrit bow_vectorizer.pkl, word_frequencies.csv et OUTPUT_BOW.
+# Le vectorizer et les fréquences sont gardés dans le cache de cache_features.py : si le
+# fichier d'avis et les paramètres n'ont pas changé, seules les sorties sont réécrites.
 from dotenv import load_dotenv
 import os
+import sys
+import csv
 import json
-import re
+import shutil
+import zlib
+import multiprocessing as mp
+from collections import Counter
+import numpy as np
 import pandas as pd
 import joblib
 from sklearn.feature_extraction.text import CountVectorizer
 
+# Les modules partagés du pipeline sont dans le dossier code/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import normalisation_texte
+import cache_features
+
 # Chargement des variables d'environnement
 load_dotenv()
 
@@ -15,76 +37,241 @@ INPUT_REVIEWS = os.getenv("INPUT_REVIEWS")
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "bow_output")
 OUTPUT_BOW = os.getenv("OUTPUT_BOW")  # fichier texte final à créer/écraser
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-print("Fichier reviews :", INPUT_REVIEWS)
-print("Dossier de sortie :", OUTPUT_DIR)
-print("Fichier texte du BoW :", OUTPUT_BOW)
+MODE_BOW = os.getenv("MODE_BOW", "complet").lower()
 
-# Paramètre : nombre maximal d'avis à charger
+# Paramètre : nombre maximal d'avis à charger (mode "echantillon")
 MAX_SAMPLES = 250_000
 
-# Chargement des données (limité à MAX_SAMPLES)
-data = []
-with open(INPUT_REVIEWS, "r", encoding="utf-8") as f:
-    for i, line in enumerate(f):
-        if i >= MAX_SAMPLES:
-            break
-        data.append(json.loads(line))
-
-df = pd.DataFrame(data)
-print(f"{len(df)} avis chargés (lecture limitée à {MAX_SAMPLES})")
-
-# Nettoyage du texte
-def clean_text(text):
-    text = text.lower()
-    text = re.sub(r"http\S+", " ", text)        # supprimer URLs
-    text = re.sub(r"[^a-z\s]", " ", text)      # garder lettres et espaces
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-df["clean_text"] = df["text"].apply(clean_text)
-
-# Vectorisation Bag-of-Words
-vectorizer = CountVectorizer(
+# Paramètres du vectorizer (les mêmes dans les deux modes)
+PARAMETRES_VECTORIZER = dict(
     stop_words="english",   # suppression mots vides
     ngram_range=(1, 2),     # unigrammes + bigrammes
     max_features=30_000,    # contrôle taille vocabulaire
     min_df=20               # suppression mots trop rares
 )
 
-X_bow = vectorizer.fit_transform(df["clean_text"])
-print("Matrice Bag-of-Words :", X_bow.shape)
+# Mode "complet" : processus de travail, avis par lot, nombre de partitions des comptes partiels
+NB_PROCESSUS = int(os.getenv("NB_PROCESSUS", "0")) or os.cpu_count() or 1
+LIGNES_PAR_LOT = 20_000
+NB_PARTITIONS = 256
 
-# Sauvegarde du vectorizer
-joblib.dump(vectorizer, os.path.join(OUTPUT_DIR, "bow_vectorizer.pkl"))
-print("Vectorizer sauvegardé.")
 
-# Analyse exploratoire : mots les plus fréquents
-word_freq = X_bow.sum(axis=0).A1
-vocab = vectorizer.get_feature_names_out()
+def creer_vectorizer(**autres):
+    return CountVectorizer(**PARAMETRES_VECTORIZER, **autres)
 
-freq_df = pd.DataFrame({
-    "word": vocab,
-    "frequency": word_freq
-}).sort_values("frequency", ascending=False)
 
-# Sauvegarde CSV classique
-freq_df.to_csv(
-    os.path.join(OUTPUT_DIR, "word_frequencies.csv"),
-    index=False
-)
+# ----------------------------
+# MODE ÉCHANTILLON (ancien comportement)
+# ----------------------------
+def vectoriser_echantillon():
+    # Chargement des données (limité à MAX_SAMPLES)
+    data = []
+    with open(INPUT_REVIEWS, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if i >= MAX_SAMPLES:
+                break
+            data.append(json.loads(line))
+
+    df = pd.DataFrame(data)
+    print(f"{len(df)} avis chargés (lecture limitée à {MAX_SAMPLES})")
+
+    # Nettoyage du texte : URLs supprimées, on garde lettres et espaces (profil "bow")
+    df["clean_text"] = normalisation_texte.normaliser_lot(df["text"], "bow")
+
+    # Vectorisation Bag-of-Words
+    vectorizer = creer_vectorizer()
+
+    X_bow = vectorizer.fit_transform(df["clean_text"])
+    print("Matrice Bag-of-Words :", X_bow.shape)
+
+    # Analyse exploratoire : fréquence de chaque mot du vocabulaire
+    return vectorizer, X_bow.sum(axis=0).A1
+
+
+# ----------------------------
+# MODE COMPLET : COMPTES PARTIELS (processus de travail)
+# ----------------------------
+# Rempli par init_processus dans chaque processus de travail
+_analyseur = None
+_dossier_partitions = None
+
+
+def init_processus(dossier_partitions):
+    global _analyseur, _dossier_partitions
+    # Même découpage (stop words, bigrammes) que le CountVectorizer final
+    _analyseur = creer_vectorizer().build_analyzer()
+    _dossier_partitions = dossier_partitions
+
+
+def partition(terme):
+    # crc32 et pas hash() : hash() change d'un processus à l'autre
+    return zlib.crc32(terme.encode("utf-8")) % NB_PARTITIONS
+
+
+def compter_lot(lot):
+    numero, lignes = lot
+    nettoyer = normalisation_texte.fonction_profil("bow")
+    frequences = Counter()   # nombre total d'occurrences
+    documents = Counter()    # nombre d'avis contenant le terme
+    nb_avis = 0
+
+    for ligne in lignes:
+        if not ligne.strip():
+            continue
+        termes = _analyseur(nettoyer(json.loads(ligne)["text"]))
+        frequences.update(termes)
+        documents.update(set(termes))
+        nb_avis += 1
+
+    # Un fichier par (partition, lot) : aucun fichier n'est écrit par deux processus
+    par_partition = [[] for _ in range(NB_PARTITIONS)]
+    for terme, frequence in frequences.items():
+        par_partition[partition(terme)].append(f"{terme}\t{frequence}\t{documents[terme]}\n")
+    for k, contenu in enumerate(par_partition):
+        if contenu:
+            dossier = os.path.join(_dossier_partitions, f"p{k:03d}")
+            with open(os.path.join(dossier, f"lot-{numero:06d}.tsv"), "w", encoding="utf-8") as f:
+                f.writelines(contenu)
+
+    return nb_avis
+
+
+def fusionner_partition(dossier, min_df):
+    # Tous les comptes partiels d'un même terme sont dans la même partition
+    morceaux = [
+        pd.read_csv(os.path.join(dossier, nom), sep="\t", names=["terme", "frequence", "documents"],
+                    dtype={"terme": str, "frequence": np.int64, "documents": np.int64},
+                    na_filter=False, quoting=csv.QUOTE_NONE)
+        for nom in os.listdir(dossier)
+    ]
+    if not morceaux:
+        return None
+    comptes = pd.concat(morceaux).groupby("terme", sort=False).sum()
+    return comptes[comptes["documents"] >= min_df]
+
+
+def _fusionner_partition_tache(tache):
+    return fusionner_partition(*tache)
+
+
+def lire_par_lots(chemin):
+    lot = []
+    numero = 0
+    with open(chemin, "rb") as f:
+        for ligne in f:
+            lot.append(ligne)
+            if len(lot) >= LIGNES_PAR_LOT:
+                yield numero, lot
+                numero += 1
+                lot = []
+    if lot:
+        yield numero, lot
+
+
+def vectoriser_complet():
+    dossier_partitions = os.path.join(OUTPUT_DIR, "comptes_partiels")
+    shutil.rmtree(dossier_partitions, ignore_errors=True)
+    for k in range(NB_PARTITIONS):
+        os.makedirs(os.path.join(dossier_partitions, f"p{k:03d}"))
+
+    # 1. Comptes partiels, répartis par hash du terme
+    print(f"1. Comptage des termes sur {NB_PROCESSUS} processus...")
+    nb_avis = 0
+    with mp.Pool(NB_PROCESSUS, initializer=init_processus, initargs=(dossier_partitions,)) as pool:
+        for n in pool.imap_unordered(compter_lot, lire_par_lots(INPUT_REVIEWS)):
+            nb_avis += n
+            print(f"   {nb_avis} avis traités...")
+
+        # 2. Fusion partition par partition : seuls les termes gardés par min_df restent en mémoire
+        print(f"2. Fusion de {NB_PARTITIONS} partitions (min_df = {PARAMETRES_VECTORIZER['min_df']})...")
+        taches = [(os.path.join(dossier_partitions, f"p{k:03d}"), PARAMETRES_VECTORIZER["min_df"])
+                  for k in range(NB_PARTITIONS)]
+        gardes = [comptes for comptes in pool.imap(_fusionner_partition_tache, taches) if comptes is not None]
+
+    shutil.rmtree(dossier_partitions)
+    print(f"   {nb_avis} avis lus en entier")
+
+    comptes = pd.concat(gardes) if gardes else pd.DataFrame(columns=["frequence", "documents"])
+    if comptes.empty:
+        raise ValueError("❌ Aucun terme ne reste après le filtrage : baisser min_df ou augmenter max_df")
+
+    # 3. max_features : même sélection que CountVectorizer._limit_features
+    #    (termes triés par ordre alphabétique, puis les plus fréquents au total)
+    termes = sorted(comptes.index)
+    frequences = comptes["frequence"].reindex(termes).to_numpy(dtype=np.int64)
+    limite = PARAMETRES_VECTORIZER["max_features"]
+    if limite is not None and len(termes) > limite:
+        gardes = np.zeros(len(termes), dtype=bool)
+        gardes[(-frequences).argsort()[:limite]] = True
+        termes = [terme for terme, garde in zip(termes, gardes) if garde]
+        frequences = frequences[gardes]
+
+    # 4. Vectorizer identique à un fit sur tout le corpus
+    vectorizer = creer_vectorizer()
+    vectorizer.vocabulary_ = {terme: i for i, terme in enumerate(termes)}
+    vectorizer.fixed_vocabulary_ = False
+    print("Vocabulaire Bag-of-Words :", len(termes), "termes")
+
+    return vectorizer, frequences
+
+
+# ----------------------------
+# SORTIES
+# ----------------------------
+def sauvegarder(vectorizer, word_freq):
+    # Sauvegarde du vectorizer
+    joblib.dump(vectorizer, os.path.join(OUTPUT_DIR, "bow_vectorizer.pkl"))
+    print("Vectorizer sauvegardé.")
+
+    # Analyse exploratoire : mots les plus fréquents
+    vocab = vectorizer.get_feature_names_out()
+
+    freq_df = pd.DataFrame({
+        "word": vocab,
+        "frequency": word_freq
+    }).sort_values("frequency", ascending=False)
+
+    # Sauvegarde CSV classique
+    freq_df.to_csv(
+        os.path.join(OUTPUT_DIR, "word_frequencies.csv"),
+        index=False
+    )
+
+    # Export du résultat dans le fichier texte défini par OUTPUT_BOW
+    # (écrase le fichier s'il existe)
+    if OUTPUT_BOW:
+        with open(OUTPUT_BOW, "w", encoding="utf-8") as f:
+            for word, freq in zip(vocab, word_freq):
+                f.write(f"{word}: {freq}\n")
+        print(f"Résultats BoW enregistrés dans {OUTPUT_BOW}")
+    else:
+        print("Variable OUTPUT_BOW non définie — aucun fichier texte exporté.")
+
+    # Affichage des 15 mots les plus fréquents
+    print("\nTop 15 mots les plus fréquents :")
+    print(freq_df.head(15))
+
+
+if __name__ == "__main__":
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    print("Fichier reviews :", INPUT_REVIEWS)
+    print("Dossier de sortie :", OUTPUT_DIR)
+    print("Fichier texte du BoW :", OUTPUT_BOW)
+    print("Mode :", MODE_BOW)
+
+    if MODE_BOW == "complet":
+        vectoriser, parametres = vectoriser_complet, {}
+    elif MODE_BOW == "echantillon":
+        vectoriser, parametres = vectoriser_echantillon, {"max_samples": MAX_SAMPLES}
+    else:
+        raise ValueError(f"❌ MODE_BOW inconnu : {MODE_BOW} (attendu : complet ou echantillon)")
+
+    cle = cache_features.cle_features(INPUT_REVIEWS, "bow", creer_vectorizer(), mode=MODE_BOW, **parametres)
+
+    def calculer():
+        vectorizer, word_freq = vectoriser()
+        return vectorizer, {"frequences": word_freq}
 
-# Export du résultat dans le fichier texte défini par OUTPUT_BOW
-# (écrase le fichier s'il existe)
-if OUTPUT_BOW:
-    with open(OUTPUT_BOW, "w", encoding="utf-8") as f:
-        for word, freq in zip(vocab, word_freq):
-            f.write(f"{word}: {freq}\n")
-    print(f"Résultats BoW enregistrés dans {OUTPUT_BOW}")
-else:
-    print("Variable OUTPUT_BOW non définie — aucun fichier texte exporté.")
-
-# Affichage des 15 mots les plus fréquents
-print("\nTop 15 mots les plus fréquents :")
-print(freq_df.head(15))
+    vectorizer, features = cache_features.obtenir(cle, calculer)
+    sauvegarder(vectorizer, features["frequences"])
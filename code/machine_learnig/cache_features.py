@@ -0,0 +1,199 @@
+# cache_features.py
+# Cache sur disque des features (vectorizer entraîné + matrices creuses) des scripts d'IA.
+#
+# Le nettoyage, le découpage en mots et l'entraînement du vectorizer prennent l'essentiel du
+# temps des modèles linéaires. Leur résultat ne dépend que :
+#   - du contenu du fichier d'entrée (hash, voir code/empreinte_fichiers.py),
+#   - du profil de nettoyage et de sa version (code/normalisation_texte.py),
+#   - des paramètres du vectorizer,
+#   - des paramètres d'échantillonnage / de découpage train-test.
+# Ces éléments forment la clé du cache. Pour chaque clé on garde un dossier :
+#   <DOSSIER_CACHE_FEATURES>/<clé>/vectorizer.joblib
+#                                 /<nom>.data.npy, .indices.npy, .indptr.npy  (matrices CSR)
+#                                 /<nom>.npy                                  (tableaux, ex: notes)
+#                                 /meta.json
+# Les tableaux sont relus avec np.load(mmap_mode="c") : seules les pages utilisées sont lues, et
+# une modification en place par scikit-learn / scipy (tri des indices...) reste en mémoire,
+# sans toucher au fichier du cache.
+import json
+import os
+import shutil
+import sys
+import time
+
+import joblib
+import numpy as np
+from dotenv import load_dotenv
+from scipy import sparse
+
+# Les modules partagés du pipeline sont dans le dossier code/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import normalisation_texte
+from empreinte_fichiers import hash_chemin, hash_texte
+
+load_dotenv()
+
+DOSSIER_PROJET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+# CACHE_FEATURES=0 pour tout recalculer à chaque fois
+CACHE_ACTIF = os.getenv("CACHE_FEATURES", "1") == "1"
+DOSSIER_CACHE = os.getenv("DOSSIER_CACHE_FEATURES") or os.path.join(DOSSIER_PROJET, ".cache_features")
+
+# À incrémenter si le format des dossiers du cache change
+VERSION_CACHE = 2
+
+# Cache (taille, date) -> hash des fichiers d'entrée, pour ne pas relire les gros fichiers inchangés
+_FICHIER_HASHS = os.path.join(DOSSIER_CACHE, "hash_fichiers.json")
+_hashs = None
+
+
+def _cache_hashs():
+    global _hashs
+    if _hashs is None:
+        _hashs = {}
+        if os.path.exists(_FICHIER_HASHS):
+            with open(_FICHIER_HASHS, "r", encoding="utf-8") as f:
+                _hashs = json.load(f)
+    return _hashs
+
+
+def _sauvegarder_hashs():
+    os.makedirs(DOSSIER_CACHE, exist_ok=True)
+    temporaire = f"{_FICHIER_HASHS}.{os.getpid()}.tmp"
+    with open(temporaire, "w", encoding="utf-8") as f:
+        json.dump(_cache_hashs(), f)
+    os.replace(temporaire, _FICHIER_HASHS)
+
+
+# ----------------------------
+# CLÉ
+# ----------------------------
+def hash_source(source, famille=None):
+    """Hash d'un fichier JSONL, de la partition d'une famille dans un dossier Parquet,
+    ou d'un dict {famille: source} (plusieurs familles à la fois)."""
+    if isinstance(source, dict):
+        hashs = [hash_source(chemin, fam if os.path.isdir(chemin) else None) for fam, chemin in sorted(source.items())]
+        return None if None in hashs else hash_texte(*hashs)
+    if famille is not None and os.path.isdir(source):
+        return hash_chemin(os.path.join(source, f"famille={famille}"), _cache_hashs(), "*.parquet")
+    return hash_chemin(source, _cache_hashs())
+
+
+def cle_features(source, profil, vectorizer, famille=None, **parametres):
+    """Clé du cache.
+
+    source     : fichier JSONL, dossier Parquet partitionné (avec famille) ou dict {famille: source}
+    profil     : profil de normalisation_texte utilisé pour nettoyer les textes
+    vectorizer : vectorizer NON entraîné (ses paramètres font partie de la clé)
+    parametres : tout ce qui change les lignes utilisées (taille d'échantillon, test_size...)
+    """
+    contenu = hash_source(source, famille)
+    if contenu is None:
+        return None
+    _sauvegarder_hashs()
+    return hash_texte(
+        VERSION_CACHE, contenu, famille, profil, normalisation_texte.VERSION,
+        type(vectorizer).__name__, sorted(vectorizer.get_params().items()),
+        sorted(parametres.items()),
+    )
+
+
+# ----------------------------
+# LECTURE / ÉCRITURE
+# ----------------------------
+def dossier_cle(cle):
+    """Dossier d'une clé déjà en cache, ou None."""
+    if not CACHE_ACTIF or cle is None:
+        return None
+    dossier = os.path.join(DOSSIER_CACHE, cle)
+    return dossier if os.path.exists(os.path.join(dossier, "meta.json")) else None
+
+
+def charger(cle):
+    """Renvoie (vectorizer, dict des matrices / tableaux) ou None si la clé n'est pas en cache."""
+    dossier = os.path.join(DOSSIER_CACHE, cle)
+    if not os.path.exists(os.path.join(dossier, "meta.json")):
+        return None
+    return charger_dossier(dossier)
+
+
+def charger_dossier(dossier):
+    """(vectorizer, dict des matrices / tableaux) d'un dossier écrit par ecrire_dossier."""
+    with open(os.path.join(dossier, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    elements = {}
+    for nom, infos in meta["elements"].items():
+        base = os.path.join(dossier, nom)
+        if infos["type"] == "csr":
+            elements[nom] = sparse.csr_matrix(
+                (np.load(f"{base}.data.npy", mmap_mode="c"),
+                 np.load(f"{base}.indices.npy", mmap_mode="c"),
+                 np.load(f"{base}.indptr.npy", mmap_mode="c")),
+                shape=tuple(infos["forme"]), copy=False
+            )
+            # Indices triés avant l'écriture : scipy n'a pas à les retrier
+            elements[nom].has_sorted_indices = True
+        elif infos["type"] == "objets":
+            # Tableau d'objets Python (pickle) : il ne peut pas être relu en mmap
+            elements[nom] = np.load(f"{base}.npy", allow_pickle=True)
+        else:
+            elements[nom] = np.load(f"{base}.npy", mmap_mode="c")
+
+    return joblib.load(os.path.join(dossier, "vectorizer.joblib")), elements
+
+
+def ecrire_dossier(dossier, vectorizer, elements):
+    """Écrit le vectorizer et les matrices / tableaux dans un dossier (relu par charger_dossier)."""
+    os.makedirs(dossier, exist_ok=True)
+    meta = {"cree_le": time.strftime("%Y-%m-%d %H:%M:%S"), "elements": {}}
+    for nom, valeur in elements.items():
+        base = os.path.join(dossier, nom)
+        if sparse.issparse(valeur):
+            valeur = sparse.csr_matrix(valeur)
+            valeur.sort_indices()
+            np.save(f"{base}.data.npy", valeur.data)
+            np.save(f"{base}.indices.npy", valeur.indices)
+            np.save(f"{base}.indptr.npy", valeur.indptr)
+            meta["elements"][nom] = {"type": "csr", "forme": list(valeur.shape)}
+        else:
+            valeur = np.asarray(valeur)
+            np.save(f"{base}.npy", valeur, allow_pickle=valeur.dtype == object)
+            meta["elements"][nom] = {"type": "objets" if valeur.dtype == object else "tableau"}
+
+    joblib.dump(vectorizer, os.path.join(dossier, "vectorizer.joblib"))
+    with open(os.path.join(dossier, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def enregistrer(cle, vectorizer, **elements):
+    """Écrit une entrée du cache (dans un dossier temporaire renommé à la fin)."""
+    dossier = os.path.join(DOSSIER_CACHE, cle)
+    temporaire = f"{dossier}.{os.getpid()}.tmp"
+    shutil.rmtree(temporaire, ignore_errors=True)
+    ecrire_dossier(temporaire, vectorizer, elements)
+
+    # Un autre processus a pu écrire la même clé entre-temps : on garde la sienne
+    try:
+        os.replace(temporaire, dossier)
+    except OSError:
+        shutil.rmtree(temporaire, ignore_errors=True)
+
+
+def obtenir(cle, calculer):
+    """Features de la clé : lues dans le cache, ou calculées par calculer() puis enregistrées.
+
+    calculer() doit renvoyer (vectorizer, dict des matrices / tableaux).
+    """
+    if CACHE_ACTIF and cle is not None:
+        debut = time.time()
+        resultat = charger(cle)
+        if resultat is not None:
+            print(f"⚡ Features lues dans le cache en {time.time() - debut:.1f} s ({cle})")
+            return resultat
+
+    vectorizer, elements = calculer()
+    if CACHE_ACTIF and cle is not None:
+        enregistrer(cle, vectorizer, **elements)
+        print(f"💾 Features enregistrées dans le cache ({cle})")
+    return vectorizer, elements
@@ -0,0 +1,136 @@
+# charge_service.py
+# Test de charge de service_prediction.py : NB_CONNEXIONS clients envoient en parallèle des
+# avis lus dans un fichier JSONL (une connexion HTTP gardée ouverte par client), puis on
+# affiche la latence (p50 / p90 / p99) et le débit (requêtes/s, avis/s).
+#
+# Exemple :
+#   python "code/machine_learnig/charge_service.py" --avis nouveaux_avis.jsonl --connexions 32 --requetes 5000
+#   python "code/machine_learnig/charge_service.py" --avis nouveaux_avis.jsonl --avis-par-requete 50
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from prediction_lot import lire_lots
+
+load_dotenv()
+
+HOTE = os.getenv("HOTE_SERVICE", "127.0.0.1")
+PORT = int(os.getenv("PORT_SERVICE", "8765"))
+FICHIER_AVIS = os.getenv("INPUT_PREDICTION")
+
+
+def percentile(valeurs_triees, p):
+    if not valeurs_triees:
+        return 0.0
+    return valeurs_triees[min(len(valeurs_triees) - 1, int(p / 100 * len(valeurs_triees)))]
+
+
+async def envoyer(reader, writer, hote, chemin, corps=None):
+    """Une requête HTTP/1.1 sur une connexion gardée ouverte ; renvoie (statut, JSON de la réponse)."""
+    methode = "GET" if corps is None else "POST"
+    corps = corps or b""
+    writer.write(
+        f"{methode} {chemin} HTTP/1.1\r\nHost: {hote}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(corps)}\r\n\r\n".encode("ascii") + corps
+    )
+    await writer.drain()
+
+    statut = int((await reader.readline()).split()[1])
+    longueur = 0
+    while True:
+        ligne = await reader.readline()
+        if ligne in (b"\r\n", b"\n", b""):
+            break
+        nom, _, valeur = ligne.decode("latin-1").partition(":")
+        if nom.strip().lower() == "content-length":
+            longueur = int(valeur)
+    return statut, json.loads(await reader.readexactly(longueur))
+
+
+async def client(hote, port, corps_requetes, compteur, nb_requetes, latences, nb_avis, erreurs):
+    reader, writer = await asyncio.open_connection(hote, port)
+    try:
+        # Le compteur est partagé : les clients se répartissent les nb_requetes requêtes
+        for numero in compteur:
+            if numero >= nb_requetes:
+                break
+            corps, nb_avis_corps = corps_requetes[numero % len(corps_requetes)]
+            debut = time.perf_counter()
+            statut, _ = await envoyer(reader, writer, hote, "/predire", corps)
+            latences.append(time.perf_counter() - debut)
+            nb_avis.append(nb_avis_corps)
+            if statut != 200:
+                erreurs.append(statut)
+    finally:
+        writer.close()
+
+
+async def lancer(args):
+    # Corps des requêtes préparés à l'avance : on mesure le service, pas le client.
+    # Chaque corps garde son nombre d'avis (le dernier lot peut être incomplet)
+    avis = next(lire_lots(args.avis, args.max_avis), [])
+    if not avis:
+        raise ValueError(f"❌ Aucun avis lu dans {args.avis}")
+    if args.avis_par_requete == 1:
+        corps_requetes = [(json.dumps(a).encode("utf-8"), 1) for a in avis]
+    else:
+        lots = [avis[i:i + args.avis_par_requete] for i in range(0, len(avis), args.avis_par_requete)]
+        corps_requetes = [(json.dumps(lot).encode("utf-8"), len(lot)) for lot in lots]
+
+    reader, writer = await asyncio.open_connection(args.hote, args.port)
+    _, avant = await envoyer(reader, writer, args.hote, "/sante")
+
+    print(f"🔄 {args.requetes} requêtes de {args.avis_par_requete} avis, {args.connexions} connexions "
+          f"sur http://{args.hote}:{args.port}")
+    latences, nb_avis, erreurs = [], [], []
+    compteur = itertools.count()
+    debut = time.perf_counter()
+    await asyncio.gather(*(
+        client(args.hote, args.port, corps_requetes, compteur, args.requetes, latences, nb_avis, erreurs)
+        for _ in range(args.connexions)
+    ))
+    duree = time.perf_counter() - debut
+
+    _, apres = await envoyer(reader, writer, args.hote, "/sante")
+    writer.close()
+
+    latences.sort()
+    nb_lots = apres["nb_lots"] - avant["nb_lots"]
+    nb_avis_service = apres["nb_avis"] - avant["nb_avis"]
+    print("\n=============================")
+    print(" RÉSULTATS DU TEST DE CHARGE")
+    print("=============================")
+    print(f"Requêtes        : {len(latences)} en {duree:.2f} s ({len(erreurs)} erreurs)")
+    print(f"Débit           : {len(latences) / duree:.0f} requêtes/s, "
+          f"{sum(nb_avis) / duree:.0f} avis/s")
+    print(f"Latence (ms)    : p50 {1000 * percentile(latences, 50):.1f}   p90 {1000 * percentile(latences, 90):.1f}   "
+          f"p99 {1000 * percentile(latences, 99):.1f}   max {1000 * latences[-1]:.1f}")
+    if nb_lots:
+        print(f"Lots du service : {nb_lots} lots, {nb_avis_service / nb_lots:.1f} avis par lot en moyenne")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge du service de prédiction")
+    parser.add_argument("--avis", default=FICHIER_AVIS, help="fichier JSONL des avis envoyés (INPUT_PREDICTION)")
+    parser.add_argument("--hote", default=HOTE)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--connexions", type=int, default=32, help="clients en parallèle")
+    parser.add_argument("--requetes", type=int, default=5000, help="nombre total de requêtes")
+    parser.add_argument("--avis-par-requete", type=int, default=1)
+    parser.add_argument("--max-avis", type=int, default=10000, help="avis lus dans le fichier (réutilisés en boucle)")
+    args = parser.parse_args()
+
+    if not args.avis:
+        raise ValueError("❌ Indiquer le fichier d'avis (--avis ou INPUT_PREDICTION)")
+    asyncio.run(lancer(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,29 @@
-import re
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (active HalvingGridSearchCV)
+from sklearn.model_selection import train_test_split, HalvingGridSearchCV
+from sklearn.pipeline import Pipeline
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.metrics import classification_report
 from dotenv import load_dotenv
+from joblib import Memory
 from pathlib import Path
+from scipy import sparse
+import numpy as np
 import os
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+# Les modules partagés du pipeline sont dans le dossier code/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import stockage_parquet
+import normalisation_texte
+import ordonnanceur
+import cache_features
+import artefacts
 
 
 # =========================
@@ -18,87 +35,260 @@ load_dotenv()
 FICHIER_REVIEWS = os.getenv("INPUT_REVIEWS")
 FICHIER_SORTIE = os.getenv("OUTPUT_FILE_IA_PREDICTION_TF-IDF") # dossier ou serra les resultats
 
-dossier_data = os.getenv("OUTPUT_FILE3")
-path = Path(dossier_data)
-
-
-FILES = {}
+# par_famille : un TF-IDF par famille (vocabulaire propre à chaque famille)
+# partage     : les avis de toutes les familles (sans doublons) sont nettoyés et vectorisés
+#               une seule fois ; chaque famille est entraînée sur ses lignes de la matrice commune,
+#               relue sur disque en mmap par chaque processus (pages partagées, rien n'est copié)
+# streaming   : tous les avis de la famille sont lus par minilots directement dans la source,
+#               vectorisés sans état (HashingVectorizer) et appris par SGDClassifier.partial_fit,
+#               sur plusieurs époques : la mémoire ne dépend pas de la taille de la famille
+# recherche   : recherche des hyperparamètres (vectorizer + LogisticRegression) par divisions
+#               successives, classement des candidats dans recherche_<famille>.csv ; le meilleur
+#               modèle est ensuite évalué et sauvegardé comme en mode par_famille
+MODE_TFIDF = os.getenv("MODE_TFIDF", "par_famille").lower()
 
-if path.exists():
+dossier_data = os.getenv("OUTPUT_FILE3")
 
-    for file_path in path.glob("*.jsonl"):
-        
-        FILES[file_path.stem] = str(file_path)
+# Nombre moyen de termes (mots + bigrammes) non nuls par avis : sert à estimer la mémoire d'une famille
+TERMES_PAR_AVIS = 200
 
-print("Fichiers utilisés :", FILES)
 
 # =========================
 # FONCTIONS UTILES
 # =========================
 
-def clean_text(text):
-    text = text.lower()
-    text = re.sub(r"http\S+", "", text)
-    text = re.sub(r"[^a-zàâçéèêëîïôûùüÿñæœ\s]", "", text)
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
+import json
+
+def lister_sources():
+    FILES = {}
 
+    if stockage_parquet.LIRE_PARQUET:
+        # Une "source" par famille : le dossier Parquet partitionné, filtré sur la famille
+        dossier_parquet = stockage_parquet.dossier_etape("familles")
+        for famille in stockage_parquet.lister_familles(dossier_parquet):
+            FILES[famille] = dossier_parquet
 
-import json
+    elif Path(dossier_data).exists():
 
-def load_dataset(path):
-    texts, stars = [], []
+        for file_path in Path(dossier_data).glob("*.jsonl"):
+
+            FILES[file_path.stem] = str(file_path)
+
+    print("Fichiers utilisés :", FILES)
+    return FILES
+
+
+def load_dataset(path, famille=None, colonnes=("text", "stars")):
+    if stockage_parquet.LIRE_PARQUET:
+        # Seules les colonnes demandées de la famille sont lues
+        return stockage_parquet.lire_colonnes(
+            path, colonnes=list(colonnes), filtres=[("famille", "==", famille)]
+        )
+
+    valeurs = {colonne: [] for colonne in colonnes}
 
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
             obj = json.loads(line)
-            texts.append(obj["text"])
-            stars.append(obj["stars"])
+            for colonne in colonnes:
+                valeurs[colonne].append(obj[colonne])
 
-    return pd.DataFrame({"text": texts, "stars": stars})
+    return pd.DataFrame(valeurs)
 
 
 
-# =========================
-# BOUCLE PRINCIPALE
-# =========================
+# Paramètres qui changent les features : ils font partie de la clé du cache
+TAILLE_ECHANTILLON = 200000
+PARAMETRES_DECOUPAGE = dict(test_size=0.2, random_state=42)
 
-for etablissement, filepath in FILES.items():
 
-    print(f"\n=============================")
-    print(f" MODELE POUR : {etablissement.upper()}")
-    print(f"=============================")
+def creer_vectorizer():
+    # TF-IDF (UN par type)
+    return TfidfVectorizer(
+        max_features=200000,
+        ngram_range=(1, 2),
+        stop_words="english"
+    )
 
+
+def preparer_textes(filepath, etablissement):
+    """Étapes 1 à 3 : textes nettoyés et notes, découpés en train / test."""
     # 1. Chargement
-    df = load_dataset(filepath)
+    df = load_dataset(filepath, etablissement)
     print("Nb lignes :", len(df))
     print(df["stars"].value_counts())
 
-    # 2. Nettoyage
-    df["clean_text"] = df["text"].apply(clean_text)
+    # 2. Nettoyage : URLs et caractères hors a-z / lettres accentuées supprimés
+    # (profil "prediction" de code/normalisation_texte.py)
+    df["clean_text"] = normalisation_texte.normaliser_lot(df["text"], "prediction")
 
     # (optionnel) réduire pour aller plus vite
-    df = df.sample(200000, random_state=42)
+    df = df.sample(min(len(df), TAILLE_ECHANTILLON), random_state=42)
 
     # 3. Split
     X_train, X_test, y_train, y_test = train_test_split(
         df["clean_text"],
         df["stars"],
-        test_size=0.2,
-        random_state=42,
-        stratify=df["stars"]
+        stratify=df["stars"],
+        **PARAMETRES_DECOUPAGE
     )
+    return X_train, X_test, y_train, y_test
 
-    # 4. TF-IDF (UN par type)
-    vectorizer = TfidfVectorizer(
-        max_features=200000,
-        ngram_range=(1, 2),
-        stop_words="english"
-    )
+
+def calculer_features(filepath, etablissement):
+    X_train, X_test, y_train, y_test = preparer_textes(filepath, etablissement)
+
+    # 4. TF-IDF
+    vectorizer = creer_vectorizer()
 
     X_train_vec = vectorizer.fit_transform(X_train)
     X_test_vec = vectorizer.transform(X_test)
 
+    return vectorizer, {
+        "X_train": X_train_vec, "X_test": X_test_vec,
+        "y_train": y_train.to_numpy(), "y_test": y_test.to_numpy(),
+    }
+
+
+def preparer_features(filepath, etablissement):
+    """Étapes 1 à 4, lues dans code/machine_learnig/cache_features.py si déjà calculées."""
+    cle = cache_features.cle_features(
+        filepath, "prediction", creer_vectorizer(),
+        famille=etablissement if stockage_parquet.LIRE_PARQUET else None,
+        taille_echantillon=TAILLE_ECHANTILLON, stratify=True, **PARAMETRES_DECOUPAGE
+    )
+    vectorizer, features = cache_features.obtenir(
+        cle, lambda: calculer_features(filepath, etablissement)
+    )
+    return vectorizer, features["X_train"], features["X_test"], features["y_train"], features["y_test"]
+
+
+# =========================
+# MODE PARTAGÉ
+# =========================
+
+def charger_union(files):
+    """Avis de toutes les familles, sans doublons (même review_id).
+
+    Renvoie le DataFrame de l'union et un dict famille -> numéros de lignes dans l'union.
+    """
+    index = {}
+    review_ids, textes, notes = [], [], []
+    lignes_familles = {}
+    nb_lignes = 0
+
+    for famille, chemin in files.items():
+        df = load_dataset(chemin, famille, colonnes=("review_id", "text", "stars"))
+        lignes = np.empty(len(df), dtype=np.int64)
+        for i, (review_id, texte, note) in enumerate(zip(df["review_id"], df["text"], df["stars"])):
+            ligne = index.get(review_id)
+            if ligne is None:
+                ligne = index[review_id] = len(review_ids)
+                review_ids.append(review_id)
+                textes.append(texte)
+                notes.append(note)
+            lignes[i] = ligne
+        lignes_familles[famille] = np.unique(lignes)
+        nb_lignes += len(df)
+        print(f"{famille} : {len(df)} avis")
+
+    print(f"Union : {len(review_ids)} avis distincts pour {nb_lignes} lignes "
+          f"(chaque avis est dans {nb_lignes / max(len(review_ids), 1):.2f} familles en moyenne)")
+    return pd.DataFrame({"review_id": review_ids, "text": textes, "stars": notes}), lignes_familles
+
+
+def est_test(review_ids):
+    """Split déterministe par hash du review_id : un avis est dans le test de toutes ses familles ou d'aucune."""
+    seuil = PARAMETRES_DECOUPAGE["test_size"] * 2 ** 32
+    return np.fromiter(
+        (zlib.crc32(str(review_id).encode("utf-8")) < seuil for review_id in review_ids),
+        dtype=bool, count=len(review_ids)
+    )
+
+
+def calculer_features_partagees(files):
+    # 1. Chargement de l'union des familles
+    df, lignes_familles = charger_union(files)
+
+    # 2. Nettoyage (une seule fois par avis)
+    df["clean_text"] = normalisation_texte.normaliser_lot(df["text"], "prediction")
+
+    # 3. Split
+    test = est_test(df["review_id"])
+
+    # 4. TF-IDF appris sur les avis d'entraînement de l'union ; les lignes d'entraînement
+    #    sont placées avant celles de test dans la matrice commune
+    vectorizer = creer_vectorizer()
+    X = sparse.vstack([
+        vectorizer.fit_transform(df["clean_text"][~test]),
+        vectorizer.transform(df["clean_text"][test]),
+    ], format="csr")
+    ordre = np.concatenate([np.flatnonzero(~test), np.flatnonzero(test)])
+    position = np.empty(len(ordre), dtype=np.int64)
+    position[ordre] = np.arange(len(ordre))
+
+    familles = list(lignes_familles)
+    lignes = [np.sort(position[lignes_familles[famille]]) for famille in familles]
+    return vectorizer, {
+        "X": X,
+        "y": df["stars"].to_numpy()[ordre],
+        "test": test[ordre],
+        "noms_familles": np.array(familles),
+        "lignes_familles": np.concatenate(lignes) if lignes else np.empty(0, dtype=np.int64),
+        "bornes_familles": np.cumsum([0] + [len(l) for l in lignes]),
+    }
+
+
+def preparer_features_partagees(files):
+    """Matrice TF-IDF commune à toutes les familles (lue dans le cache si déjà calculée).
+
+    Renvoie (vectorizer, features, dossier, temporaire) : dossier contient la matrice sur disque,
+    relue en mmap par les processus ; temporaire indique qu'il faut le supprimer à la fin.
+    """
+    cle = cache_features.cle_features(
+        files, "prediction", creer_vectorizer(),
+        mode="partage", split="crc32_review_id", test_size=PARAMETRES_DECOUPAGE["test_size"]
+    )
+    vectorizer, features = cache_features.obtenir(cle, lambda: calculer_features_partagees(files))
+
+    dossier = cache_features.dossier_cle(cle)
+    if dossier is not None:
+        return vectorizer, features, dossier, False
+    # Cache désactivé : la matrice est quand même écrite sur disque pour être partagée
+    dossier = tempfile.mkdtemp(prefix="features_partagees_")
+    cache_features.ecrire_dossier(dossier, vectorizer, features)
+    return vectorizer, features, dossier, True
+
+
+def taille_features_mo(features):
+    """Taille sur disque (et en mémoire une fois lue) de la matrice commune et de ses tableaux."""
+    X = features["X"]
+    octets = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    octets += sum(np.asarray(valeur).nbytes for nom, valeur in features.items() if nom != "X")
+    return octets / 2 ** 20
+
+
+def features_famille(features, famille):
+    """Lignes d'une famille dans la matrice commune (échantillon de TAILLE_ECHANTILLON avis au plus)."""
+    k = list(features["noms_familles"]).index(famille)
+    debut, fin = features["bornes_familles"][k], features["bornes_familles"][k + 1]
+    lignes = np.asarray(features["lignes_familles"][debut:fin])
+
+    # (optionnel) réduire pour aller plus vite
+    if len(lignes) > TAILLE_ECHANTILLON:
+        lignes = np.sort(np.random.RandomState(42).choice(lignes, TAILLE_ECHANTILLON, replace=False))
+
+    test = np.asarray(features["test"])[lignes]
+    train, test = lignes[~test], lignes[test]
+    X, y = features["X"], features["y"]
+    return X[train], X[test], np.asarray(y[train]), np.asarray(y[test])
+
+
+# =========================
+# MODÈLE
+# =========================
+
+def entrainer_et_evaluer(etablissement, X_train_vec, X_test_vec, y_train, y_test, vectorizer):
     # 5. Modèle
     model = LogisticRegression(
         max_iter=1000,
@@ -110,16 +300,29 @@ for etablissement, filepath in FILES.items():
 
     # 6. Évaluation
     y_pred = model.predict(X_test_vec)
+    evaluer_et_sauvegarder(etablissement, y_test, y_pred, vectorizer, model, nb_train=len(y_train))
 
+
+def evaluer_et_sauvegarder(etablissement, y_test, y_pred, vectorizer, model, nb_train, parametres=None):
     print("\n--- RESULTATS ---")
     print(classification_report(y_test, y_pred))
 
     accuracy = (y_test == y_pred).mean()
     print(f"Accuracy : {accuracy:.4f}")
 
+    # Vectorizer + modèle réutilisables par prediction_lot.py (code/machine_learnig/artefacts.py)
+    artefacts.enregistrer(
+        "tfidf", etablissement, vectorizer, model, profil="prediction",
+        metriques={
+            "accuracy": accuracy, "nb_train": nb_train, "nb_test": len(y_test),
+            "rapport": classification_report(y_test, y_pred, output_dict=True, zero_division=0),
+        },
+        parametres={"mode": MODE_TFIDF, **(parametres or {})},
+    )
+
     # 7. Sauvegarde prédictions
     df_pred = pd.DataFrame({
-        "true_stars": y_test.values,
+        "true_stars": y_test,
         "predicted_stars": y_pred
     })
 
@@ -132,4 +335,322 @@ for etablissement, filepath in FILES.items():
     # sauvegarde
     df_pred.to_csv(output_file, index=False)
 
-    print(f"Fichier sauvegardé : {output_file}")
\ No newline at end of file
+    print(f"Fichier sauvegardé : {output_file}")
+
+
+# =========================
+# MODE STREAMING (partial_fit)
+# =========================
+
+# Notes possibles : partial_fit doit les connaître dès le premier minilot
+CLASSES = np.array([1, 2, 3, 4, 5])
+
+NB_EPOQUES = int(os.getenv("NB_EPOQUES", "3"))
+TAILLE_TAMPON = 50000    # avis d'entraînement mélangés ensemble avant d'être découpés en minilots
+TAILLE_MINILOT = 5000    # avis par appel à partial_fit
+
+
+def creer_hashing_vectorizer():
+    # Sans état : aucun vocabulaire à apprendre, chaque minilot est vectorisé seul
+    return HashingVectorizer(
+        n_features=2 ** 20,
+        ngram_range=(1, 2),
+        stop_words="english",
+        alternate_sign=False
+    )
+
+
+def lire_lots(filepath, famille, taille_lot=TAILLE_MINILOT):
+    """Lots (review_ids, textes, notes) lus dans la source sans charger toute la famille."""
+    if stockage_parquet.LIRE_PARQUET:
+        for df in stockage_parquet.iter_lots(
+            filepath, colonnes=["review_id", "text", "stars"], filtres=[("famille", "==", famille)], taille_lot=taille_lot
+        ):
+            yield df["review_id"].tolist(), df["text"].tolist(), df["stars"].to_numpy()
+        return
+
+    review_ids, textes, notes = [], [], []
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            review_ids.append(obj["review_id"])
+            textes.append(obj["text"])
+            notes.append(obj["stars"])
+            if len(review_ids) >= taille_lot:
+                yield review_ids, textes, np.array(notes)
+                review_ids, textes, notes = [], [], []
+    if review_ids:
+        yield review_ids, textes, np.array(notes)
+
+
+def minilots_entrainement(filepath, famille, epoque):
+    """Minilots (textes, notes) des avis d'entraînement, mélangés par tampons de TAILLE_TAMPON avis."""
+    rng = np.random.RandomState(42 + epoque)
+    tampon_textes, tampon_notes = [], []
+
+    def vider_tampon():
+        ordre = rng.permutation(len(tampon_notes))
+        notes = np.asarray(tampon_notes)
+        for debut in range(0, len(ordre), TAILLE_MINILOT):
+            choisis = ordre[debut:debut + TAILLE_MINILOT]
+            yield [tampon_textes[i] for i in choisis], notes[choisis]
+
+    for review_ids, textes, notes in lire_lots(filepath, famille):
+        train = ~est_test(review_ids)
+        tampon_textes.extend(texte for texte, garde in zip(textes, train) if garde)
+        tampon_notes.extend(notes[train])
+        if len(tampon_notes) >= TAILLE_TAMPON:
+            yield from vider_tampon()
+            tampon_textes, tampon_notes = [], []
+    if tampon_notes:
+        yield from vider_tampon()
+
+
+def entrainer_famille_streaming(etablissement, filepath):
+    afficher_entete(etablissement)
+
+    vectorizer = creer_hashing_vectorizer()
+    model = SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42)
+
+    # 5. Modèle : plusieurs passes sur les avis d'entraînement, par minilots mélangés
+    for epoque in range(NB_EPOQUES):
+        debut = time.time()
+        nb_avis = 0
+        for textes, notes in minilots_entrainement(filepath, etablissement, epoque):
+            model.partial_fit(vectorizer.transform(normalisation_texte.normaliser_lot(textes, "prediction")), notes, classes=CLASSES)
+            nb_avis += len(notes)
+        print(f"Époque {epoque + 1}/{NB_EPOQUES} : {nb_avis} avis d'entraînement en {time.time() - debut:.1f} s")
+
+    if not hasattr(model, "coef_"):
+        print(f"⚠️ Pas assez d'avis pour entraîner un modèle : {etablissement}")
+        return
+
+    # 6. Évaluation sur les avis de test (même découpage par hash du review_id que le mode partage)
+    y_test, y_pred = [], []
+    for review_ids, textes, notes in lire_lots(filepath, etablissement):
+        test = est_test(review_ids)
+        if test.any():
+            textes_test = [texte for texte, garde in zip(textes, test) if garde]
+            y_test.append(notes[test])
+            y_pred.append(model.predict(vectorizer.transform(normalisation_texte.normaliser_lot(textes_test, "prediction"))))
+
+    if not y_test:
+        print(f"⚠️ Aucun avis de test : {etablissement}")
+        return
+    evaluer_et_sauvegarder(etablissement, np.concatenate(y_test), np.concatenate(y_pred), vectorizer, model, nb_train=nb_avis)
+
+
+# =========================
+# MODE RECHERCHE (HalvingGridSearchCV)
+# =========================
+
+# Candidats : tfidf__ = paramètres du vectorizer, clf__ = paramètres de la LogisticRegression
+GRILLE_RECHERCHE = {
+    "tfidf__max_features": [50000, 200000, None],
+    "tfidf__ngram_range": [(1, 1), (1, 2)],
+    "clf__C": [0.1, 1.0, 10.0],
+    "clf__class_weight": [None, "balanced"],
+}
+PLIS_RECHERCHE = 3
+# À chaque tour, on garde 1/FACTEUR_RECHERCHE des candidats et on leur donne FACTEUR_RECHERCHE fois plus d'avis
+FACTEUR_RECHERCHE = 3
+
+
+def creer_pipeline_recherche():
+    # memory : le vectorizer entraîné sur un pli est gardé sur disque (clé = ses paramètres + les
+    # avis du pli) ; les candidats qui ne diffèrent que par C / class_weight le réutilisent au lieu
+    # de le réentraîner, y compris d'une exécution à l'autre
+    memoire = (
+        Memory(os.path.join(cache_features.DOSSIER_CACHE, "pipeline_recherche"), verbose=0)
+        if cache_features.CACHE_ACTIF else None
+    )
+    return Pipeline([
+        ("tfidf", TfidfVectorizer(stop_words="english")),
+        ("clf", LogisticRegression(max_iter=1000)),
+    ], memory=memoire)
+
+
+def classement_recherche(recherche):
+    """Un candidat par ligne et par tour, les meilleurs du dernier tour en premier."""
+    resultats = recherche.cv_results_
+    classement = pd.concat([
+        pd.DataFrame({"tour": resultats["iter"], "nb_avis": resultats["n_resources"]}),
+        # str : None (class_weight, max_features) et les tuples restent lisibles dans le CSV
+        pd.DataFrame([{nom: str(valeur) for nom, valeur in candidat.items()} for candidat in resultats["params"]]),
+        pd.DataFrame({
+            "accuracy_moyenne": resultats["mean_test_score"],
+            "accuracy_ecart_type": resultats["std_test_score"],
+            "duree_fit_s": resultats["mean_fit_time"],
+        }),
+    ], axis=1)
+    return classement.sort_values(["tour", "accuracy_moyenne"], ascending=False)
+
+
+def rechercher_famille(etablissement, filepath):
+    afficher_entete(etablissement)
+
+    # 1 à 3. Chargement, nettoyage, split : la recherche ne voit que les avis d'entraînement
+    X_train, X_test, y_train, y_test = preparer_textes(filepath, etablissement)
+
+    # 4 et 5. Candidats évalués sur une fraction croissante des avis, plis en parallèle
+    recherche = HalvingGridSearchCV(
+        creer_pipeline_recherche(), GRILLE_RECHERCHE,
+        factor=FACTEUR_RECHERCHE, cv=PLIS_RECHERCHE, scoring="accuracy",
+        n_jobs=-1, random_state=42
+    )
+    debut = time.time()
+    recherche.fit(X_train, y_train)
+    print(f"Recherche : {len(recherche.cv_results_['params'])} entraînements, {recherche.n_iterations_} tours "
+          f"en {time.time() - debut:.1f} s")
+
+    classement = classement_recherche(recherche)
+    output_dir = Path(FICHIER_SORTIE)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fichier_classement = output_dir / f"recherche_{etablissement}.csv"
+    classement.to_csv(fichier_classement, index=False)
+    print(classement.head(5).to_string(index=False))
+    print(f"Classement sauvegardé : {fichier_classement}")
+    print("Meilleurs paramètres :", recherche.best_params_)
+
+    # 6. Évaluation du meilleur candidat (réentraîné sur tous les avis d'entraînement)
+    meilleur = recherche.best_estimator_
+    y_pred = meilleur.predict(X_test)
+    evaluer_et_sauvegarder(
+        etablissement, y_test.to_numpy(), y_pred, meilleur.named_steps["tfidf"], meilleur.named_steps["clf"],
+        nb_train=len(y_train), parametres=recherche.best_params_
+    )
+
+
+def afficher_entete(etablissement):
+    print(f"\n=============================")
+    print(f" MODELE POUR : {etablissement.upper()}")
+    print(f"=============================")
+
+
+# =========================
+# TÂCHES (une par famille, lancées par code/ordonnanceur.py)
+# =========================
+
+def estimer_memoire_mo(nb_lignes):
+    # Matrice TF-IDF creuse : une valeur float64 + un indice int32 par terme non nul
+    return ordonnanceur.estimer_memoire_mo(min(nb_lignes, TAILLE_ECHANTILLON), TERMES_PAR_AVIS, octets_par_valeur=12)
+
+
+def estimer_memoire_streaming_mo():
+    # Ne dépend pas de la famille : un tampon de textes, un minilot vectorisé et les coefficients
+    coefficients_mo = len(CLASSES) * creer_hashing_vectorizer().n_features * 8 / 2 ** 20
+    return coefficients_mo + ordonnanceur.estimer_memoire_mo(TAILLE_TAMPON, TERMES_PAR_AVIS, octets_par_valeur=12, copies=1)
+
+
+def entrainer_famille(etablissement, filepath):
+    """Mode par_famille : renvoie le temps passé à préparer les features."""
+    afficher_entete(etablissement)
+
+    # 1 à 4. Chargement, nettoyage, split, TF-IDF
+    debut = time.time()
+    vectorizer, X_train_vec, X_test_vec, y_train, y_test = preparer_features(filepath, etablissement)
+    duree_features = time.time() - debut
+
+    entrainer_et_evaluer(etablissement, X_train_vec, X_test_vec, y_train, y_test, vectorizer)
+    return duree_features
+
+
+# Matrice commune du mode partage et son vectorizer, relus par init_processus dans chaque processus :
+# seul le chemin du dossier est transmis, la matrice n'est pas copiée (pickle) pour chaque tâche
+_features = None
+_vectorizer = None
+
+
+def init_processus(dossier_features):
+    global _features, _vectorizer
+    _vectorizer, _features = cache_features.charger_dossier(dossier_features)
+
+
+def entrainer_famille_partagee(etablissement):
+    afficher_entete(etablissement)
+
+    X_train_vec, X_test_vec, y_train, y_test = features_famille(_features, etablissement)
+    if len(np.unique(y_train)) < 2 or not len(y_test):
+        print(f"⚠️ Pas assez d'avis pour entraîner un modèle : {etablissement}")
+        return
+
+    entrainer_et_evaluer(etablissement, X_train_vec, X_test_vec, y_train, y_test, _vectorizer)
+
+
+# =========================
+# BOUCLE PRINCIPALE
+# =========================
+
+def main():
+    FILES = lister_sources()
+    print("Mode TF-IDF :", MODE_TFIDF)
+
+    if MODE_TFIDF == "par_famille":
+        taches = [
+            ordonnanceur.Tache(
+                etablissement, entrainer_famille, (etablissement, filepath),
+                estimer_memoire_mo(ordonnanceur.compter_lignes(filepath, etablissement))
+            )
+            for etablissement, filepath in FILES.items()
+        ]
+        rapports = ordonnanceur.executer_taches(taches)
+        duree_features = sum(rapport["resultat"] or 0.0 for rapport in rapports)
+
+    elif MODE_TFIDF == "partage":
+        # 1 à 4. Une seule matrice TF-IDF pour toutes les familles
+        debut = time.time()
+        vectorizer, features, dossier, temporaire = preparer_features_partagees(FILES)
+        duree_features = time.time() - debut
+
+        bornes = features["bornes_familles"]
+        taches = [
+            ordonnanceur.Tache(
+                str(etablissement), entrainer_famille_partagee, (str(etablissement),),
+                estimer_memoire_mo(int(bornes[k + 1] - bornes[k]))
+            )
+            for k, etablissement in enumerate(features["noms_familles"])
+        ]
+        # La matrice commune est en mémoire une seule fois (pages du mmap partagées entre processus) :
+        # on la retire du budget plutôt que de la compter dans chaque tâche
+        matrice_mo = taille_features_mo(features)
+        budget_mo = max(ordonnanceur.BUDGET_MEMOIRE_ENTRAINEMENT_MO - matrice_mo, 1.0)
+        print(f"Matrice commune : {matrice_mo:.0f} Mo partagés ({dossier})")
+        # Juste calculée, la matrice est aussi en mémoire anonyme dans ce processus : on la libère,
+        # les processus la relisent dans dossier (sinon elle compterait deux fois dans le budget)
+        del vectorizer, features
+        try:
+            ordonnanceur.executer_taches(
+                taches, budget_mo=budget_mo, initializer=init_processus, initargs=(dossier,)
+            )
+        finally:
+            if temporaire:
+                shutil.rmtree(dossier, ignore_errors=True)
+
+    elif MODE_TFIDF == "streaming":
+        # Features calculées minilot par minilot pendant l'entraînement
+        duree_features = None
+        taches = [
+            ordonnanceur.Tache(
+                etablissement, entrainer_famille_streaming, (etablissement, filepath), estimer_memoire_streaming_mo()
+            )
+            for etablissement, filepath in FILES.items()
+        ]
+        ordonnanceur.executer_taches(taches)
+
+    elif MODE_TFIDF == "recherche":
+        # Une famille à la fois : les plis et les candidats d'une famille utilisent déjà tous les cœurs
+        duree_features = None
+        for etablissement, filepath in FILES.items():
+            rechercher_famille(etablissement, filepath)
+
+    else:
+        raise ValueError(f"❌ MODE_TFIDF inconnu : {MODE_TFIDF} (attendu : par_famille, partage, streaming ou recherche)")
+
+    if duree_features is not None:
+        print(f"\nTemps total de préparation des features : {duree_features:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
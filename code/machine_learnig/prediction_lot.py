@@ -0,0 +1,191 @@
+# prediction_lot.py
+# Prédiction des notes d'un fichier JSONL de nouveaux avis avec les modèles sauvegardés
+# par ia prediction_tf-idf.py / IA_SVM.py (voir artefacts.py).
+#
+# Chaque avis est envoyé aux modèles de ses familles (familles de son business, comme dans
+# separationEnPlusieurFamilles.py) ; un avis de plusieurs familles a une prédiction par famille.
+# Le fichier est lu par lots : dans un lot, chaque texte est nettoyé une seule fois et chaque
+# famille fait un seul transform + predict pour tous ses avis. Tous les modèles sont chargés
+# une fois au démarrage.
+#
+# Exemple :
+#   python "code/machine_learnig/prediction_lot.py" --entree nouveaux_avis.jsonl --sortie predictions.csv
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+# Les modules partagés du pipeline sont dans code/ et netoyage de donnée/
+DOSSIER_SCRIPT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DOSSIER_SCRIPT, ".."))
+sys.path.insert(0, os.path.join(DOSSIER_SCRIPT, "../../netoyage de donnée"))
+import normalisation_texte
+import artefacts
+from index_familles import IndexFamilles, charger_categories, nom_famille_fichier
+
+load_dotenv()
+
+FICHIER_ENTREE = os.getenv("INPUT_PREDICTION")
+FICHIER_SORTIE = os.getenv("OUTPUT_PREDICTION")
+MODELE = os.getenv("MODELE_PREDICTION", "tfidf")
+FICHIER_BUSINESS = os.getenv("INPUT_BUSINESS")
+FICHIER_INDEX = os.getenv("INDEX_FAMILLES") or (
+    os.path.join(os.getenv("OUTPUT_FILE3"), "index_familles_business.json") if os.getenv("OUTPUT_FILE3") else None
+)
+
+TAILLE_LOT = 20000
+
+
+class RouteurFamilles:
+    """Familles (noms des fichiers / partitions, ex: "Bars_et_Vie_nocturne") d'un avis.
+
+    On utilise le champ "categories" de l'avis s'il en a un ; sinon on cherche son business dans
+    l'index sauvegardé par separationEnPlusieurFamilles.py (ignoré si le fichier business a changé
+    depuis), ou à défaut dans le fichier business.
+    """
+
+    def __init__(self, fichier_index=FICHIER_INDEX, fichier_business=FICHIER_BUSINESS):
+        self.index = IndexFamilles.charger(fichier_index, charger_categories(), fichier_business)
+        self.nettoyer = normalisation_texte.fonction_profil("nettoyage")
+        self.fichier_business = fichier_business
+        self._business_lu = False
+        self._noms_par_masque = {}
+
+    def _lire_business(self):
+        # Une seule lecture du fichier business, au premier business inconnu de l'index
+        self._business_lu = True
+        if not self.fichier_business or not os.path.exists(self.fichier_business):
+            return
+        with open(self.fichier_business, "rb") as f:
+            for ligne in f:
+                try:
+                    business = json.loads(ligne)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                if business.get("business_id") is not None and business["business_id"] not in self.index.business:
+                    self.index.masque_business(business["business_id"], self.nettoyer(business.get("categories") or ""))
+
+    def familles(self, avis):
+        business_id = avis.get("business_id")
+        if avis.get("categories"):
+            masque = self.index.masque_business(business_id, self.nettoyer(avis["categories"]))
+        else:
+            masque = self.index.business.get(business_id)
+        if masque is None and not self._business_lu:
+            self._lire_business()
+            masque = self.index.business.get(business_id)
+        if not masque:
+            return []
+
+        noms = self._noms_par_masque.get(masque)
+        if noms is None:
+            noms = self._noms_par_masque[masque] = [nom_famille_fichier(fam) for fam in self.index.familles(masque)]
+        return noms
+
+
+def lire_lots(chemin, taille_lot=TAILLE_LOT):
+    lot = []
+    with open(chemin, "rb") as f:
+        for ligne in f:
+            if not ligne.strip():
+                continue
+            try:
+                lot.append(json.loads(ligne))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if len(lot) >= taille_lot:
+                yield lot
+                lot = []
+    if lot:
+        yield lot
+
+
+def predire_lot(lot, routeur, modeles):
+    """Renvoie la liste des (avis, famille, note prédite) du lot, dans l'ordre des avis."""
+    familles_avis = [routeur.familles(avis) for avis in lot]
+
+    # Avis de chaque famille qui a un modèle
+    par_famille = defaultdict(list)
+    for i, familles in enumerate(familles_avis):
+        for famille in familles:
+            if famille in modeles:
+                par_famille[famille].append(i)
+
+    # Un nettoyage par avis et par profil, un transform + predict par famille
+    textes_nettoyes = {}
+    predictions = {}
+    for famille, indices in par_famille.items():
+        artefact = modeles[famille]
+        if artefact.profil not in textes_nettoyes:
+            a_nettoyer = sorted({i for liste in par_famille.values() for i in liste})
+            nettoyes = artefact.nettoyer(lot[i].get("text") or "" for i in a_nettoyer)
+            textes_nettoyes[artefact.profil] = dict(zip(a_nettoyer, nettoyes))
+        propres = textes_nettoyes[artefact.profil]
+        for i, note in zip(indices, artefact.predire_nettoyes([propres[i] for i in indices])):
+            predictions[i, famille] = note
+
+    resultats = []
+    for i, (avis, familles) in enumerate(zip(lot, familles_avis)):
+        if not familles:
+            resultats.append((avis, "", None))
+        for famille in familles:
+            resultats.append((avis, famille, predictions.get((i, famille))))
+    return resultats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prédiction des notes d'un fichier JSONL de nouveaux avis")
+    parser.add_argument("--entree", default=FICHIER_ENTREE, help="fichier JSONL des avis (INPUT_PREDICTION)")
+    parser.add_argument("--sortie", default=FICHIER_SORTIE, help="fichier CSV des prédictions (OUTPUT_PREDICTION)")
+    parser.add_argument("--modele", default=MODELE, help="modèle sauvegardé : tfidf ou svm (MODELE_PREDICTION)")
+    parser.add_argument("--taille-lot", type=int, default=TAILLE_LOT)
+    args = parser.parse_args()
+
+    if not args.entree or not args.sortie:
+        raise ValueError("❌ Indiquer le fichier d'avis et le fichier de sortie (--entree / --sortie ou INPUT_PREDICTION / OUTPUT_PREDICTION)")
+
+    # Chargement de tous les modèles avant de lire le premier avis
+    debut = time.time()
+    modeles = artefacts.charger_tous(args.modele)
+    if not modeles:
+        raise FileNotFoundError(f"❌ Aucun modèle '{args.modele}' dans {artefacts.DOSSIER_ARTEFACTS} : lancer d'abord l'entraînement")
+    routeur = RouteurFamilles()
+    print(f"✅ {len(modeles)} modèles '{args.modele}' chargés en {time.time() - debut:.1f} s : {', '.join(modeles)}")
+
+    nb_avis = nb_predictions = nb_sans_famille = nb_sans_modele = 0
+    debut = time.time()
+    dossier = os.path.dirname(args.sortie)
+    if dossier:
+        os.makedirs(dossier, exist_ok=True)
+
+    with open(args.sortie, "w", encoding="utf-8", newline="") as f:
+        ecrivain = csv.writer(f)
+        ecrivain.writerow(["review_id", "business_id", "famille", "predicted_stars"])
+        for lot in lire_lots(args.entree, args.taille_lot):
+            for avis, famille, note in predire_lot(lot, routeur, modeles):
+                ecrivain.writerow([avis.get("review_id"), avis.get("business_id"), famille, "" if note is None else note])
+                if note is not None:
+                    nb_predictions += 1
+                elif famille:
+                    nb_sans_modele += 1
+                else:
+                    nb_sans_famille += 1
+            nb_avis += len(lot)
+            print(f"   {nb_avis} avis traités ({nb_avis / max(time.time() - debut, 1e-9):.0f} avis/s)")
+
+    duree = time.time() - debut
+    print(f"✅ {nb_avis} avis, {nb_predictions} prédictions en {duree:.1f} s "
+          f"({nb_avis / max(duree, 1e-9):.0f} avis/s) : {args.sortie}")
+    if nb_sans_famille:
+        print(f"⚠️  {nb_sans_famille} avis sans famille connue (business absent de l'index et du fichier business)")
+    if nb_sans_modele:
+        print(f"⚠️  {nb_sans_modele} couples (avis, famille) sans modèle entraîné")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# service_prediction.py
+# Service HTTP local (bibliothèque standard, asyncio) qui note des avis avec les modèles
+# sauvegardés par ia prediction_tf-idf.py / IA_SVM.py (voir artefacts.py).
+#
+#   POST /predire   corps JSON : un avis {"review_id", "business_id", "text"[, "categories"]}
+#                   ou une liste d'avis (ou {"avis": [...]})
+#                   réponse    : [{"review_id", "business_id", "predictions": {famille: note}}, ...]
+#   GET  /sante     modèles chargés et statistiques des lots
+#
+# Regroupement dynamique : les avis de toutes les requêtes en cours sont mis dans une file.
+# Un lot part dès qu'il a TAILLE_MAX_LOT avis, ou DELAI_LOT_MS millisecondes après l'arrivée
+# de son premier avis. Le lot entier est nettoyé, vectorisé et prédit en une fois (famille par
+# famille, comme prediction_lot.py), dans un thread pour que la boucle asyncio continue de
+# recevoir les requêtes suivantes pendant ce temps.
+#
+# Optionnel : --camembert DOSSIER ajoute les prédictions des modèles Camembert de ia_ML_LLM
+# (DOSSIER/<famille>/checkpoint-N, le dernier checkpoint de chaque famille).
+#
+# Exemple :
+#   python "code/machine_learnig/service_prediction.py" --port 8765
+#   python "code/machine_learnig/charge_service.py" --avis nouveaux_avis.jsonl
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import artefacts
+from prediction_lot import RouteurFamilles, predire_lot
+
+load_dotenv()
+
+HOTE = os.getenv("HOTE_SERVICE", "127.0.0.1")
+PORT = int(os.getenv("PORT_SERVICE", "8765"))
+MODELE = os.getenv("MODELE_PREDICTION", "tfidf")
+DELAI_LOT_MS = float(os.getenv("DELAI_LOT_MS", "5"))
+TAILLE_MAX_LOT = int(os.getenv("TAILLE_MAX_LOT", "512"))
+
+# Taille maximale du corps d'une requête
+TAILLE_MAX_CORPS = 64 * 1024 * 1024
+
+
+# ----------------------------
+# CAMEMBERT (optionnel)
+# ----------------------------
+class ModelesCamembert:
+    """Derniers checkpoints Camembert de chaque famille (sous-dossiers de ia_ML_LLM)."""
+
+    def __init__(self, dossier, max_longueur=256):
+        try:
+            import torch
+            from transformers import CamembertForSequenceClassification, CamembertTokenizer
+        except ImportError:
+            raise ImportError("❌ --camembert nécessite torch et transformers : pip install torch transformers")
+
+        self.torch = torch
+        self.max_longueur = max_longueur
+        self.tokenizer = CamembertTokenizer.from_pretrained("camembert-base")
+        self.modeles = {}
+        for famille in sorted(os.listdir(dossier)):
+            checkpoints = [
+                nom for nom in os.listdir(os.path.join(dossier, famille)) if nom.startswith("checkpoint-")
+            ] if os.path.isdir(os.path.join(dossier, famille)) else []
+            if checkpoints:
+                dernier = max(checkpoints, key=lambda nom: int(nom.split("-")[1]))
+                modele = CamembertForSequenceClassification.from_pretrained(os.path.join(dossier, famille, dernier))
+                self.modeles[famille] = modele.eval()
+
+    def predire_lot(self, lot, familles_avis):
+        """dict (indice de l'avis, famille) -> note, un passage du modèle par famille."""
+        par_famille = {}
+        for i, familles in enumerate(familles_avis):
+            for famille in familles:
+                if famille in self.modeles:
+                    par_famille.setdefault(famille, []).append(i)
+
+        notes = {}
+        with self.torch.no_grad():
+            for famille, indices in par_famille.items():
+                entrees = self.tokenizer(
+                    [lot[i].get("text") or "" for i in indices],
+                    padding=True, truncation=True, max_length=self.max_longueur, return_tensors="pt"
+                )
+                # Labels 0-4 à l'entraînement -> notes 1-5
+                predictions = self.modeles[famille](**entrees).logits.argmax(dim=1).tolist()
+                for i, label in zip(indices, predictions):
+                    notes[i, famille] = label + 1
+        return notes
+
+
+# ----------------------------
+# REGROUPEMENT EN LOTS
+# ----------------------------
+class Regroupeur:
+    """File des avis à noter ; une seule tâche les regroupe en lots et les prédit."""
+
+    def __init__(self, modeles, routeur, camembert=None, delai_ms=DELAI_LOT_MS, taille_max=TAILLE_MAX_LOT):
+        self.modeles = modeles
+        self.routeur = routeur
+        self.camembert = camembert
+        self.delai = delai_ms / 1000
+        self.taille_max = taille_max
+        self.file = asyncio.Queue()
+        self.nb_lots = 0
+        self.nb_avis = 0
+        self.duree_prediction = 0.0
+
+    async def predire(self, liste_avis):
+        """Attend les prédictions d'une requête (ses avis peuvent partir dans un ou plusieurs lots)."""
+        boucle = asyncio.get_running_loop()
+        futurs = []
+        for avis in liste_avis:
+            futur = boucle.create_future()
+            self.file.put_nowait((avis, futur))
+            futurs.append(futur)
+        return await asyncio.gather(*futurs)
+
+    async def boucle_lots(self):
+        boucle = asyncio.get_running_loop()
+        while True:
+            # Le délai court à partir du premier avis du lot
+            lot = [await self.file.get()]
+            limite = boucle.time() + self.delai
+            while len(lot) < self.taille_max:
+                attente = limite - boucle.time()
+                if attente <= 0:
+                    break
+                try:
+                    lot.append(await asyncio.wait_for(self.file.get(), attente))
+                except asyncio.TimeoutError:
+                    break
+            # Tout ce qui est déjà arrivé part dans ce lot (sans attendre plus longtemps)
+            while len(lot) < self.taille_max and not self.file.empty():
+                lot.append(self.file.get_nowait())
+
+            debut = time.perf_counter()
+            try:
+                reponses = await boucle.run_in_executor(None, self._predire_lot, [avis for avis, _ in lot])
+            except Exception as erreur:
+                for _, futur in lot:
+                    if not futur.done():
+                        futur.set_exception(erreur)
+                continue
+            self.duree_prediction += time.perf_counter() - debut
+            self.nb_lots += 1
+            self.nb_avis += len(lot)
+
+            for (_, futur), reponse in zip(lot, reponses):
+                if not futur.done():
+                    futur.set_result(reponse)
+
+    def _predire_lot(self, lot):
+        # Dans un thread : nettoyage + vectorisation + prédiction du lot entier
+        reponses = [
+            {"review_id": avis.get("review_id"), "business_id": avis.get("business_id"), "predictions": {}}
+            for avis in lot
+        ]
+        position = {id(avis): i for i, avis in enumerate(lot)}
+        for avis, famille, note in predire_lot(lot, self.routeur, self.modeles):
+            if famille:
+                reponses[position[id(avis)]]["predictions"][famille] = None if note is None else note.item()
+
+        if self.camembert is not None:
+            familles_avis = [list(reponse["predictions"]) for reponse in reponses]
+            for (i, famille), note in self.camembert.predire_lot(lot, familles_avis).items():
+                reponses[i].setdefault("camembert", {})[famille] = note
+        return reponses
+
+    def statistiques(self):
+        return {
+            "nb_lots": self.nb_lots,
+            "nb_avis": self.nb_avis,
+            "taille_moyenne_lot": self.nb_avis / self.nb_lots if self.nb_lots else 0.0,
+            "duree_moyenne_lot_ms": 1000 * self.duree_prediction / self.nb_lots if self.nb_lots else 0.0,
+            "avis_en_attente": self.file.qsize(),
+        }
+
+
+# ----------------------------
+# HTTP
+# ----------------------------
+STATUTS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+async def repondre(writer, statut, donnees, garder_connexion):
+    corps = json.dumps(donnees, ensure_ascii=False).encode("utf-8")
+    entetes = (
+        f"HTTP/1.1 {statut} {STATUTS[statut]}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(corps)}\r\n"
+        f"Connection: {'keep-alive' if garder_connexion else 'close'}\r\n\r\n"
+    )
+    writer.write(entetes.encode("ascii") + corps)
+    await writer.drain()
+
+
+def creer_gestionnaire(regroupeur, modeles):
+
+    async def traiter(methode, chemin, corps):
+        if methode == "GET" and chemin == "/sante":
+            return 200, {"statut": "ok", "modele": MODELE, "familles": sorted(modeles), **regroupeur.statistiques()}
+        if methode != "POST" or chemin != "/predire":
+            return 404, {"erreur": f"route inconnue : {methode} {chemin}"}
+
+        try:
+            donnees = json.loads(corps)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return 400, {"erreur": "corps JSON invalide"}
+        if isinstance(donnees, dict) and isinstance(donnees.get("avis"), list):
+            donnees = donnees["avis"]
+        unique = isinstance(donnees, dict)
+        liste_avis = [donnees] if unique else donnees
+        if not isinstance(liste_avis, list) or not all(isinstance(avis, dict) for avis in liste_avis):
+            return 400, {"erreur": "attendu : un avis (objet JSON) ou une liste d'avis"}
+
+        reponses = await regroupeur.predire(liste_avis)
+        return 200, reponses[0] if unique else reponses
+
+    async def gerer_connexion(reader, writer):
+        try:
+            while True:
+                ligne = await reader.readline()
+                if not ligne:
+                    break
+                try:
+                    methode, chemin, _ = ligne.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    await repondre(writer, 400, {"erreur": "requête HTTP invalide"}, False)
+                    break
+
+                entetes = {}
+                while True:
+                    ligne = await reader.readline()
+                    if ligne in (b"\r\n", b"\n", b""):
+                        break
+                    nom, _, valeur = ligne.decode("latin-1").partition(":")
+                    entetes[nom.strip().lower()] = valeur.strip()
+
+                garder_connexion = entetes.get("connection", "").lower() != "close"
+                try:
+                    longueur = int(entetes.get("content-length") or 0)
+                    if longueur < 0:
+                        raise ValueError(longueur)
+                except ValueError:
+                    await repondre(writer, 400, {"erreur": "Content-Length invalide"}, False)
+                    break
+                if longueur > TAILLE_MAX_CORPS:
+                    await repondre(writer, 413, {"erreur": "corps trop grand"}, False)
+                    break
+                corps = await reader.readexactly(longueur) if longueur else b""
+
+                try:
+                    statut, donnees = await traiter(methode, chemin.split("?", 1)[0], corps)
+                except Exception as erreur:
+                    statut, donnees = 500, {"erreur": repr(erreur)}
+                await repondre(writer, statut, donnees, garder_connexion)
+                if not garder_connexion:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return gerer_connexion
+
+
+async def servir(hote, port, regroupeur, modeles):
+    tache_lots = asyncio.create_task(regroupeur.boucle_lots())
+    serveur = await asyncio.start_server(creer_gestionnaire(regroupeur, modeles), hote, port, backlog=1024)
+    print(f"✅ Service de prédiction sur http://{hote}:{port} (lots de {regroupeur.taille_max} avis max, "
+          f"délai {regroupeur.delai * 1000:.1f} ms)")
+    async with serveur:
+        try:
+            await serveur.serve_forever()
+        finally:
+            tache_lots.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service HTTP de prédiction des notes d'avis")
+    parser.add_argument("--hote", default=HOTE)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--modele", default=MODELE, help="modèle sauvegardé : tfidf ou svm (MODELE_PREDICTION)")
+    parser.add_argument("--delai-ms", type=float, default=DELAI_LOT_MS, help="attente maximale d'un lot (DELAI_LOT_MS)")
+    parser.add_argument("--taille-max-lot", type=int, default=TAILLE_MAX_LOT, help="avis par lot au maximum (TAILLE_MAX_LOT)")
+    parser.add_argument("--camembert", default=os.getenv("DOSSIER_CAMEMBERT"),
+                        help="dossier des checkpoints Camembert par famille (optionnel, DOSSIER_CAMEMBERT)")
+    args = parser.parse_args()
+
+    # Tous les modèles sont chargés avant d'accepter la première requête
+    debut = time.time()
+    modeles = artefacts.charger_tous(args.modele)
+    if not modeles:
+        raise FileNotFoundError(f"❌ Aucun modèle '{args.modele}' dans {artefacts.DOSSIER_ARTEFACTS} : lancer d'abord l'entraînement")
+    routeur = RouteurFamilles()
+    camembert = ModelesCamembert(args.camembert) if args.camembert else None
+    print(f"✅ {len(modeles)} modèles '{args.modele}' chargés en {time.time() - debut:.1f} s"
+          + (f", {len(camembert.modeles)} modèles Camembert" if camembert else ""))
+
+    regroupeur = Regroupeur(modeles, routeur, camembert, args.delai_ms, args.taille_max_lot)
+    try:
+        asyncio.run(servir(args.hote, args.port, regroupeur, modeles))
+    except KeyboardInterrupt:
+        print("\nArrêt du service.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# cache_llm.py
+# Cache sur disque (SQLite) des réponses de LLaMA pour l'analyse des aspects (llama.py).
+#
+# Une réponse ne dépend que du texte de l'avis, du prompt système et du modèle : ces trois
+# éléments forment la clé (hash). Un avis déjà vu (même texte, aux espaces près, profil "llm"
+# de code/normalisation_texte.py) est servi sans appeler le modèle, et après une modification
+# du prompt seuls les couples (texte, prompt) nouveaux sont recalculés.
+# On garde le JSON renvoyé par le LLM, ou sa réponse brute si ce n'était pas du JSON valide.
+#
+# Dans le mode lot (asynchrone), deux avis identiques envoyés en même temps ne font qu'un appel :
+# le second attend la réponse du premier.
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from dotenv import load_dotenv
+
+# Les modules partagés du pipeline sont dans le dossier code/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import normalisation_texte
+from empreinte_fichiers import hash_texte
+
+load_dotenv()
+
+DOSSIER_PROJET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+
+# CACHE_LLM=0 pour toujours appeler le modèle
+CACHE_ACTIF = os.getenv("CACHE_LLM", "1") == "1"
+FICHIER_CACHE = os.getenv("FICHIER_CACHE_LLM") or os.path.join(DOSSIER_PROJET, ".cache_llm", "reponses.sqlite")
+
+# À incrémenter si le format des réponses gardées change
+VERSION_CACHE = 1
+
+
+class CacheLLM:
+
+    def __init__(self, chemin=FICHIER_CACHE):
+        dossier = os.path.dirname(chemin)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        self.chemin = chemin
+        self.connexion = sqlite3.connect(chemin)
+        # WAL : plusieurs exécutions peuvent lire / écrire le même cache
+        self.connexion.execute("PRAGMA journal_mode=WAL")
+        self.connexion.execute("PRAGMA synchronous=NORMAL")
+        self.connexion.execute("""
+            CREATE TABLE IF NOT EXISTS reponses (
+                cle TEXT PRIMARY KEY,
+                modele TEXT NOT NULL,
+                aspects TEXT,
+                brut TEXT,
+                tokens_prompt INTEGER NOT NULL DEFAULT 0,
+                tokens_generes INTEGER NOT NULL DEFAULT 0,
+                date REAL NOT NULL
+            )
+        """)
+        self.connexion.commit()
+        self._en_cours = {}
+        self.stats = dict.fromkeys(["nb_lus", "nb_en_cours", "nb_calcules", "tokens_evites"], 0)
+
+    def cle(self, texte, prompt, modele):
+        return hash_texte(
+            VERSION_CACHE, normalisation_texte.VERSION, normalisation_texte.normaliser(texte, "llm"), prompt, modele
+        )
+
+    def lire(self, cle):
+        """Réponse gardée : dict {"aspects" ou "brut", "tokens_prompt", "tokens_generes"}, ou None."""
+        ligne = self.connexion.execute(
+            "SELECT aspects, brut, tokens_prompt, tokens_generes FROM reponses WHERE cle = ?", (cle,)
+        ).fetchone()
+        if ligne is None:
+            return None
+        aspects, brut, tokens_prompt, tokens_generes = ligne
+        resultat = {"aspects": json.loads(aspects)} if aspects is not None else {"brut": brut}
+        resultat.update(tokens_prompt=tokens_prompt, tokens_generes=tokens_generes)
+        return resultat
+
+    def ecrire(self, cle, modele, resultat):
+        aspects = json.dumps(resultat["aspects"], ensure_ascii=False) if "aspects" in resultat else None
+        self.connexion.execute(
+            "INSERT OR REPLACE INTO reponses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (cle, modele, aspects, resultat.get("brut"),
+             resultat.get("tokens_prompt", 0), resultat.get("tokens_generes", 0), time.time()),
+        )
+        self.connexion.commit()
+
+    def obtenir_sync(self, texte, prompt, modele, calculer):
+        """Réponse du cache, ou calculer() (appel du modèle) gardé dans le cache."""
+        cle = self.cle(texte, prompt, modele)
+        resultat = self.lire(cle)
+        if resultat is not None:
+            self._compter_lu(resultat, "nb_lus")
+            return resultat
+        resultat = calculer()
+        self.stats["nb_calcules"] += 1
+        self._ecrire_sans_erreur(cle, modele, resultat)
+        return resultat
+
+    async def obtenir(self, texte, prompt, modele, calculer):
+        """Version asynchrone : les demandes identiques en cours attendent le même appel."""
+        cle = self.cle(texte, prompt, modele)
+        resultat = self.lire(cle)
+        if resultat is not None:
+            self._compter_lu(resultat, "nb_lus")
+            return resultat
+
+        futur = self._en_cours.get(cle)
+        if futur is not None:
+            resultat = await asyncio.shield(futur)
+            self._compter_lu(resultat, "nb_en_cours")
+            return resultat
+
+        futur = self._en_cours[cle] = asyncio.get_running_loop().create_future()
+        try:
+            resultat = await calculer()
+        except BaseException as erreur:
+            # Les demandes en attente échouent aussi (elles seront retentées à la prochaine exécution).
+            # Annulation (Ctrl+C...) : elles reçoivent une erreur ordinaire plutôt qu'un CancelledError
+            if isinstance(erreur, Exception):
+                futur.set_exception(erreur)
+            else:
+                futur.set_exception(RuntimeError(f"appel au LLM interrompu : {erreur!r}"))
+            futur.exception()  # évite l'avertissement "exception never retrieved" s'il n'y a pas d'attente
+            raise
+        finally:
+            del self._en_cours[cle]
+
+        # Les demandes en attente reçoivent la réponse avant l'écriture : un échec de SQLite
+        # ("database is locked"...) ne doit ni les bloquer ni faire perdre la réponse
+        futur.set_result(resultat)
+        self.stats["nb_calcules"] += 1
+        self._ecrire_sans_erreur(cle, modele, resultat)
+        return resultat
+
+    def _ecrire_sans_erreur(self, cle, modele, resultat):
+        # La réponse est déjà calculée : un échec d'écriture ne fait que la perdre pour les exécutions suivantes
+        try:
+            self.ecrire(cle, modele, resultat)
+        except sqlite3.Error as erreur:
+            print(f"⚠️  Réponse non gardée dans le cache LLM ({erreur})")
+
+    def _compter_lu(self, resultat, compteur):
+        self.stats[compteur] += 1
+        self.stats["tokens_evites"] += resultat.get("tokens_prompt", 0) + resultat.get("tokens_generes", 0)
+
+    def taux_succes(self):
+        nb_servis = self.stats["nb_lus"] + self.stats["nb_en_cours"]
+        total = nb_servis + self.stats["nb_calcules"]
+        return nb_servis / total if total else 0.0
+
+    def afficher_bilan(self):
+        total = self.stats["nb_lus"] + self.stats["nb_en_cours"] + self.stats["nb_calcules"]
+        print(f"Cache LLM           : {100 * self.taux_succes():.1f} % de {total} demandes servies sans appel "
+              f"({self.stats['nb_lus']} lues, {self.stats['nb_en_cours']} doublons en cours), "
+              f"{self.stats['tokens_evites']} tokens évités : {self.chemin}")
+
+    def fermer(self):
+        self.connexion.close()
+
+
+_cache = None
+
+
+def cache_defaut():
+    """Cache partagé du processus (FICHIER_CACHE_LLM), ou None si CACHE_LLM=0."""
+    global _cache
+    if not CACHE_ACTIF:
+        return None
+    if _cache is None:
+        _cache = CacheLLM()
+    return _cache
@@ -0,0 +1,272 @@
+# cascade.py
+# Cascade : le modèle linéaire d'abord, LLaMA 3 seulement pour les avis dont il n'est pas sûr.
+#
+# 1. Tous les avis d'une famille sont notés par le modèle TF-IDF + LogisticRegression sauvegardé
+#    par ia prediction_tf-idf.py (code/machine_learnig/artefacts.py) : quelques millisecondes
+#    pour des milliers d'avis.
+# 2. Confiance de chaque prédiction, d'après les probabilités des 5 notes :
+#      marge    : probabilité de la note la plus probable - celle de la deuxième
+#      entropie : 1 - entropie des probabilités / log(5)  (1 = une seule note possible)
+#    Les avis dont la confiance est sous SEUIL_CASCADE sont envoyés à llama.py (mode lot :
+#    requêtes en parallèle, reprise, cache des réponses).
+# 3. Polarité finale (positif / mitigé / négatif) : celle de la note prédite pour les avis sûrs,
+#    celle des aspects extraits par LLaMA pour les autres (qui ont aussi leurs aspects).
+#
+# Les avis sont lus par lots (prediction_lot.lire_lots) : une famille entière (millions d'avis)
+# ne tient jamais en mémoire, seuls quelques tableaux numpy par avis (confiance, note prédite,
+# polarités codées) sont gardés pour le bilan. Le fichier est lu deux fois : notation et avis
+# envoyés au LLM, puis, une fois les aspects connus, écriture des résultats.
+#
+# Le bilan compare, avec les vraies notes (1-2 négatif, 3 mitigé, 4-5 positif), la polarité du
+# modèle linéaire seul et celle de la cascade, et donne la part des avis envoyés au LLM. Un
+# balayage des seuils montre ce compromis précision / nombre d'appels sans rappeler le LLM.
+#
+# Exemple :
+#   python "code/modele_pre_enrtainer/cascade.py" --entree familles/Restauration.jsonl --sortie cascade/ --seuil 0.3
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Modèles sauvegardés : code/machine_learnig/artefacts.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../machine_learnig"))
+import artefacts
+import llama
+import prediction_lot
+
+load_dotenv()
+
+FICHIER_AVIS = os.getenv("INPUT_CASCADE")
+DOSSIER_SORTIE = os.getenv("OUTPUT_CASCADE")
+MODELE = os.getenv("MODELE_PREDICTION", "tfidf")
+CRITERE = os.getenv("CRITERE_CASCADE", "marge").lower()
+SEUIL = float(os.getenv("SEUIL_CASCADE", "0.3"))
+
+SEUILS_BALAYAGE = [0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0]
+
+# Polarités codées en int8 dans les tableaux du bilan (-1 : inconnue)
+POLARITES = ["négatif", "mitigé", "positif"]
+_CODE_POLARITE = {polarite: code for code, polarite in enumerate(POLARITES)}
+
+
+def code_polarite(polarite):
+    return -1 if polarite is None else _CODE_POLARITE[polarite]
+
+
+def nom_polarite(code):
+    return POLARITES[code] if code >= 0 else None
+
+
+def lire_lots_avis(chemin, max_avis=None):
+    """Avis (avec un texte) par lots ; deux lectures du même fichier donnent les mêmes lots."""
+    nb_avis = 0
+    for lot in prediction_lot.lire_lots(chemin):
+        lot = [avis for avis in lot if avis.get("text")]
+        if max_avis is not None:
+            lot = lot[:max_avis - nb_avis]
+        if lot:
+            yield lot
+        nb_avis += len(lot)
+        if max_avis is not None and nb_avis >= max_avis:
+            return
+
+
+def confiance(probabilites, critere):
+    """Confiance entre 0 et 1 de chaque prédiction (une ligne de probabilités par avis)."""
+    if critere == "marge":
+        triees = np.sort(probabilites, axis=1)
+        return triees[:, -1] - triees[:, -2]
+    p = np.clip(probabilites, 1e-12, 1.0)
+    entropie = -(p * np.log(p)).sum(axis=1) / np.log(p.shape[1])
+    return 1.0 - entropie
+
+
+def polarite_note(note):
+    if note is None:
+        return None
+    return "positif" if note >= 4 else "négatif" if note <= 2 else "mitigé"
+
+
+def _sentiments(aspects):
+    # Le LLM répond une liste d'objets {aspect, sentiment}, parfois enveloppée dans un objet
+    if isinstance(aspects, dict):
+        if isinstance(aspects.get("sentiment"), str):
+            yield aspects["sentiment"].lower()
+        for valeur in aspects.values():
+            if isinstance(valeur, (list, dict)):
+                yield from _sentiments(valeur)
+    elif isinstance(aspects, list):
+        for element in aspects:
+            yield from _sentiments(element)
+
+
+def polarite_aspects(aspects):
+    """Polarité d'un avis d'après les sentiments de ses aspects (autant de positifs que de négatifs : mitigé)."""
+    positifs = negatifs = 0
+    for sentiment in _sentiments(aspects):
+        if sentiment.startswith("posit"):
+            positifs += 1
+        elif sentiment.startswith(("négat", "negat")):
+            negatifs += 1
+    if positifs > negatifs:
+        return "positif"
+    if negatifs > positifs:
+        return "négatif"
+    return "mitigé"
+
+
+def lire_aspects(chemin):
+    """review_id -> aspects extraits par llama.py (les réponses en JSON invalide sont ignorées)."""
+    aspects = {}
+    if not os.path.exists(chemin):
+        return aspects
+    with open(chemin, "rb") as f:
+        for ligne in f:
+            try:
+                resultat = json.loads(ligne)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if "aspects" in resultat:
+                aspects[resultat["review_id"]] = resultat["aspects"]
+    return aspects
+
+
+def precision(predites, vraies, masque):
+    """Part des polarités justes (codes) parmi les avis du masque (None si aucun avis)."""
+    if not masque.any():
+        return None
+    return float((predites[masque] == vraies[masque]).mean())
+
+
+def afficher_pourcentage(valeur):
+    return "-" if valeur is None else f"{100 * valeur:.1f} %"
+
+
+def balayage(conf, polarites_lineaire, polarites_llm, vraies, connues):
+    """Pour chaque seuil : part des avis envoyés au LLM et précisions, avec les réponses LLM déjà connues.
+
+    connues : masque des avis qui ont une vraie note (les autres ne comptent pas dans les précisions).
+    """
+    print(f"\n{'seuil':>6} {'envoyés LLM':>12} {'linéaire (sûrs)':>16} {'linéaire (envoyés)':>19} {'cascade':>9}")
+    for seuil in SEUILS_BALAYAGE:
+        envoyes = conf < seuil
+        # Précision de la cascade seulement si tous les avis envoyés à ce seuil ont une réponse du LLM
+        if (polarites_llm[envoyes] >= 0).all():
+            cascade = precision(np.where(envoyes, polarites_llm, polarites_lineaire), vraies, connues)
+        else:
+            cascade = None
+        print(f"{seuil:>6.2f} {afficher_pourcentage(envoyes.mean() if len(conf) else None):>12} "
+              f"{afficher_pourcentage(precision(polarites_lineaire, vraies, ~envoyes & connues)):>16} "
+              f"{afficher_pourcentage(precision(polarites_lineaire, vraies, envoyes & connues)):>19} "
+              f"{afficher_pourcentage(cascade):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cascade modèle linéaire -> LLaMA 3 pour les avis incertains")
+    parser.add_argument("--entree", default=FICHIER_AVIS, help="fichier JSONL d'une famille (INPUT_CASCADE)")
+    parser.add_argument("--sortie", default=DOSSIER_SORTIE, help="dossier des résultats (OUTPUT_CASCADE)")
+    parser.add_argument("--famille", default=None, help="modèle de la famille à utiliser (défaut : nom du fichier)")
+    parser.add_argument("--modele", default=MODELE, help="modèle sauvegardé : tfidf ou svm (MODELE_PREDICTION)")
+    parser.add_argument("--critere", default=CRITERE, choices=["marge", "entropie"], help="CRITERE_CASCADE")
+    parser.add_argument("--seuil", type=float, default=SEUIL, help="confiance sous laquelle l'avis va au LLM (SEUIL_CASCADE)")
+    parser.add_argument("--concurrence", type=int, default=llama.CONCURRENCE_LLM)
+    parser.add_argument("--max-avis", type=int, default=None)
+    args = parser.parse_args()
+
+    if not args.entree or not args.sortie:
+        raise ValueError("❌ Indiquer le fichier d'avis et le dossier de sortie (--entree / --sortie ou INPUT_CASCADE / OUTPUT_CASCADE)")
+    famille = args.famille or Path(args.entree).stem
+    artefact = artefacts.charger(args.modele, famille)
+    if artefact is None:
+        raise FileNotFoundError(f"❌ Aucun modèle '{args.modele}' pour {famille} dans {artefacts.DOSSIER_ARTEFACTS} : lancer d'abord l'entraînement")
+
+    print(f"📂 Avis de {famille} : {args.entree}, critère {args.critere}, seuil {args.seuil}")
+
+    # 1. Modèle linéaire sur tous les avis, lot par lot ; les avis incertains sont écrits au fur et à mesure
+    os.makedirs(args.sortie, exist_ok=True)
+    fichier_envoyes = os.path.join(args.sortie, f"envoyes_llm_{famille}.jsonl")
+    fichier_aspects = os.path.join(args.sortie, f"aspects_{famille}.jsonl")
+    morceaux = {"conf": [], "notes": [], "vraies": []}
+    duree_lineaire = 0.0
+    with open(fichier_envoyes, "w", encoding="utf-8") as f:
+        for lot in lire_lots_avis(args.entree, args.max_avis):
+            debut = time.time()
+            probabilites = artefact.probabilites_nettoyes(artefact.nettoyer(a["text"] for a in lot))
+            conf_lot = confiance(probabilites, args.critere)
+            duree_lineaire += time.time() - debut
+            for i in np.flatnonzero(conf_lot < args.seuil):
+                f.write(json.dumps(lot[i], ensure_ascii=False) + "\n")
+            morceaux["conf"].append(conf_lot)
+            morceaux["notes"].append(probabilites.argmax(axis=1).astype(np.int16))
+            morceaux["vraies"].append(np.array([code_polarite(polarite_note(a.get("stars"))) for a in lot], dtype=np.int8))
+    conf = np.concatenate(morceaux["conf"]) if morceaux["conf"] else np.empty(0)
+    notes = np.concatenate(morceaux["notes"]) if morceaux["notes"] else np.empty(0, dtype=np.int16)
+    vraies = np.concatenate(morceaux["vraies"]) if morceaux["vraies"] else np.empty(0, dtype=np.int8)
+    del morceaux
+    nb_avis = len(conf)
+    envoyes = conf < args.seuil
+    # Polarité de chaque note possible, puis de la note prédite de chaque avis
+    polarites_classes = np.array([code_polarite(polarite_note(note)) for note in artefact.classes], dtype=np.int8)
+    polarites_lineaire = polarites_classes[notes]
+    print(f"⚡ Modèle linéaire : {nb_avis} avis en {duree_lineaire:.2f} s ; "
+          f"{int(envoyes.sum())} avis incertains ({afficher_pourcentage(envoyes.mean() if nb_avis else None)}) envoyés à LLaMA")
+
+    # 2. LLaMA sur les avis incertains (fichier d'aspects repris d'une exécution à l'autre)
+    debut = time.time()
+    stats_llm = asyncio.run(llama.traiter_fichier(fichier_envoyes, fichier_aspects, args.concurrence))
+    duree_llm = time.time() - debut
+
+    # 3. Polarité finale de chaque avis, écrite lot par lot (deuxième lecture du fichier)
+    aspects = lire_aspects(fichier_aspects)
+    polarites_llm = np.full(nb_avis, -1, dtype=np.int8)
+    fichier_resultats = os.path.join(args.sortie, f"cascade_{famille}.csv")
+    with open(fichier_resultats, "w", encoding="utf-8", newline="") as f:
+        ecrivain = csv.writer(f)
+        ecrivain.writerow(["review_id", "business_id", "stars", "predicted_stars", "confiance", "envoye_llm",
+                           "polarite_lineaire", "polarite_llm", "polarite_finale"])
+        i = 0
+        for lot in lire_lots_avis(args.entree, args.max_avis):
+            for a in lot:
+                if a.get("review_id") in aspects:
+                    polarites_llm[i] = code_polarite(polarite_aspects(aspects[a["review_id"]]))
+                finale = polarites_llm[i] if envoyes[i] and polarites_llm[i] >= 0 else polarites_lineaire[i]
+                ecrivain.writerow([a.get("review_id"), a.get("business_id"), a.get("stars"), artefact.classes[notes[i]],
+                                   round(float(conf[i]), 4), int(envoyes[i]), nom_polarite(polarites_lineaire[i]),
+                                   nom_polarite(polarites_llm[i]) or "", nom_polarite(finale)])
+                i += 1
+
+    # 4. Bilan : précision / nombre d'appels au LLM
+    print("\n=============================")
+    print(" BILAN DE LA CASCADE")
+    print("=============================")
+    # Appels réellement faits au modèle (sans les réponses du cache ni les avis déjà analysés)
+    cache = llama.cache_llm.cache_defaut()
+    nb_appels = cache.stats["nb_calcules"] if cache is not None else stats_llm["nb_traites"]
+    print(f"Avis envoyés au LLM : {int(envoyes.sum())} / {nb_avis} ({afficher_pourcentage(envoyes.mean() if nb_avis else None)}), "
+          f"{nb_appels} appels au modèle dans cette exécution")
+    print(f"Durée               : modèle linéaire {duree_lineaire:.2f} s, LLaMA {duree_llm:.1f} s")
+    if nb_appels and duree_llm > 0:
+        print(f"Tout envoyer au LLM : ~{nb_avis * duree_llm / nb_appels:.0f} s au rythme mesuré, "
+              f"{nb_avis} appels au lieu de {int(envoyes.sum())}")
+    # Avis sans note ("stars" absent) : exclus des précisions plutôt que comptés faux
+    connues = vraies >= 0
+    if connues.any():
+        finales = np.where(envoyes & (polarites_llm >= 0), polarites_llm, polarites_lineaire)
+        print(f"Polarité juste      : linéaire seul {afficher_pourcentage(precision(polarites_lineaire, vraies, connues))}, "
+              f"cascade {afficher_pourcentage(precision(finales, vraies, connues))} "
+              f"({int(connues.sum())} avis notés)")
+        print(f"Avis envoyés au LLM : linéaire {afficher_pourcentage(precision(polarites_lineaire, vraies, envoyes & connues))}, "
+              f"LLaMA {afficher_pourcentage(precision(polarites_llm, vraies, envoyes & connues))}")
+        balayage(conf, polarites_lineaire, polarites_llm, vraies, connues)
+    print(f"\nFichier sauvegardé : {fichier_resultats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,288 @@
+# llama.py
+# Analyse des aspects (ABSA) des avis avec LLaMA 3 via Ollama.
+#
+# Sans fichier de sortie : aperçu sur les 5 premiers avis, affiché dans le terminal.
+# Avec --sortie (ou OUTPUT_ASPECTS) : tout le fichier d'avis est traité en lot :
+#   - CONCURRENCE_LLM requêtes en parallèle au plus (client asynchrone ; côté serveur, Ollama
+#     traite OLLAMA_NUM_PARALLEL requêtes à la fois, les autres attendent) ;
+#   - une requête qui échoue (serveur surchargé, coupure, délai dépassé) est relancée
+#     jusqu'à NB_ESSAIS fois, avec une attente qui double à chaque essai ;
+#   - chaque résultat est ajouté au fichier JSONL dès qu'il arrive, avec le review_id de l'avis :
+#     relancer la même commande après une interruption reprend aux avis pas encore traités.
+# Les réponses du modèle sont gardées dans un cache SQLite (cache_llm.py) : un texte déjà analysé
+# avec le même prompt et le même modèle n'est pas renvoyé au LLM (CACHE_LLM=0 pour désactiver).
+#
+# Exemple :
+#   python "code/modele_pre_enrtainer/llama.py" --entree famille.jsonl --sortie aspects.jsonl
+#   python "code/modele_pre_enrtainer/serveur_stub_ollama.py"   (faux serveur pour tester sans GPU)
+#   OLLAMA_HOST=http://127.0.0.1:11435 python "code/modele_pre_enrtainer/llama.py" --sortie aspects.jsonl
+import argparse
+import asyncio
 import json
 import os
+import random
+import time
+
+import httpx
 from dotenv import load_dotenv
 import ollama
 
+import cache_llm
+
 load_dotenv()
 
 FICHIER_AVIS = os.getenv("INPUT_REVIEWS")
+FICHIER_ASPECTS = os.getenv("OUTPUT_ASPECTS")
+MODELE_LLM = os.getenv("MODELE_LLM", "llama3")
+# None : adresse par défaut d'Ollama (http://localhost:11434)
+HOTE_OLLAMA = os.getenv("OLLAMA_HOST")
+CONCURRENCE_LLM = int(os.getenv("CONCURRENCE_LLM", "4"))
 
-# --- 1. FONCTION DE LA MÉTHODE 1 ---
-def extraire_aspects(revue):
-    prompt_system = """
+NB_ESSAIS = 5
+ATTENTE_BASE_S = 1.0        # attente avant le 2e essai, doublée ensuite
+DELAI_REQUETE_S = 300.0     # une génération sur CPU peut être longue
+CODES_A_RELANCER = {429, 500, 502, 503, 504}
+
+PROMPT_SYSTEME = """
     Tu es un expert en analyse de données. Ton objectif est d'extraire les aspects mentionnés dans une revue client et de déterminer le sentiment associé à chacun (positif ou négatif).
     Tu dois répondre UNIQUEMENT au format JSON valide, sous forme d'une liste d'objets contenant les clés 'aspect' et 'sentiment'.
     """
 
-    # Appel à LLaMA 3 via Ollama en forçant le format JSON
-    response = ollama.chat(model='llama3', messages=[
-        {'role': 'system', 'content': prompt_system},
+
+def messages_llm(revue):
+    return [
+        {'role': 'system', 'content': PROMPT_SYSTEME},
         {'role': 'user', 'content': revue},
-    ], format='json')
+    ]
+
 
+def lire_reponse(response):
+    """{"aspects": JSON du LLM} (ou {"brut": texte} si ce n'est pas du JSON) + nombres de tokens."""
+    contenu = response['message']['content']
     # Petit conseil : parfois l'IA se trompe de format, c'est bien de prévoir une sécurité
     try:
-        return json.loads(response['message']['content'])
+        resultat = {"aspects": json.loads(contenu)}
     except json.JSONDecodeError:
-        return {"erreur": "JSON invalide retourné par LLaMA", "brut": response['message']['content']}
+        resultat = {"brut": contenu}
+    resultat["tokens_prompt"] = response.get("prompt_eval_count") or 0
+    resultat["tokens_generes"] = response.get("eval_count") or 0
+    return resultat
+
+
+def aspects_ou_erreur(resultat):
+    if "aspects" in resultat:
+        return resultat["aspects"]
+    return {"erreur": "JSON invalide retourné par LLaMA", "brut": resultat["brut"]}
+
+
+# --- 1. FONCTION DE LA MÉTHODE 1 ---
+def extraire_aspects(revue):
+    def appeler():
+        # Appel à LLaMA 3 via Ollama en forçant le format JSON
+        return lire_reponse(ollama.chat(model=MODELE_LLM, messages=messages_llm(revue), format='json'))
+
+    cache = cache_llm.cache_defaut()
+    resultat = cache.obtenir_sync(revue, PROMPT_SYSTEME, MODELE_LLM, appeler) if cache else appeler()
+    return aspects_ou_erreur(resultat)
+
+
+# --- 2. APERÇU : LES 5 PREMIERS AVIS DU FICHIER ---
+def apercu(chemin_fichier, nb_avis=5):
+    print(f"📂 Ouverture du fichier : {chemin_fichier}\n")
+
+    # On ouvre le fichier une seule fois
+    with open(chemin_fichier, 'r', encoding='utf-8') as f:
+
+        for i in range(nb_avis):
+            ligne = f.readline()
+
+            # Sécurité : si le fichier a moins de nb_avis lignes, on arrête la boucle
+            if not ligne:
+                break
+
+            # On convertit cette ligne en dictionnaire Python
+            donnees_json = json.loads(ligne)
+
+            # On extrait le texte de la review
+            texte_de_la_revue = donnees_json.get("text", "")
+
+            print("-" * 50)
+            print(f"📝 --- AVIS N°{i + 1} ---")
+
+            # J'ai ajouté une petite coupure pour ne pas inonder ton terminal si le texte est très long
+            extrait_texte = texte_de_la_revue[:150] + "..." if len(texte_de_la_revue) > 150 else texte_de_la_revue
+            print(f"💬 Texte : \"{extrait_texte}\"")
+
+            # --- 3. EXÉCUTION DE L'IA ---
+            if texte_de_la_revue:
+                print("🤖 LLaMA 3 analyse le texte...")
+                resultats_absa = extraire_aspects(texte_de_la_revue)
+
+                print("✅ Résultat structuré obtenu :")
+                print(json.dumps(resultats_absa, indent=4, ensure_ascii=False))
+            else:
+                print("❌ Erreur : La clé 'text' n'a pas été trouvée ou est vide.")
+
+            print("\n") # Petit espace avant de passer à l'avis suivant
+
+
+# --- 4. MODE LOT ---
+def avis_deja_traites(chemin):
+    """review_id déjà présents dans le fichier de sortie (reprise après une interruption)."""
+    deja = set()
+    if not os.path.exists(chemin):
+        return deja
+    with open(chemin, "rb") as f:
+        for ligne in f:
+            try:
+                deja.add(json.loads(ligne)["review_id"])
+            except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+                continue  # ex: dernière ligne coupée par l'interruption
+    return deja
+
+
+def lire_avis(chemin, deja, max_avis, stats):
+    with open(chemin, "rb") as f:
+        for ligne in f:
+            if max_avis is not None and stats["nb_lus"] >= max_avis:
+                return
+            try:
+                avis = json.loads(ligne)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            stats["nb_lus"] += 1
+            if avis.get("review_id") in deja:
+                stats["nb_deja_faits"] += 1
+            elif not avis.get("text"):
+                stats["nb_sans_texte"] += 1
+            else:
+                yield avis
+
+
+async def appeler_llm(client, texte, stats):
+    """Une requête chat, relancée avec une attente exponentielle si le serveur ne répond pas."""
+    for essai in range(NB_ESSAIS):
+        try:
+            return await asyncio.wait_for(
+                client.chat(model=MODELE_LLM, messages=messages_llm(texte), format='json'), DELAI_REQUETE_S
+            )
+        except ollama.ResponseError as erreur:
+            if erreur.status_code not in CODES_A_RELANCER or essai == NB_ESSAIS - 1:
+                raise
+        except (ConnectionError, httpx.TransportError, asyncio.TimeoutError):
+            if essai == NB_ESSAIS - 1:
+                raise
+        stats["nb_reessais"] += 1
+        # Attente aléatoire autour de ATTENTE_BASE_S * 2^essai : les requêtes relancées ne repartent pas toutes ensemble
+        await asyncio.sleep(ATTENTE_BASE_S * 2 ** essai * random.uniform(0.5, 1.5))
+
+
+async def traiter_fichier(entree, sortie, concurrence=CONCURRENCE_LLM, max_avis=None):
+    deja = avis_deja_traites(sortie)
+    if deja:
+        print(f"↩️  Reprise : {len(deja)} avis déjà dans {sortie}")
+
+    client = ollama.AsyncClient(host=HOTE_OLLAMA)
+    cache = cache_llm.cache_defaut()
+    # File bornée : on ne lit le fichier d'avis qu'au rythme du LLM
+    file = asyncio.Queue(maxsize=2 * concurrence)
+    stats = dict.fromkeys([
+        "nb_lus", "nb_deja_faits", "nb_sans_texte", "nb_traites", "nb_json_invalides", "nb_erreurs",
+        "nb_reessais", "tokens_prompt", "tokens_generes",
+    ], 0)
+    debut = time.time()
+
+    dossier = os.path.dirname(sortie)
+    if dossier:
+        os.makedirs(dossier, exist_ok=True)
+    with open(sortie, "a", encoding="utf-8") as f:
+        # Une ligne coupée par une interruption ne doit pas se coller au premier nouveau résultat
+        if f.tell() > 0:
+            with open(sortie, "rb") as lecture:
+                lecture.seek(-1, os.SEEK_END)
+                if lecture.read(1) != b"\n":
+                    f.write("\n")
+
+        async def travailleur():
+            while True:
+                avis = await file.get()
+                if avis is None:
+                    return
+                async def appeler():
+                    resultat = lire_reponse(await appeler_llm(client, avis["text"], stats))
+                    # Tokens réellement calculés par le modèle (pas ceux des réponses du cache)
+                    stats["tokens_prompt"] += resultat["tokens_prompt"]
+                    stats["tokens_generes"] += resultat["tokens_generes"]
+                    return resultat
 
-# --- 2. LECTURE DU FICHIER JSONL ET EXÉCUTION ---
-chemin_fichier = FICHIER_AVIS
+                try:
+                    if cache is not None:
+                        reponse = await cache.obtenir(avis["text"], PROMPT_SYSTEME, MODELE_LLM, appeler)
+                    else:
+                        reponse = await appeler()
+                except Exception as erreur:
+                    # Pas de ligne écrite : l'avis sera retenté à la prochaine exécution
+                    stats["nb_erreurs"] += 1
+                    print(f"❌ {avis.get('review_id')} : {erreur!r}")
+                    continue
 
-print(f"📂 Ouverture du fichier : {chemin_fichier}\n")
+                resultat = {"review_id": avis.get("review_id"), "business_id": avis.get("business_id"), "modele": MODELE_LLM}
+                if "aspects" in reponse:
+                    resultat["aspects"] = reponse["aspects"]
+                else:
+                    stats["nb_json_invalides"] += 1
+                    resultat.update(erreur="JSON invalide retourné par LLaMA", brut=reponse["brut"])
+                f.write(json.dumps(resultat, ensure_ascii=False) + "\n")
+                f.flush()
 
-# On ouvre le fichier une seule fois
-with open(chemin_fichier, 'r', encoding='utf-8') as f:
+                stats["nb_traites"] += 1
+                if stats["nb_traites"] % 100 == 0:
+                    print(f"   {stats['nb_traites']} avis analysés ({stats['nb_traites'] / (time.time() - debut):.1f} avis/s)")
 
-    # On crée une boucle qui va tourner 5 fois (de 0 à 4)
-    for i in range(5):
-        ligne = f.readline()
+        travailleurs = [asyncio.create_task(travailleur()) for _ in range(concurrence)]
+        for avis in lire_avis(entree, deja, max_avis, stats):
+            await file.put(avis)
+        for _ in travailleurs:
+            await file.put(None)
+        await asyncio.gather(*travailleurs)
 
-        # Sécurité : si le fichier a moins de 5 lignes, on arrête la boucle
-        if not ligne:
-            break
+    afficher_bilan(stats, time.time() - debut, sortie, cache)
+    return stats
 
-        # On convertit cette ligne en dictionnaire Python
-        donnees_json = json.loads(ligne)
 
-        # On extrait le texte de la review
-        texte_de_la_revue = donnees_json.get("text", "")
+def afficher_bilan(stats, duree, sortie, cache=None):
+    duree = max(duree, 1e-9)
+    print("\n=============================")
+    print(" BILAN DE L'ANALYSE DES ASPECTS")
+    print("=============================")
+    print(f"Avis lus            : {stats['nb_lus']} (déjà faits : {stats['nb_deja_faits']}, sans texte : {stats['nb_sans_texte']})")
+    print(f"Avis analysés       : {stats['nb_traites']} en {duree:.1f} s ({stats['nb_traites'] / duree:.2f} avis/s)")
+    print(f"Tokens              : {stats['tokens_generes'] / duree:.0f} tokens générés/s, "
+          f"{(stats['tokens_prompt'] + stats['tokens_generes']) / duree:.0f} tokens/s avec le prompt")
+    print(f"Requêtes relancées  : {stats['nb_reessais']}")
+    if cache is not None:
+        cache.afficher_bilan()
+    if stats["nb_json_invalides"]:
+        print(f"⚠️  {stats['nb_json_invalides']} réponses en JSON invalide (gardées dans le champ 'brut')")
+    if stats["nb_erreurs"]:
+        print(f"❌ {stats['nb_erreurs']} avis en échec après {NB_ESSAIS} essais : relancer la commande pour les reprendre")
+    print(f"Fichier : {sortie}")
 
-        print("-" * 50)
-        print(f"📝 --- AVIS N°{i + 1} ---")
 
-        # J'ai ajouté une petite coupure pour ne pas inonder ton terminal si le texte est très long
-        extrait_texte = texte_de_la_revue[:150] + "..." if len(texte_de_la_revue) > 150 else texte_de_la_revue
-        print(f"💬 Texte : \"{extrait_texte}\"")
+def main():
+    parser = argparse.ArgumentParser(description="Analyse des aspects des avis avec LLaMA 3 (Ollama)")
+    parser.add_argument("--entree", default=FICHIER_AVIS, help="fichier JSONL des avis (INPUT_REVIEWS)")
+    parser.add_argument("--sortie", default=FICHIER_ASPECTS,
+                        help="fichier JSONL des aspects (OUTPUT_ASPECTS) ; sans sortie : aperçu des 5 premiers avis")
+    parser.add_argument("--concurrence", type=int, default=CONCURRENCE_LLM, help="requêtes en parallèle (CONCURRENCE_LLM)")
+    parser.add_argument("--max-avis", type=int, default=None, help="nombre d'avis lus au plus")
+    args = parser.parse_args()
 
-        # --- 3. EXÉCUTION DE L'IA ---
-        if texte_de_la_revue:
-            print("🤖 LLaMA 3 analyse le texte...")
-            resultats_absa = extraire_aspects(texte_de_la_revue)
+    if not args.sortie:
+        apercu(args.entree)
+        return
+    asyncio.run(traiter_fichier(args.entree, args.sortie, args.concurrence, args.max_avis))
 
-            print("✅ Résultat structuré obtenu :")
-            print(json.dumps(resultats_absa, indent=4, ensure_ascii=False))
-        else:
-            print("❌ Erreur : La clé 'text' n'a pas été trouvée ou est vide.")
 
-        print("\n") # Petit espace avant de passer à l'avis suivant
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# serveur_stub_ollama.py
+# Faux serveur Ollama (POST /api/chat, sans streaming) pour tester llama.py sans GPU ni modèle :
+# il répond au bout de --latence-ms avec une liste d'aspects tirée des mots de l'avis, au
+# même format JSON que Ollama (message.content, prompt_eval_count, eval_count...).
+#
+#   --places       générations en parallèle (comme OLLAMA_NUM_PARALLEL), les autres attendent
+#   --taux-erreur  part des requêtes qui reçoivent une erreur 503 (pour tester les relances)
+#
+# Exemple :
+#   python "code/modele_pre_enrtainer/serveur_stub_ollama.py" --port 11435 --latence-ms 200
+#   OLLAMA_HOST=http://127.0.0.1:11435 python "code/modele_pre_enrtainer/llama.py" --sortie aspects.jsonl
+import argparse
+import asyncio
+import json
+import random
+import re
+import zlib
+from datetime import datetime, timezone
+
+STATUTS = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}
+
+
+def reponse_chat(requete, duree_s):
+    """Réponse de /api/chat : aspects = mots longs de l'avis, sentiment fixé par un hash du mot."""
+    messages = requete.get("messages") or []
+    texte = messages[-1].get("content", "") if messages else ""
+    mots = list(dict.fromkeys(mot.lower() for mot in re.findall(r"[A-Za-zÀ-ÿ]{6,}", texte)))[:3]
+    contenu = json.dumps([
+        {"aspect": mot, "sentiment": "positif" if zlib.crc32(mot.encode("utf-8")) % 2 else "négatif"}
+        for mot in mots
+    ], ensure_ascii=False)
+    nb_tokens_prompt = sum(len(message.get("content", "").split()) for message in messages)
+    return {
+        "model": requete.get("model", ""),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "message": {"role": "assistant", "content": contenu},
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": int(duree_s * 1e9),
+        "prompt_eval_count": nb_tokens_prompt,
+        "eval_count": max(1, len(contenu) // 4),
+        "eval_duration": int(duree_s * 1e9),
+    }
+
+
+async def repondre(writer, statut, donnees):
+    corps = json.dumps(donnees, ensure_ascii=False).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {statut} {STATUTS[statut]}\r\nContent-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(corps)}\r\n\r\n".encode("ascii") + corps
+    )
+    await writer.drain()
+
+
+def creer_gestionnaire(args):
+    places = asyncio.Semaphore(args.places)
+
+    async def traiter(methode, chemin, corps):
+        if methode != "POST" or chemin != "/api/chat":
+            return 404, {"error": f"route inconnue : {methode} {chemin}"}
+        try:
+            requete = json.loads(corps)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return 400, {"error": "corps JSON invalide"}
+        if random.random() < args.taux_erreur:
+            return 503, {"error": "serveur occupé (erreur simulée)"}
+
+        async with places:
+            duree = max(0.0, random.gauss(args.latence_ms, args.gigue_ms)) / 1000
+            await asyncio.sleep(duree)
+        return 200, reponse_chat(requete, duree)
+
+    async def gerer_connexion(reader, writer):
+        # Connexion HTTP/1.1 gardée ouverte : le client d'Ollama (httpx) réutilise ses connexions
+        try:
+            while True:
+                ligne = await reader.readline()
+                if not ligne:
+                    break
+                methode, chemin, _ = ligne.decode("latin-1").split(" ", 2)
+                longueur = 0
+                while True:
+                    ligne = await reader.readline()
+                    if ligne in (b"\r\n", b"\n", b""):
+                        break
+                    nom, _, valeur = ligne.decode("latin-1").partition(":")
+                    if nom.strip().lower() == "content-length":
+                        longueur = int(valeur)
+                corps = await reader.readexactly(longueur) if longueur else b""
+                statut, donnees = await traiter(methode, chemin, corps)
+                await repondre(writer, statut, donnees)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return gerer_connexion
+
+
+async def servir(args):
+    serveur = await asyncio.start_server(creer_gestionnaire(args), args.hote, args.port)
+    print(f"✅ Faux serveur Ollama sur http://{args.hote}:{args.port} ({args.places} places, "
+          f"{args.latence_ms:.0f} ms par réponse, {100 * args.taux_erreur:.0f} % d'erreurs)")
+    async with serveur:
+        await serveur.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Faux serveur Ollama (API chat) pour tester llama.py")
+    parser.add_argument("--hote", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latence-ms", type=float, default=200.0)
+    parser.add_argument("--gigue-ms", type=float, default=50.0)
+    parser.add_argument("--places", type=int, default=4)
+    parser.add_argument("--taux-erreur", type=float, default=0.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(servir(args))
+    except KeyboardInterrupt:
+        print("\nArrêt du faux serveur.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# normalisation_texte.py
+# Nettoyage du texte des avis, partagé par tout le pipeline.
+#
+# Chaque "profil" reproduit EXACTEMENT un des anciens clean_text :
+#   - "nettoyage"  : nettoyageDonnees.py (accents retirés, ponctuation . , ! ? ' gardée)
+#   - "bow"        : bow.py (URLs et tout ce qui n'est pas a-z remplacés par un espace)
+#   - "prediction" : IA_SVM.py et ia prediction_tf-idf.py (URLs et caractères hors
+#                    a-z / lettres accentuées françaises supprimés)
+#   - "llm"        : clé du cache des réponses de LLaMA (code/modele_pre_enrtainer/cache_llm.py) :
+#                    seulement les espaces et la forme Unicode, le LLM lit le texte d'origine
+#
+# Pourquoi c'est plus rapide :
+#   - les expressions régulières sont compilées une seule fois ;
+#   - pour les textes ASCII (la grande majorité), le filtrage des caractères se fait avec
+#     bytes.translate (une table de 256 octets, en C) au lieu d'un re.sub ;
+#   - " ".join(texte.split()) remplace re.sub(r"\s+", " ", texte).strip() (même résultat) ;
+#   - unicodedata.normalize n'est appelé que si le texte contient des caractères non ASCII.
+import re
+import unicodedata
+
+# À incrémenter si le résultat d'un profil change (sert de clé aux caches de features)
+VERSION = 1
+
+_URL = re.compile(r"http\S+")
+_HORS_BOW = re.compile(r"[^a-z\s]")
+_HORS_PREDICTION = re.compile(r"[^a-zàâçéèêëîïôûùüÿñæœ\s]")
+
+_ASCII = [chr(c) for c in range(128)]
+_MINUSCULES = set("abcdefghijklmnopqrstuvwxyz")
+
+
+def _table_octets(correspondance):
+    # Table pour bytes.translate : 256 octets, seuls les 128 premiers servent (texte ASCII)
+    return bytes(ord(correspondance(c)) for c in _ASCII) + bytes(range(128, 256))
+
+
+# "nettoyage" : on garde lettres, chiffres, espaces et . , ! ? ' ; le reste devient un espace.
+# Les majuscules sont passées en minuscules dans la même table (l'ancien code faisait lower() à la fin).
+_TABLE_NETTOYAGE = _table_octets(lambda c: c.lower() if c.isalnum() or c.isspace() or c in ".,!?'" else " ")
+
+# "bow" : après lower(), tout ce qui n'est ni a-z ni un espace devient un espace
+_TABLE_BOW = _table_octets(lambda c: c if c in _MINUSCULES or c.isspace() else " ")
+
+# "prediction" : après lower(), tout ce qui n'est ni a-z ni un espace est supprimé
+_A_SUPPRIMER_PREDICTION = bytes(ord(c) for c in _ASCII if not (c in _MINUSCULES or c.isspace()))
+
+
+# ----------------------------
+# PROFILS
+# ----------------------------
+def _profil_nettoyage(texte):
+    if not texte:
+        return ""
+
+    if not texte.isascii():
+        texte = unicodedata.normalize("NFKD", texte)
+        texte = texte.encode("ascii", "ignore").decode("ascii")
+    return " ".join(texte.encode("ascii").translate(_TABLE_NETTOYAGE).decode("ascii").split())
+
+
+def _profil_bow(texte):
+    texte = texte.lower()
+    if "http" in texte:
+        texte = _URL.sub(" ", texte)
+    if texte.isascii():
+        texte = texte.encode("ascii").translate(_TABLE_BOW).decode("ascii")
+    else:
+        texte = _HORS_BOW.sub(" ", texte)
+    return " ".join(texte.split())
+
+
+def _profil_prediction(texte):
+    texte = texte.lower()
+    if "http" in texte:
+        texte = _URL.sub("", texte)
+    if texte.isascii():
+        texte = texte.encode("ascii").translate(None, _A_SUPPRIMER_PREDICTION).decode("ascii")
+    else:
+        texte = _HORS_PREDICTION.sub("", texte)
+    return " ".join(texte.split())
+
+
+def _profil_llm(texte):
+    if not texte:
+        return ""
+    if not texte.isascii():
+        texte = unicodedata.normalize("NFC", texte)
+    return " ".join(texte.split())
+
+
+PROFILS = {
+    "nettoyage": _profil_nettoyage,
+    "bow": _profil_bow,
+    "prediction": _profil_prediction,
+    "llm": _profil_llm,
+}
+
+
+def fonction_profil(profil):
+    """Renvoie la fonction de nettoyage d'un profil (à garder dans une variable dans les boucles)."""
+    try:
+        return PROFILS[profil]
+    except KeyError:
+        raise ValueError(f"❌ Profil de normalisation inconnu : {profil} (profils : {', '.join(PROFILS)})")
+
+
+# ----------------------------
+# API
+# ----------------------------
+def normaliser(texte, profil="nettoyage"):
+    """Nettoie UN texte."""
+    return fonction_profil(profil)(texte)
+
+
+def normaliser_lot(textes, profil="nettoyage"):
+    """Nettoie un lot de textes : liste, pandas.Series ou tableau pyarrow.
+
+    Le résultat est du même type que l'entrée (une Series garde son index,
+    les valeurs nulles d'un tableau pyarrow restent nulles).
+    """
+    fonction = fonction_profil(profil)
+    module = type(textes).__module__
+
+    if module.startswith("pandas"):
+        import pandas as pd
+        return pd.Series([fonction(t) for t in textes], index=textes.index, name=textes.name)
+
+    if module.startswith("pyarrow"):
+        import pyarrow as pa
+        if isinstance(textes, pa.ChunkedArray):
+            textes = textes.combine_chunks()
+        return pa.array(
+            [None if t is None else fonction(t) for t in textes.to_pylist()],
+            type=pa.string()
+        )
+
+    return [fonction(t) for t in textes]
@@ -0,0 +1,177 @@
+# ordonnanceur.py
+# Entraînement des modèles de plusieurs familles en parallèle, sous un budget mémoire.
+#
+# Chaque famille est une "tâche" avec une estimation de son pic mémoire (lignes x colonnes
+# de la matrice d'entraînement). Les tâches sont lancées dans un Pool de processus :
+#   - les plus grosses d'abord (Restauration...), pour qu'elles ne finissent pas seules à la fin ;
+#   - une tâche ne démarre que si la somme des estimations des tâches en cours reste sous
+#     BUDGET_MEMOIRE_ENTRAINEMENT_MO (une tâche plus grosse que le budget tourne seule) ;
+#   - chaque tâche a son propre processus (maxtasksperchild=1) : la mémoire est rendue au
+#     système à la fin de la tâche et le pic RSS mesuré est bien celui de la tâche.
+# À la fin, on affiche pour chaque tâche sa durée, son pic RSS et son estimation.
+import contextlib
+import io
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+import traceback
+from dotenv import load_dotenv
+
+import stockage_parquet
+
+# resource n'existe que sous Unix ; sous Windows, le pic mémoire est lu avec psutil s'il est installé
+try:
+    import resource
+except ImportError:
+    resource = None
+
+load_dotenv()
+
+NB_PROCESSUS = int(os.getenv("NB_PROCESSUS", "0")) or os.cpu_count() or 1
+
+
+def _memoire_physique_mo():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2 ** 20
+    except (ValueError, OSError, AttributeError):
+        return 4096.0
+
+
+# Par défaut : 75 % de la mémoire de la machine
+BUDGET_MEMOIRE_ENTRAINEMENT_MO = float(os.getenv("BUDGET_MEMOIRE_ENTRAINEMENT_MO", "0")) or 0.75 * _memoire_physique_mo()
+
+# Mémoire d'un processus Python avec pandas / scikit-learn chargés, avant toute donnée
+MEMOIRE_BASE_MO = 300.0
+
+
+class Tache:
+    """Une famille à entraîner : fonction(*args) est appelée dans un processus du Pool."""
+
+    def __init__(self, nom, fonction, args=(), memoire_mo=MEMOIRE_BASE_MO):
+        self.nom = nom
+        self.fonction = fonction
+        self.args = args
+        self.memoire_mo = memoire_mo
+
+
+def estimer_memoire_mo(nb_lignes, nb_colonnes, octets_par_valeur=8, copies=3, base_mo=MEMOIRE_BASE_MO):
+    """Estimation grossière du pic mémoire d'un entraînement sur une matrice nb_lignes x nb_colonnes.
+
+    Pour une matrice creuse, nb_colonnes = nombre moyen de valeurs non nulles par ligne.
+    copies : nombre de copies de la matrice en mémoire au même moment (textes, fit, transform...).
+    """
+    return base_mo + nb_lignes * nb_colonnes * octets_par_valeur * copies / 2 ** 20
+
+
+def compter_lignes(source, famille=None):
+    """Nombre d'avis d'une famille : lignes d'un fichier JSONL, ou métadonnées d'un dossier Parquet partitionné."""
+    if famille is not None and os.path.isdir(source):
+        return stockage_parquet.compter_lignes(source, filtres=[("famille", "==", famille)])
+    nb = 0
+    with open(source, "rb") as f:
+        for bloc in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            nb += bloc.count(b"\n")
+    return nb
+
+
+def _pic_rss_mo():
+    if resource is not None:
+        # ru_maxrss est en kilo-octets sous Linux, en octets sous macOS
+        pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pic / 2 ** 20 if sys.platform == "darwin" else pic / 1024
+    try:
+        import psutil
+        # Windows : pic de l'ensemble de travail du processus
+        return psutil.Process().memory_info().peak_wset / 2 ** 20
+    except (ImportError, AttributeError):
+        return 0.0  # pic inconnu (affiché 0 dans le rapport)
+
+
+def _executer(nom, fonction, args, capturer):
+    # Dans le processus de travail : les affichages de la tâche sont gardés pour ne pas se mélanger
+    sortie = io.StringIO() if capturer else None
+    debut = time.time()
+    erreur = None
+    resultat = None
+    with contextlib.redirect_stdout(sortie) if capturer else contextlib.nullcontext():
+        try:
+            resultat = fonction(*args)
+        except Exception:
+            erreur = traceback.format_exc()
+    return {
+        "nom": nom,
+        "resultat": resultat,
+        "erreur": erreur,
+        "duree": time.time() - debut,
+        "pic_rss_mo": _pic_rss_mo(),
+        "sortie": sortie.getvalue() if capturer else "",
+    }
+
+
+def executer_taches(taches, budget_mo=None, nb_processus=None, initializer=None, initargs=()):
+    """Exécute les tâches en parallèle et renvoie leurs rapports (dict), dans l'ordre de fin.
+
+    initializer / initargs : passés au Pool (données communes à toutes les tâches).
+    """
+    budget_mo = budget_mo or BUDGET_MEMOIRE_ENTRAINEMENT_MO
+    nb_processus = min(nb_processus or NB_PROCESSUS, max(len(taches), 1))
+    capturer = nb_processus > 1
+
+    en_attente = sorted(taches, key=lambda tache: tache.memoire_mo, reverse=True)
+    en_cours = {}
+    termines = queue.Queue()
+    rapports = []
+
+    print(f"🔄 {len(taches)} tâches sur {nb_processus} processus, budget mémoire {budget_mo:.0f} Mo")
+    debut = time.time()
+
+    with mp.Pool(nb_processus, initializer=initializer, initargs=initargs, maxtasksperchild=1) as pool:
+        while en_attente or en_cours:
+            # Lancer, de la plus grosse à la plus petite, toutes les tâches qui tiennent dans le budget
+            for tache in list(en_attente):
+                if len(en_cours) >= nb_processus:
+                    break
+                memoire_en_cours = sum(t.memoire_mo for t in en_cours.values())
+                if en_cours and memoire_en_cours + tache.memoire_mo > budget_mo:
+                    continue
+                if tache.memoire_mo > budget_mo:
+                    print(f"⚠️  {tache.nom} : estimation {tache.memoire_mo:.0f} Mo au-dessus du budget, lancée seule")
+                en_attente.remove(tache)
+                en_cours[tache.nom] = tache
+                print(f"▶️  {tache.nom} (estimation {tache.memoire_mo:.0f} Mo)")
+                pool.apply_async(
+                    _executer, (tache.nom, tache.fonction, tache.args, capturer),
+                    callback=termines.put,
+                    error_callback=lambda e, nom=tache.nom: termines.put(
+                        {"nom": nom, "resultat": None, "erreur": repr(e), "duree": 0.0, "pic_rss_mo": 0.0, "sortie": ""}
+                    ),
+                )
+
+            rapport = termines.get()
+            tache = en_cours.pop(rapport["nom"])
+            rapport["estimation_mo"] = tache.memoire_mo
+            rapports.append(rapport)
+
+            print(rapport["sortie"], end="")
+            if rapport["erreur"]:
+                print(f"❌ {rapport['nom']} a échoué :\n{rapport['erreur']}")
+            else:
+                print(f"✅ {rapport['nom']} : {rapport['duree']:.1f} s, pic RSS {rapport['pic_rss_mo']:.0f} Mo")
+
+    afficher_rapport(rapports, time.time() - debut)
+    return rapports
+
+
+def afficher_rapport(rapports, duree_totale):
+    print("\n=============================")
+    print(" DURÉE ET MÉMOIRE PAR FAMILLE")
+    print("=============================")
+    print(f"{'famille':<30} {'durée (s)':>10} {'pic RSS (Mo)':>13} {'estimation (Mo)':>16}")
+    for rapport in sorted(rapports, key=lambda r: r["duree"], reverse=True):
+        etat = "  ❌" if rapport["erreur"] else ""
+        print(f"{rapport['nom']:<30} {rapport['duree']:>10.1f} {rapport['pic_rss_mo']:>13.0f} "
+              f"{rapport['estimation_mo']:>16.0f}{etat}")
+    somme = sum(rapport["duree"] for rapport in rapports)
+    print(f"Temps total : {duree_totale:.1f} s (somme des tâches : {somme:.1f} s)")
@@ -0,0 +1,170 @@
+# stockage_parquet.py
+# Format colonnes (Parquet) pour échanger les données entre les étapes du pipeline.
+#
+# Chaque étape peut écrire, EN PLUS de son JSONL, un dossier Parquet :
+#   <DOSSIER_PARQUET>/fusion/     -> sortie de entreprise.py
+#   <DOSSIER_PARQUET>/nettoye/    -> sortie de nettoyageDonnees.py
+#   <DOSSIER_PARQUET>/familles/   -> sortie de separationEnPlusieurFamilles.py,
+#                                    partitionnée en famille=<nom>/part-XXXXX.parquet
+#
+# Les lecteurs ne chargent que les colonnes demandées (projection) et filtrent
+# les partitions / groupes de lignes avant lecture (predicate pushdown).
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ECRIRE_PARQUET = os.getenv("ECRIRE_PARQUET", "0") == "1"
+LIRE_PARQUET = os.getenv("LIRE_PARQUET", "0") == "1"
+DOSSIER_PARQUET = os.getenv("DOSSIER_PARQUET")
+
+# Nombre de lignes gardées en mémoire avant d'écrire un groupe de lignes Parquet
+TAILLE_GROUPE = 50000
+
+
+def _pyarrow():
+    # pyarrow est optionnel : on ne l'importe que si on utilise le Parquet
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("❌ Le format Parquet nécessite pyarrow : pip install pyarrow")
+    return pa, pq
+
+
+def dossier_etape(nom_etape):
+    if not DOSSIER_PARQUET:
+        raise ValueError("❌ DOSSIER_PARQUET doit être défini dans le .env pour utiliser le Parquet")
+    return os.path.join(DOSSIER_PARQUET, nom_etape)
+
+
+def preparer_dossier(dossier):
+    # On supprime les anciens fichiers .parquet (ex: d'un run avec plus de parties)
+    os.makedirs(dossier, exist_ok=True)
+    for racine, _, fichiers in os.walk(dossier):
+        for nom in fichiers:
+            if nom.endswith(".parquet"):
+                os.remove(os.path.join(racine, nom))
+
+
+class EcrivainParquet:
+    """Écrit un fichier Parquet morceau par morceau (DataFrame ou liste de dict).
+
+    Le schéma est fixé par le premier morceau, les suivants sont convertis vers ce schéma.
+    """
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.schema = None
+        self._writer = None
+        self._tampon = []
+        self.nb_lignes = 0
+
+    def _ecrire_table(self, table):
+        pa, pq = _pyarrow()
+        if self._writer is None:
+            # Une colonne entièrement vide dans le premier morceau serait typée "null" :
+            # on la force en texte pour que les morceaux suivants puissent la remplir
+            self.schema = pa.schema([
+                pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                for f in table.schema
+            ])
+            table = table.cast(self.schema)
+            os.makedirs(os.path.dirname(self.chemin) or ".", exist_ok=True)
+            self._writer = pq.ParquetWriter(self.chemin, self.schema)
+        else:
+            table = table.select(self.schema.names).cast(self.schema)
+        self._writer.write_table(table)
+        self.nb_lignes += table.num_rows
+
+    def ecrire_df(self, df):
+        pa, _ = _pyarrow()
+        if self.schema is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        else:
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        self._ecrire_table(table)
+
+    def ajouter_ligne(self, obj):
+        self._tampon.append(obj)
+        if len(self._tampon) >= TAILLE_GROUPE:
+            self.vider_tampon()
+
+    def vider_tampon(self):
+        if not self._tampon:
+            return
+        pa, _ = _pyarrow()
+        if self.schema is None:
+            table = pa.Table.from_pylist(self._tampon)
+        else:
+            table = pa.Table.from_pylist(self._tampon, schema=self.schema)
+        self._tampon = []
+        self._ecrire_table(table)
+
+    def fermer(self):
+        self.vider_tampon()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class EcrivainParquetFamilles:
+    """Un EcrivainParquet par famille, rangés en famille=<nom>/part-XXXXX.parquet."""
+
+    def __init__(self, dossier, numero_partie=0):
+        self.dossier = dossier
+        self.numero_partie = numero_partie
+        self.ecrivains = {}
+
+    def ajouter_ligne(self, famille, obj):
+        ecrivain = self.ecrivains.get(famille)
+        if ecrivain is None:
+            chemin = os.path.join(self.dossier, f"famille={famille}", f"part-{self.numero_partie:05d}.parquet")
+            ecrivain = self.ecrivains[famille] = EcrivainParquet(chemin)
+        ecrivain.ajouter_ligne(obj)
+
+    def fermer(self):
+        for ecrivain in self.ecrivains.values():
+            ecrivain.fermer()
+
+
+def lister_familles(dossier):
+    # Les familles sont les sous-dossiers famille=<nom>
+    if not os.path.isdir(dossier):
+        return []
+    return sorted(
+        nom.split("=", 1)[1]
+        for nom in os.listdir(dossier)
+        if nom.startswith("famille=") and os.path.isdir(os.path.join(dossier, nom))
+    )
+
+
+def lire_colonnes(source, colonnes=None, filtres=None):
+    """Lit un fichier ou un dossier Parquet en DataFrame pandas.
+
+    colonnes : liste des colonnes à lire (les autres ne sont jamais décodées)
+    filtres  : liste de tuples (colonne, opérateur, valeur), ex: [("famille", "==", "Restauration")]
+    """
+    _, pq = _pyarrow()
+    table = pq.read_table(source, columns=colonnes, filters=filtres, partitioning="hive")
+    return table.to_pandas()
+
+
+def iter_lots(source, colonnes=None, filtres=None, taille_lot=TAILLE_GROUPE):
+    """Comme lire_colonnes, mais renvoie les lignes par lots de DataFrame (mémoire bornée)."""
+    _, pq = _pyarrow()
+    import pyarrow.dataset as ds
+
+    expression = pq.filters_to_expression(filtres) if filtres else None
+    dataset = ds.dataset(source, format="parquet", partitioning="hive")
+    for lot in dataset.to_batches(columns=colonnes, filter=expression, batch_size=taille_lot):
+        yield lot.to_pandas()
+
+
+def compter_lignes(source, filtres=None):
+    """Nombre de lignes d'un fichier ou dossier Parquet (lu dans les métadonnées, sans décoder les colonnes)."""
+    _, pq = _pyarrow()
+    import pyarrow.dataset as ds
+
+    expression = pq.filters_to_expression(filtres) if filtres else None
+    return ds.dataset(source, format="parquet", partitioning="hive").count_rows(filter=expression)
@@ -0,0 +1,193 @@
+# empreintes.py
+# Ensemble compact d'empreintes (hash) pour la suppression des doublons.
+#
+# Au lieu de garder chaque texte nettoyé dans un set Python (plusieurs Go sur tout le corpus),
+# on ne garde qu'une empreinte blake2b de 64 ou 128 bits par texte, rangée dans une table
+# numpy à adressage ouvert : 8 ou 16 octets par avis, plus la place libre de la table.
+#
+# Si un fichier est donné, la table est un np.memmap sur disque : c'est le système qui garde
+# en RAM seulement les pages utiles (utile pour les très gros corpus).
+#
+# En mode incrémental, la table est sauvegardée en .npy à la fin de chaque exécution pour
+# que les doublons soient aussi détectés entre les avis déjà nettoyés et les nouveaux.
+import math
+import os
+from hashlib import blake2b
+
+import numpy as np
+
+# On agrandit la table quand elle est remplie à plus de 70 %
+TAUX_REMPLISSAGE_MAX = 0.7
+
+# À l'agrandissement, l'ancienne table est relue par blocs de lignes (mémoire temporaire bornée)
+TAILLE_BLOC_REINSERTION = 1 << 20
+
+
+def calculer_empreinte(texte, bits=64):
+    # Renvoie l'empreinte sous forme de liste de mots de 64 bits
+    digest = blake2b(texte.encode("utf-8"), digest_size=bits // 8).digest()
+    mots = [int.from_bytes(digest[i:i + 8], "little") for i in range(0, len(digest), 8)]
+    # 0 est réservé pour "case vide"
+    if mots[0] == 0:
+        mots[0] = 1
+    return mots
+
+
+def _reinserer(table, ancienne):
+    """Réinsère toutes les empreintes de ancienne dans table (sondage linéaire), sans boucle Python par avis.
+
+    À chaque tour, chaque empreinte en attente vise une case : les cases vides sont prises (une seule
+    empreinte par case), les autres empreintes passent à la case suivante. Comme une case remplie ne
+    se vide jamais, chaque empreinte reste trouvable depuis sa case de départ.
+    """
+    masque = table.shape[0] - 1
+    for debut in range(0, ancienne.shape[0], TAILLE_BLOC_REINSERTION):
+        bloc = np.asarray(ancienne[debut:debut + TAILLE_BLOC_REINSERTION])
+        elements = bloc[bloc[:, 0] != 0]
+        cases = (elements[:, 0] & np.uint64(masque)).astype(np.intp)
+        while len(elements):
+            libres = np.flatnonzero(table[cases, 0] == 0)
+            _, premieres = np.unique(cases[libres], return_index=True)
+            placees = libres[premieres]
+            table[cases[placees]] = elements[placees]
+
+            restantes = np.ones(len(elements), dtype=bool)
+            restantes[placees] = False
+            elements = elements[restantes]
+            cases = (cases[restantes] + 1) & masque
+
+
+class EnsembleEmpreintes:
+
+    def __init__(self, bits=64, capacite=1 << 20, fichier=None):
+        if bits not in (64, 128):
+            raise ValueError("❌ Les empreintes doivent faire 64 ou 128 bits")
+
+        self.bits = bits
+        self.nb_mots = bits // 64
+        self.fichier = fichier
+        self.nb_elements = 0
+
+        # Capacité = puissance de 2 pour remplacer le modulo par un masque
+        capacite = 1 << max(10, (capacite - 1).bit_length())
+        self._table = self._nouvelle_table(capacite, fichier)
+
+    # ----------------------------
+    # STOCKAGE
+    # ----------------------------
+    def _nouvelle_table(self, capacite, chemin):
+        forme = (capacite, self.nb_mots)
+        if chemin:
+            dossier = os.path.dirname(chemin)
+            if dossier:
+                os.makedirs(dossier, exist_ok=True)
+            return np.memmap(chemin, dtype=np.uint64, mode="w+", shape=forme)
+        return np.zeros(forme, dtype=np.uint64)
+
+    def _agrandir(self):
+        capacite = self._table.shape[0] * 2
+        chemin_tmp = self.fichier + ".tmp" if self.fichier else None
+        table = self._nouvelle_table(capacite, chemin_tmp)
+
+        # On réinsère toutes les empreintes (case vide = premier mot à 0)
+        _reinserer(table, self._table)
+
+        if not self.fichier:
+            self._table = table
+            return
+        # Les deux projections (ancienne et nouvelle table) sont fermées avant le renommage :
+        # sous Windows, un fichier encore projeté en mémoire ne peut être ni remplacé ni renommé
+        table.flush()
+        self._table = table = None
+        os.replace(chemin_tmp, self.fichier)
+        self._table = np.memmap(self.fichier, dtype=np.uint64, mode="r+", shape=(capacite, self.nb_mots))
+
+    # ----------------------------
+    # API
+    # ----------------------------
+    def empreinte(self, texte):
+        return calculer_empreinte(texte, self.bits)
+
+    def ajouter(self, texte):
+        """Ajoute le texte ; renvoie True s'il était nouveau, False si c'est un doublon."""
+        return self.ajouter_empreinte(self.empreinte(texte))
+
+    def ajouter_empreinte(self, mots):
+        """Comme ajouter, mais avec une empreinte déjà calculée (ex: par un autre processus)."""
+        if self.nb_elements + 1 > TAUX_REMPLISSAGE_MAX * self._table.shape[0]:
+            self._agrandir()
+
+        table = self._table
+        masque = table.shape[0] - 1
+        case = mots[0] & masque
+
+        while True:
+            premier = table[case, 0]
+            if premier == 0:
+                table[case] = mots
+                self.nb_elements += 1
+                return True
+            if premier == mots[0] and (self.nb_mots == 1 or table[case, 1] == mots[1]):
+                return False
+            case = (case + 1) & masque
+
+    def __contains__(self, texte):
+        mots = self.empreinte(texte)
+        table = self._table
+        masque = table.shape[0] - 1
+        case = mots[0] & masque
+        while True:
+            premier = table[case, 0]
+            if premier == 0:
+                return False
+            if premier == mots[0] and (self.nb_mots == 1 or table[case, 1] == mots[1]):
+                return True
+            case = (case + 1) & masque
+
+    # ----------------------------
+    # SAUVEGARDE / CHARGEMENT
+    # ----------------------------
+    def sauvegarder(self, chemin):
+        """Copie la table dans un fichier .npy (écriture dans un .tmp puis renommage)."""
+        temporaire = chemin + ".tmp"
+        with open(temporaire, "wb") as f:
+            np.save(f, np.asarray(self._table))
+        os.replace(temporaire, chemin)
+
+    @classmethod
+    def charger(cls, chemin, bits=64, fichier=None):
+        """Recharge une table sauvegardée ; renvoie un ensemble vide si le fichier est absent.
+
+        fichier : comme dans le constructeur, la table rechargée peut être un np.memmap.
+        """
+        if not chemin or not os.path.exists(chemin):
+            return cls(bits=bits, fichier=fichier)
+
+        table = np.load(chemin, mmap_mode="r")
+        if table.ndim != 2 or table.shape[1] != bits // 64:
+            raise ValueError(f"❌ {chemin} ne contient pas des empreintes de {bits} bits")
+
+        ensemble = cls(bits=bits, capacite=table.shape[0], fichier=fichier)
+        ensemble._table[:] = table
+        ensemble.nb_elements = int(np.count_nonzero(table[:, 0]))
+        return ensemble
+
+    def __len__(self):
+        return self.nb_elements
+
+    def memoire_octets(self):
+        return self._table.nbytes
+
+    def probabilite_collision(self):
+        # Paradoxe des anniversaires : probabilité qu'au moins deux textes différents
+        # aient la même empreinte (et donc qu'un avis soit supprimé à tort)
+        n = self.nb_elements
+        return -math.expm1(-n * (n - 1) / 2 ** (self.bits + 1))
+
+    def resume(self):
+        emplacement = f"disque ({self.fichier})" if self.fichier else "RAM"
+        return (
+            f"{self.nb_elements} empreintes de {self.bits} bits, "
+            f"{self.memoire_octets() / 1024 / 1024:.1f} Mo en {emplacement}, "
+            f"probabilité de collision ≈ {self.probabilite_collision():.2e}"
+        )
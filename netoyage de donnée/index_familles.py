@@ -0,0 +1,148 @@
+# index_familles.py
+# Classement des business en familles, calculé UNE fois par business.
+#
+# Les catégories sont une propriété du business (~150k) et pas de l'avis (~7M) :
+# on résout "catégories -> familles" une seule fois par chaîne de catégories distincte,
+# puis on garde un index business_id -> masque de bits (bit i = FAMILLES[i]).
+#
+# L'index est sauvegardé en JSON pour que les autres scripts puissent le réutiliser :
+#   {"familles": [...], "signature": "...", "business": {"<business_id>": masque, ...}}
+# La signature dépend du fichier de catégories et du fichier business (taille + date) : si l'un
+# des deux change, l'index sauvegardé est ignoré et reconstruit.
+import json
+import os
+from hashlib import blake2b
+
+DOSSIER_SCRIPT = os.path.dirname(os.path.abspath(__file__))
+# Attention: vérifie bien que ce chemin relatif est correct par rapport à l'endroit où est ton script
+FICHIER_CATEGORIES = os.path.join(DOSSIER_SCRIPT, "../Analyse de données/toutesLesCateg.txt")
+
+# Familles à conserver
+FAMILLES_A_GARDER = {
+    "Restauration",
+    "Bars & Vie nocturne",
+    "Commerce",
+    "Beauté & Bien-être",
+    "Services",
+    "Loisirs & Culture",
+    "Services événementiels",
+    "Automobile",
+    "Santé",
+    "Hôtellerie & Voyage"
+}
+
+# Ordre fixe des bits du masque
+FAMILLES = sorted(FAMILLES_A_GARDER)
+
+
+def charger_categories(fichier_categories=FICHIER_CATEGORIES):
+    # Lecture des catégories + familles depuis le txt
+    categorie_famille = {}
+    try:
+        with open(fichier_categories, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or "," not in line:
+                    continue
+                cat, fam = line.split(",", 1)
+                # Nettoyage basique pour matcher plus facilement
+                if fam in FAMILLES_A_GARDER:
+                    categorie_famille[cat.lower()] = fam
+    except FileNotFoundError:
+        raise FileNotFoundError(f"❌ Impossible de trouver le fichier de catégories : {fichier_categories}")
+
+    return categorie_famille
+
+
+def identite_fichier(chemin):
+    """(taille, date de modification) d'un fichier, None s'il n'existe pas."""
+    if not chemin or not os.path.exists(chemin):
+        return None
+    infos = os.stat(chemin)
+    return [infos.st_size, infos.st_mtime_ns]
+
+
+def nom_famille_fichier(fam):
+    # Nom utilisé pour les fichiers JSONL et les partitions Parquet
+    return fam.replace(' ', '_').replace('&', 'et')
+
+
+class IndexFamilles:
+
+    def __init__(self, categorie_famille, fichier_business=None):
+        self.categorie_famille = categorie_famille
+        self.business = {}
+        self._masque_par_categories = {}
+        self._familles_par_masque = {}
+        self._bit = {fam: 1 << i for i, fam in enumerate(FAMILLES)}
+        # Si le fichier de catégories ou le fichier business change, un index sauvegardé n'est plus valable
+        contenu = json.dumps(
+            [FAMILLES, sorted(categorie_famille.items()), identite_fichier(fichier_business)], ensure_ascii=False
+        )
+        self.signature = blake2b(contenu.encode("utf-8"), digest_size=8).hexdigest()
+
+    def masque_categories(self, categories):
+        """Masque des familles d'une chaîne de catégories (mémorisé par chaîne distincte)."""
+        masque = self._masque_par_categories.get(categories)
+        if masque is None:
+            masque = 0
+            for cat in categories.split(",") if categories else ():
+                fam = self.categorie_famille.get(cat.strip().lower())
+                if fam:
+                    masque |= self._bit[fam]
+            self._masque_par_categories[categories] = masque
+        return masque
+
+    def masque_business(self, business_id, categories):
+        """Masque du business d'après ses catégories (l'index ne sert que si elles manquent).
+
+        Un business vu sans catégories n'est pas ajouté à l'index : on le classera au premier
+        enregistrement qui en a.
+        """
+        if categories:
+            masque = self.business[business_id] = self.masque_categories(categories)
+            return masque
+        return self.business.get(business_id, 0)
+
+    def familles(self, masque):
+        """Liste des familles d'un masque (mémorisée : au plus 2^10 masques)."""
+        familles = self._familles_par_masque.get(masque)
+        if familles is None:
+            familles = [fam for i, fam in enumerate(FAMILLES) if masque >> i & 1]
+            self._familles_par_masque[masque] = familles
+        return familles
+
+    def resume(self):
+        return (f"Index de {len(self.business)} business "
+                f"({len(self._masque_par_categories)} listes de catégories distinctes résolues)")
+
+    # ----------------------------
+    # SAUVEGARDE / CHARGEMENT
+    # ----------------------------
+    def sauvegarder(self, chemin):
+        dossier = os.path.dirname(chemin)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        with open(chemin, "w", encoding="utf-8") as f:
+            json.dump({"familles": FAMILLES, "signature": self.signature, "business": self.business},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def charger(cls, chemin, categorie_famille=None, fichier_business=None):
+        """Recharge un index sauvegardé ; renvoie un index vide s'il est absent ou périmé."""
+        index = cls(categorie_famille if categorie_famille is not None else charger_categories(), fichier_business)
+        if not chemin or not os.path.exists(chemin):
+            return index
+
+        with open(chemin, "r", encoding="utf-8") as f:
+            donnees = json.load(f)
+        if donnees.get("familles") == FAMILLES and donnees.get("signature") == index.signature:
+            index.business = donnees["business"]
+        return index
+
+
+def charger_index(chemin):
+    """Pour les autres scripts : renvoie (liste des familles, dict business_id -> masque)."""
+    with open(chemin, "r", encoding="utf-8") as f:
+        donnees = json.load(f)
+    return donnees["familles"], donnees["business"]
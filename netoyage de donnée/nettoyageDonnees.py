@@ -1,10 +1,17 @@
 import json
 import os
-import re
-import unicodedata
+import sys
+import multiprocessing as mp
 from dotenv import load_dotenv
 from tqdm import tqdm  # <--- IMPORT AJOUTÉ
 
+# Les modules partagés du pipeline sont dans le dossier code/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../code"))
+import stockage_parquet
+import normalisation_texte
+from etat_incremental import MODE_INCREMENTAL, EtatIncremental, lire_lignes
+from empreintes import EnsembleEmpreintes, calculer_empreinte
+
 # ----------------------------
 # CONFIG
 # ----------------------------
@@ -19,87 +26,179 @@ if not FICHIER_ENTREE or not FICHIER_SORTIE:
 # Créer le dossier de sortie si besoin
 os.makedirs(os.path.dirname(FICHIER_SORTIE), exist_ok=True)
 
+# Copie optionnelle au format Parquet (ECRIRE_PARQUET=1) dans <DOSSIER_PARQUET>/nettoye
+ECRIRE_PARQUET = stockage_parquet.ECRIRE_PARQUET
+
+# Doublons : on ne garde qu'une empreinte de 64 ou 128 bits par texte (pas le texte lui-même)
+DEDUP_BITS = int(os.getenv("DEDUP_BITS", "64"))
+# Si défini, la table des empreintes est un fichier sur disque (np.memmap) au lieu de la RAM
+DEDUP_FICHIER = os.getenv("DEDUP_FICHIER") or None
+
+# Mode incrémental (MODE_INCREMENTAL=1) : seules les lignes ajoutées à OUTPUT_FILE depuis la
+# dernière exécution sont nettoyées et ajoutées à OUTPUT_FILE2. La table des empreintes est
+# sauvegardée à côté de la sortie pour que les doublons avec les anciens avis soient retirés.
+FICHIER_ETAT = f"{FICHIER_SORTIE}.etat.json"
+
+# Nombre de processus de nettoyage (défaut = nombre de coeurs, 1 = pas de parallélisme)
+NB_PROCESSUS = int(os.getenv("NB_PROCESSUS", "0")) or os.cpu_count() or 1
+# Nombre de lignes envoyées d'un coup à un processus
+TAILLE_LOT = int(os.getenv("TAILLE_LOT", "2000"))
+
 # ----------------------------
 # UTILS
 # ----------------------------
-def clean_text(text):
-    if not text:
-        return ""
+# Accents retirés, ponctuation . , ! ? ' gardée, minuscules (voir code/normalisation_texte.py)
+clean_text = normalisation_texte.fonction_profil("nettoyage")
+
+# ----------------------------
+# NETTOYAGE D'UN LOT DE LIGNES
+# ----------------------------
+def nettoyer_ligne(line):
+    # Renvoie None si la ligne est à jeter, sinon (empreinte du texte ou None, ligne JSON, objet)
+    if not line.strip():
+        return None
+
+    try:
+        obj = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+    # Nettoyage des champs texte s'ils existent
+    if "text" in obj:
+        obj["text"] = clean_text(obj.get("text", ""))
+
+    if "name" in obj:
+        obj["name"] = clean_text(obj.get("name", ""))
+
+    if "city" in obj:
+        obj["city"] = clean_text(obj.get("city", ""))
+
+    if "categories" in obj:
+        obj["categories"] = clean_text(obj.get("categories", ""))
+
+    # Si le texte est vide après nettoyage → on jette
+    if "text" in obj and obj["text"] == "":
+        return None
 
-    text = unicodedata.normalize("NFKD", text)
-    text = text.encode("ascii", "ignore").decode("ascii")
-    text = re.sub(r"[^a-zA-Z0-9\s.,!?']", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text.lower()
+    # L'empreinte est calculée ici (dans le processus de travail),
+    # le processus principal n'a plus qu'à vérifier si elle est déjà connue
+    empreinte = calculer_empreinte(obj["text"], DEDUP_BITS) if "text" in obj else None
+
+    ligne_sortie = json.dumps(obj, ensure_ascii=False) + "\n"
+    # L'objet n'est renvoyé que si on en a besoin pour le Parquet (évite de le copier entre processus)
+    return empreinte, ligne_sortie, obj if ECRIRE_PARQUET else None
+
+
+def nettoyer_lot(lot):
+    # lot = liste de lignes brutes (bytes) ; on renvoie aussi leur taille pour la progression
+    return sum(len(line) for line in lot), [nettoyer_ligne(line) for line in lot]
+
+
+def lire_par_lots(f):
+    lot = []
+    for line in f:
+        lot.append(line)
+        if len(lot) >= TAILLE_LOT:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
 
 # ----------------------------
 # CLEAN MERGED DATA
 # ----------------------------
-def clean_merged_file():
-    seen_texts = set()
+def clean_merged_file(incremental=False):
     kept = 0
     removed = 0
 
-    # 1. On compte d'abord le nombre total de lignes pour la barre de chargement
-    print("📊 Calcul du nombre de lignes à traiter...")
+    # Une seule lecture du fichier : la progression est calculée en octets
     try:
-        with open(FICHIER_ENTREE, "r", encoding="utf-8") as f:
-            # Cette méthode est rapide pour compter les lignes sans charger le fichier
-            total_lines = sum(1 for _ in f)
+        fin_entree = os.path.getsize(FICHIER_ENTREE)
     except FileNotFoundError:
         print(f"❌ Erreur : Le fichier {FICHIER_ENTREE} est introuvable.")
         return
 
-    print(f"🔄 Début du traitement de {total_lines} lignes...")
-
-    # 2. Traitement avec barre de chargement
-    with open(FICHIER_ENTREE, "r", encoding="utf-8") as fin, \
-         open(FICHIER_SORTIE, "w", encoding="utf-8") as fout:
-
-        # tqdm enveloppe 'fin' et affiche la progression
-        for line in tqdm(fin, total=total_lines, unit="line", desc="Nettoyage"):
-
-            if not line.strip():
-                removed += 1
-                continue
-
-            try:
-                obj = json.loads(line)
-            except json.JSONDecodeError:
-                removed += 1
-                continue
+    # Partie du fichier à traiter : tout, ou seulement la fin en mode incrémental
+    etat = None
+    debut = 0
+    seen_texts = None
+    if incremental:
+        etat = EtatIncremental(FICHIER_ENTREE, FICHIER_ETAT)
+        # Des empreintes d'une autre taille ne sont pas comparables : on repart de zéro
+        if etat.donnees and etat.donnees.get("dedup_bits") != DEDUP_BITS:
+            print("⚠️  DEDUP_BITS a changé depuis la dernière exécution : on repart de zéro.")
+            etat.donnees = {}
+        ancienne_table = etat.donnees.get("empreintes")
+        debut, fin_entree = etat.demarrer([FICHIER_SORTIE])
+        if debut:
+            seen_texts = EnsembleEmpreintes.charger(ancienne_table, bits=DEDUP_BITS, fichier=DEDUP_FICHIER)
+            print(f"➕ Mode incrémental : reprise à l'octet {debut}, {len(seen_texts)} empreintes déjà connues")
+
+    if seen_texts is None:
+        seen_texts = EnsembleEmpreintes(bits=DEDUP_BITS, fichier=DEDUP_FICHIER)
+
+    total_octets = fin_entree - debut
+    print(f"🔄 Début du traitement de {total_octets / 1024 / 1024:.1f} Mo sur {NB_PROCESSUS} processus...")
+
+    ecrivain = None
+    numero_partie = etat.numero_partie(debut) if etat else 0
+    if ECRIRE_PARQUET:
+        dossier_parquet = stockage_parquet.dossier_etape("nettoye")
+        if debut == 0:
+            stockage_parquet.preparer_dossier(dossier_parquet)
+        ecrivain = stockage_parquet.EcrivainParquet(os.path.join(dossier_parquet, f"part-{numero_partie:05d}.parquet"))
+
+    pool = mp.Pool(NB_PROCESSUS) if NB_PROCESSUS > 1 else None
+
+    with open(FICHIER_ENTREE, "rb") as fin, \
+         open(FICHIER_SORTIE, "a" if debut else "w", encoding="utf-8") as fout, \
+         tqdm(total=total_octets, unit="B", unit_scale=True, desc="Nettoyage") as barre:
+
+        fin.seek(debut)
+        lots = lire_par_lots(lire_lignes(fin, fin_entree))
+        # imap rend les résultats DANS L'ORDRE des lots : la sortie est la même qu'en séquentiel
+        resultats = pool.imap(nettoyer_lot, lots, chunksize=4) if pool else map(nettoyer_lot, lots)
+
+        for nb_octets, lignes in resultats:
+            for resultat in lignes:
+                if resultat is None:
+                    removed += 1
+                    continue
 
-            # Nettoyage des champs texte s'ils existent
-            if "text" in obj:
-                obj["text"] = clean_text(obj.get("text", ""))
+                empreinte, ligne_sortie, obj = resultat
 
-            if "name" in obj:
-                obj["name"] = clean_text(obj.get("name", ""))
+                # Suppression des doublons sur le texte (dans l'ordre du fichier)
+                if empreinte is not None and not seen_texts.ajouter_empreinte(empreinte):
+                    removed += 1
+                    continue
 
-            if "city" in obj:
-                obj["city"] = clean_text(obj.get("city", ""))
+                fout.write(ligne_sortie)
+                if ecrivain is not None:
+                    ecrivain.ajouter_ligne(obj)
+                kept += 1
 
-            if "categories" in obj:
-                obj["categories"] = clean_text(obj.get("categories", ""))
+            barre.update(nb_octets)
 
-            # Si le texte est vide après nettoyage → on jette
-            if "text" in obj and obj["text"] == "":
-                removed += 1
-                continue
+    if pool:
+        pool.close()
+        pool.join()
 
-            # Suppression des doublons sur le texte
-            if "text" in obj:
-                if obj["text"] in seen_texts:
-                    removed += 1
-                    continue
-                seen_texts.add(obj["text"])
+    if ecrivain is not None:
+        ecrivain.fermer()
+        print(f"📦 Copie Parquet écrite dans : {stockage_parquet.dossier_etape('nettoye')}")
 
-            fout.write(json.dumps(obj, ensure_ascii=False) + "\n")
-            kept += 1
+    if etat is not None:
+        # Nouvelle table sous un nouveau nom : l'état ne pointe vers elle qu'une fois tout écrit
+        table = f"{FICHIER_SORTIE}.empreintes-{numero_partie:05d}.npy"
+        seen_texts.sauvegarder(table)
+        etat.terminer(fin_entree, [FICHIER_SORTIE], partie=numero_partie, dedup_bits=DEDUP_BITS, empreintes=table)
+        if ancienne_table and ancienne_table != table and os.path.exists(ancienne_table):
+            os.remove(ancienne_table)
 
     print("-" * 40)
     print(f"✔ Lignes conservées : {kept}")
     print(f"✘ Lignes supprimées : {removed}")
+    print(f"🔑 Doublons : {seen_texts.resume()}")
     print(f"✅ Fichier nettoyé écrit dans : {FICHIER_SORTIE}")
 
 # ----------------------------
@@ -111,4 +210,4 @@ if __name__ == "__main__":
     print(f"📤 Sortie : {FICHIER_SORTIE}")
     print("-" * 40)
 
-    clean_merged_file()
\ No newline at end of file
+    clean_merged_file(incremental=MODE_INCREMENTAL)
\ No newline at end of file
@@ -1,9 +1,16 @@
 import json
 import os
+import sys
 from collections import defaultdict
 from dotenv import load_dotenv
 from tqdm import tqdm  # <--- IMPORT AJOUTÉ
 
+# Les modules partagés du pipeline sont dans le dossier code/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../code"))
+import stockage_parquet
+from etat_incremental import MODE_INCREMENTAL, EtatIncremental, lire_lignes
+from index_familles import FAMILLES, IndexFamilles, charger_categories, nom_famille_fichier
+
 load_dotenv()
 
 # ----------------------------
@@ -19,102 +26,230 @@ if not FICHIER_ENTREE or not DOSSIER_SORTIE:
 # Création du dossier de sortie s'il n'existe pas
 os.makedirs(DOSSIER_SORTIE, exist_ok=True)
 
-# Le fichier toutesLesCateg.txt est dans le même dossier que le script
-DOSSIER_SCRIPT = os.path.dirname(os.path.abspath(__file__))
-# Attention: vérifie bien que ce chemin relatif est correct par rapport à l'endroit où est ton script
-FICHIER_CATEGORIES = os.path.join(DOSSIER_SCRIPT, "../Analyse de données/toutesLesCateg.txt")
-
-# Familles à conserver
-familles_a_garder = {
-    "Restauration",
-    "Bars & Vie nocturne",
-    "Commerce",
-    "Beauté & Bien-être",
-    "Services",
-    "Loisirs & Culture",
-    "Services événementiels",
-    "Automobile",
-    "Santé",
-    "Hôtellerie & Voyage"
-}
+# Copie optionnelle au format Parquet (ECRIRE_PARQUET=1), partitionnée par famille
+# dans <DOSSIER_PARQUET>/familles/famille=<nom>/
+ECRIRE_PARQUET = stockage_parquet.ECRIRE_PARQUET
+
+# Mode de séparation :
+#   - "streaming" (défaut) : une seule lecture, chaque ligne brute est recopiée directement
+#     dans le fichier de sa (ou ses) famille(s), rien n'est gardé en mémoire
+#   - "memoire" : ancien comportement, tous les avis sont regroupés en RAM puis réécrits
+MODE_SEPARATION = os.getenv("MODE_SEPARATION", "streaming").lower()
+
+# Taille du tampon d'écriture de chaque fichier famille
+TAILLE_TAMPON = 1024 * 1024
+
+# Index business_id -> familles (masque de bits), sauvegardé pour être réutilisé par les autres scripts
+FICHIER_INDEX = os.getenv("INDEX_FAMILLES") or os.path.join(DOSSIER_SORTIE, "index_familles_business.json")
+
+# Mode incrémental (MODE_INCREMENTAL=1) : seules les lignes ajoutées à OUTPUT_FILE2 depuis la
+# dernière exécution sont classées, puis ajoutées à la fin des fichiers familles
+FICHIER_ETAT = os.path.join(DOSSIER_SORTIE, "etat_incremental.json")
 
 # ----------------------------
 # PRÉPARATION
 # ----------------------------
-print("⚙️  Chargement des catégories...")
+def charger_index():
+    print("⚙️  Chargement des catégories...")
+    index = IndexFamilles.charger(FICHIER_INDEX, charger_categories(), os.getenv("INPUT_BUSINESS"))
+    if index.business:
+        print(f"   -> index existant réutilisé : {len(index.business)} business déjà classés")
+    return index
 
-# Lecture des catégories + familles depuis le txt
-categorie_famille = {}
-try:
-    with open(FICHIER_CATEGORIES, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or "," not in line:
-                continue
-            cat, fam = line.split(",", 1)
-            # Nettoyage basique pour matcher plus facilement
-            if fam in familles_a_garder:
-                categorie_famille[cat.lower()] = fam
-except FileNotFoundError:
-    raise FileNotFoundError(f"❌ Impossible de trouver le fichier de catégories : {FICHIER_CATEGORIES}")
 
-# Dictionnaire pour regrouper les objets JSON par famille
-famille_jsons = defaultdict(list)
+def masque_objet(obj, index):
+    # Les catégories de la ligne (résolues une fois par chaîne distincte) font foi ;
+    # l'index ne sert que pour une ligne sans catégories
+    business_id = obj.get("business_id")
+    if business_id is None:
+        return index.masque_categories(obj.get("categories"))
+    return index.masque_business(business_id, obj.get("categories"))
+
+
+def sauvegarder_index(index):
+    index.sauvegarder(FICHIER_INDEX)
+    print(f"🗂️  {index.resume()} : {FICHIER_INDEX}")
+
+
+def chemin_famille(fam):
+    return os.path.join(DOSSIER_SORTIE, f"{nom_famille_fichier(fam)}.jsonl")
+
+
+def creer_ecrivain_parquet(numero_partie=0):
+    if not ECRIRE_PARQUET:
+        return None
+    dossier_parquet = stockage_parquet.dossier_etape("familles")
+    # En mode incrémental, les parties des exécutions précédentes sont gardées
+    if numero_partie == 0:
+        stockage_parquet.preparer_dossier(dossier_parquet)
+    return stockage_parquet.EcrivainParquetFamilles(dossier_parquet, numero_partie)
+
+
+def fermer_ecrivain_parquet(ecrivain_parquet):
+    if ecrivain_parquet is not None:
+        ecrivain_parquet.fermer()
+        print(f"📦 Copie Parquet partitionnée par famille dans : {stockage_parquet.dossier_etape('familles')}")
+
 
 # ----------------------------
-# 1. CLASSEMENT (LECTURE)
+# MODE MÉMOIRE (ancien comportement)
 # ----------------------------
+def separer_memoire(index):
+    # Dictionnaire pour regrouper les objets JSON par famille
+    famille_jsons = defaultdict(list)
+
+    # ----------------------------
+    # 1. CLASSEMENT (LECTURE)
+    # ----------------------------
+
+    # On compte les lignes pour la première barre de chargement
+    print("📊 Calcul du volume à traiter...")
+    try:
+        with open(FICHIER_ENTREE, "r", encoding="utf-8") as f:
+            total_lines = sum(1 for _ in f)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"❌ Impossible de trouver le fichier d'entrée : {FICHIER_ENTREE}")
+
+    print(f"🔄 Classement de {total_lines} entrées en cours...")
 
-# On compte les lignes pour la première barre de chargement
-print("📊 Calcul du volume à traiter...")
-try:
     with open(FICHIER_ENTREE, "r", encoding="utf-8") as f:
-        total_lines = sum(1 for _ in f)
-except FileNotFoundError:
-    raise FileNotFoundError(f"❌ Impossible de trouver le fichier d'entrée : {FICHIER_ENTREE}")
-
-print(f"🔄 Classement de {total_lines} entrées en cours...")
-
-with open(FICHIER_ENTREE, "r", encoding="utf-8") as f:
-    # Barre de chargement 1 : Lecture et tri
-    for line in tqdm(f, total=total_lines, desc="Tri des données", unit="li"):
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            obj = json.loads(line)
-        except json.JSONDecodeError:
-            continue
-
-        categories = obj.get("categories")
-        if not categories:
-            continue
-
-        # On évite d'ajouter le même objet plusieurs fois dans la MÊME famille
-        # (mais un objet peut appartenir à plusieurs familles différentes)
-        familles_ajoutees_pour_cet_objet = set()
-
-        for cat in categories.split(","):
-            cat_clean = cat.strip().lower()
-            fam = categorie_famille.get(cat_clean)
-
-            if fam and fam not in familles_ajoutees_pour_cet_objet:
+        # Barre de chargement 1 : Lecture et tri
+        for line in tqdm(f, total=total_lines, desc="Tri des données", unit="li"):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            for fam in index.familles(masque_objet(obj, index)):
                 famille_jsons[fam].append(obj)
-                familles_ajoutees_pour_cet_objet.add(fam)
+
+    # ----------------------------
+    # 2. SAUVEGARDE (ÉCRITURE)
+    # ----------------------------
+    print(f"\n💾 Sauvegarde dans {len(famille_jsons)} fichiers familles...")
+
+    ecrivain_parquet = creer_ecrivain_parquet()
+
+    # Barre de chargement 2 : Écriture des fichiers
+    for fam, objets in tqdm(famille_jsons.items(), desc="Écriture fichiers", unit="fam"):
+        nom_famille = nom_famille_fichier(fam)
+        chemin_sortie = chemin_famille(fam)
+
+        with open(chemin_sortie, "w", encoding="utf-8") as f:
+            for obj in objets:
+                f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+                if ecrivain_parquet is not None:
+                    # La partition porte le même nom que le fichier JSONL (sans l'extension)
+                    ecrivain_parquet.ajouter_ligne(nom_famille, obj)
+
+    fermer_ecrivain_parquet(ecrivain_parquet)
+
 
 # ----------------------------
-# 2. SAUVEGARDE (ÉCRITURE)
+# MODE STREAMING
 # ----------------------------
-print(f"\n💾 Sauvegarde dans {len(famille_jsons)} fichiers familles...")
-
-# Barre de chargement 2 : Écriture des fichiers
-for fam, objets in tqdm(famille_jsons.items(), desc="Écriture fichiers", unit="fam"):
-    nom_fichier = f"{fam.replace(' ', '_').replace('&', 'et')}.jsonl"
-    chemin_sortie = os.path.join(DOSSIER_SORTIE, nom_fichier)
+def separer_streaming(index, incremental=False):
+    try:
+        fin_entree = os.path.getsize(FICHIER_ENTREE)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"❌ Impossible de trouver le fichier d'entrée : {FICHIER_ENTREE}")
+
+    # Partie du fichier à traiter : tout, ou seulement la fin en mode incrémental
+    etat = None
+    debut = 0
+    sorties = [chemin_famille(fam) for fam in FAMILLES]
+    if incremental:
+        etat = EtatIncremental(FICHIER_ENTREE, FICHIER_ETAT)
+        debut, fin_entree = etat.demarrer(sorties)
+        if debut:
+            print(f"➕ Mode incrémental : reprise à l'octet {debut}")
+
+    total_octets = fin_entree - debut
+    print(f"🔄 Classement en streaming de {total_octets / 1024 / 1024:.1f} Mo...")
+
+    # Un fichier de sortie (avec son tampon) par famille, ouvert à la première ligne de la famille
+    fichiers = {}
+    nb_lignes = defaultdict(int)
+    numero_partie = etat.numero_partie(debut) if etat else 0
+    ecrivain_parquet = creer_ecrivain_parquet(numero_partie)
+
+    try:
+        with open(FICHIER_ENTREE, "rb") as f, \
+             tqdm(total=total_octets, unit="B", unit_scale=True, desc="Tri des données") as barre:
+
+            f.seek(debut)
+            octets_lus = 0
+            for line in lire_lignes(f, fin_entree):
+                # On met à jour la barre par paquets de 1 Mo (une mise à jour par ligne coûte cher)
+                octets_lus += len(line)
+                if octets_lus >= TAILLE_TAMPON:
+                    barre.update(octets_lus)
+                    octets_lus = 0
+
+                if not line.strip():
+                    continue
+
+                # json.loads valide la ligne (une ligne invalide est ignorée) et donne ses catégories
+                try:
+                    obj = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+
+                familles = index.familles(masque_objet(obj, index))
+                if not familles:
+                    continue
+
+                # On recopie la ligne telle quelle : pas de json.dumps
+                if not line.endswith(b"\n"):
+                    line += b"\n"
+
+                for fam in familles:
+                    fout = fichiers.get(fam)
+                    if fout is None:
+                        fout = fichiers[fam] = open(chemin_famille(fam), "ab" if debut else "wb",
+                                                    buffering=TAILLE_TAMPON)
+                    fout.write(line)
+                    nb_lignes[fam] += 1
+
+                    if ecrivain_parquet is not None:
+                        ecrivain_parquet.ajouter_ligne(nom_famille_fichier(fam), obj)
+
+            barre.update(octets_lus)
+    finally:
+        for fout in fichiers.values():
+            fout.close()
+
+    fermer_ecrivain_parquet(ecrivain_parquet)
+    if etat is not None:
+        etat.terminer(fin_entree, sorties, partie=numero_partie)
+
+    print(f"\n💾 {len(fichiers)} fichiers familles {'complétés' if debut else 'écrits'} :")
+    for fam, n in sorted(nb_lignes.items(), key=lambda x: -x[1]):
+        print(f"   - {fam} : {n} avis")
 
-    with open(chemin_sortie, "w", encoding="utf-8") as f:
-        for obj in objets:
-            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
 
-print("-" * 40)
-print(f"✅ Terminé ! Les fichiers sont dans : {DOSSIER_SORTIE}")
\ No newline at end of file
+# ----------------------------
+# MAIN
+# ----------------------------
+if __name__ == "__main__":
+    index = charger_index()
+
+    if MODE_INCREMENTAL:
+        # L'ajout en fin de fichier ne se fait qu'en streaming
+        if MODE_SEPARATION != "streaming":
+            print(f"⚠️  MODE_INCREMENTAL=1 : séparation en streaming au lieu de {MODE_SEPARATION}")
+        separer_streaming(index, incremental=True)
+    elif MODE_SEPARATION == "memoire":
+        separer_memoire(index)
+    elif MODE_SEPARATION == "streaming":
+        separer_streaming(index)
+    else:
+        raise ValueError(f"❌ MODE_SEPARATION inconnu : {MODE_SEPARATION} (attendu : streaming ou memoire)")
+
+    sauvegarder_index(index)
+
+    print("-" * 40)
+    print(f"✅ Terminé ! Les fichiers sont dans : {DOSSIER_SORTIE}")
@@ -0,0 +1,290 @@
+# pipeline.py
+# Lance les étapes du projet dans l'ordre, en sautant celles qui sont déjà à jour.
+#
+# Pour chaque étape on enregistre dans un manifeste (MANIFESTE_PIPELINE) :
+#   - le hash du contenu de ses entrées (fichiers/dossiers définis dans le .env),
+#   - le hash de son script et des modules dont il dépend,
+#   - ses paramètres (variables du .env qui changent le résultat),
+#   - le hash de ses sorties.
+# Une étape est relancée seulement si l'un de ces éléments a changé ou si ses sorties ont
+# disparu / été modifiées. Le manifeste est écrit après CHAQUE étape réussie : après un
+# plantage, relancer la commande reprend à la première étape non terminée.
+#
+# Exemples :
+#   python pipeline.py                          -> fusion, nettoyage, separation
+#   python pipeline.py --etapes separation,tfidf
+#   python pipeline.py --toutes --forcer
+#   python pipeline.py --etat                   -> affiche l'état sans rien lancer
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+
+DOSSIER_PROJET = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DOSSIER_PROJET, "code"))
+from empreinte_fichiers import hash_chemin
+
+load_dotenv()
+
+FICHIER_MANIFESTE = os.getenv("MANIFESTE_PIPELINE") or os.path.join(DOSSIER_PROJET, ".pipeline_manifeste.json")
+
+# ----------------------------
+# DÉFINITION DES ÉTAPES
+# ----------------------------
+# entrees / sorties : (variable du .env, motif des fichiers si c'est un dossier[, chemin par défaut])
+#                     chemin par défaut : relatif au projet, si la variable n'est pas définie
+#                     (variable None : toujours ce chemin, ex: fichiers écrits à la racine du projet)
+# fichiers          : fichiers du projet lus par l'étape (hors script)
+# code              : script + modules du projet dont dépend le résultat
+# parametres        : variables du .env lues par le script (ou ses modules) qui changent le résultat.
+#                     Non listées : chemins déjà suivis dans entrees / sorties, et variables qui ne
+#                     changent que la vitesse ou la mémoire (NB_PROCESSUS, BUDGET_MEMOIRE_MO,
+#                     BUDGET_MEMOIRE_ENTRAINEMENT_MO, TAILLE_LOT, DEDUP_FICHIER : emplacement de la
+#                     table de déduplication, FUSION_GARDER_PARTIES : garde les fichiers intermédiaires)
+ETAPES = [
+    {
+        "nom": "fusion",
+        "script": "code/entreprise.py",
+        "code": ["code/stockage_parquet.py", "code/etat_incremental.py"],
+        "entrees": [("INPUT_REVIEWS", "*"), ("INPUT_BUSINESS", "*")],
+        "fichiers": [],
+        "sorties": [("OUTPUT_FILE", "*")],
+        "parametres": ["MODE_FUSION", "ECRIRE_PARQUET", "DOSSIER_PARQUET", "MODE_INCREMENTAL"],
+    },
+    {
+        "nom": "nettoyage",
+        "script": "netoyage de donnée/nettoyageDonnees.py",
+        "code": ["code/normalisation_texte.py", "code/stockage_parquet.py", "code/etat_incremental.py",
+                 "netoyage de donnée/empreintes.py"],
+        "entrees": [("OUTPUT_FILE", "*")],
+        "fichiers": [],
+        "sorties": [("OUTPUT_FILE2", "*")],
+        "parametres": ["DEDUP_BITS", "ECRIRE_PARQUET", "DOSSIER_PARQUET", "MODE_INCREMENTAL"],
+    },
+    {
+        "nom": "separation",
+        "script": "netoyage de donnée/separationEnPlusieurFamilles.py",
+        "code": ["code/stockage_parquet.py", "code/etat_incremental.py", "netoyage de donnée/index_familles.py"],
+        "entrees": [("OUTPUT_FILE2", "*")],
+        "fichiers": ["Analyse de données/toutesLesCateg.txt"],
+        "sorties": [("OUTPUT_FILE3", "*.jsonl")],
+        # INPUT_BUSINESS : sa taille et sa date font partie de la signature de l'index des familles
+        "parametres": ["MODE_SEPARATION", "INDEX_FAMILLES", "INPUT_BUSINESS",
+                       "ECRIRE_PARQUET", "DOSSIER_PARQUET", "MODE_INCREMENTAL"],
+    },
+    {
+        "nom": "popularite",
+        "script": "Analyse de données/analysepopularite.py",
+        "code": ["code/stockage_parquet.py", "Analyse de données/agregats.py"],
+        "entrees": [("OUTPUT_FILE3", "*.jsonl")],
+        "fichiers": [],
+        "sorties": [("OUTPUT_FILE3", "resume_*.csv")],
+        "parametres": ["LIRE_PARQUET", "DOSSIER_PARQUET", "MODE_AGREGATION"],
+    },
+    {
+        "nom": "bow",
+        "script": "code/machine_learnig/bow.py",
+        "code": ["code/normalisation_texte.py", "code/machine_learnig/cache_features.py"],
+        "entrees": [("INPUT_REVIEWS", "*")],
+        "fichiers": [],
+        "sorties": [("OUTPUT_BOW", "*")],
+        "parametres": ["OUTPUT_DIR", "MODE_BOW", "CACHE_FEATURES", "DOSSIER_CACHE_FEATURES"],
+    },
+    {
+        "nom": "tfidf",
+        "script": "code/machine_learnig/ia prediction_tf-idf.py",
+        "code": ["code/normalisation_texte.py", "code/stockage_parquet.py", "code/machine_learnig/cache_features.py",
+                 "code/ordonnanceur.py", "code/machine_learnig/artefacts.py"],
+        "entrees": [("OUTPUT_FILE3", "*.jsonl")],
+        "fichiers": [],
+        # *.csv : predictions_<famille>.csv et, en mode recherche, recherche_<famille>.csv
+        "sorties": [("OUTPUT_FILE_IA_PREDICTION_TF-IDF", "*.csv"),
+                    ("DOSSIER_ARTEFACTS", "tfidf/*/courant", "artefacts")],
+        "parametres": ["LIRE_PARQUET", "DOSSIER_PARQUET", "MODE_TFIDF", "NB_EPOQUES",
+                       "CACHE_FEATURES", "DOSSIER_CACHE_FEATURES", "DOSSIER_ARTEFACTS"],
+    },
+    {
+        "nom": "svm",
+        "script": "code/machine_learnig/IA_SVM.py",
+        "code": ["code/normalisation_texte.py", "code/stockage_parquet.py", "code/machine_learnig/cache_features.py",
+                 "code/ordonnanceur.py", "code/machine_learnig/artefacts.py"],
+        "entrees": [("OUTPUT_FILE3", "*.jsonl")],
+        "fichiers": [],
+        # Le script est lancé à la racine du projet : les CSV y sont écrits
+        "sorties": [(None, "predictions_*.csv", "."), (None, "comparaison_svm.csv", "."),
+                    ("DOSSIER_ARTEFACTS", "svm/*/courant", "artefacts")],
+        "parametres": ["LIRE_PARQUET", "DOSSIER_PARQUET", "MODE_SVM",
+                       "CACHE_FEATURES", "DOSSIER_CACHE_FEATURES", "DOSSIER_ARTEFACTS"],
+    },
+    {
+        "nom": "llm",
+        "script": "code/ia_ML_LLM",
+        "code": ["code/ordonnanceur.py"],
+        "entrees": [("OUTPUT_FILE3", "*.jsonl")],
+        "fichiers": [],
+        "sorties": [("OUTPUT_FILE_prediction", "predictions_LLM_*.csv")],
+        "parametres": [],
+    },
+]
+
+ETAPES_PAR_DEFAUT = ["fusion", "nettoyage", "separation"]
+
+
+# ----------------------------
+# MANIFESTE
+# ----------------------------
+def charger_manifeste():
+    if os.path.exists(FICHIER_MANIFESTE):
+        with open(FICHIER_MANIFESTE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"etapes": {}, "cache_hash": {}}
+
+
+def sauvegarder_manifeste(manifeste):
+    # Écriture dans un fichier temporaire puis renommage : le manifeste n'est jamais à moitié écrit
+    temporaire = FICHIER_MANIFESTE + ".tmp"
+    with open(temporaire, "w", encoding="utf-8") as f:
+        json.dump(manifeste, f, ensure_ascii=False, indent=2)
+    os.replace(temporaire, FICHIER_MANIFESTE)
+
+
+# ----------------------------
+# SIGNATURES
+# ----------------------------
+def chemin_projet(chemin_relatif):
+    return os.path.join(DOSSIER_PROJET, chemin_relatif)
+
+
+def hash_variables(liste, cache):
+    resultat = {}
+    for variable, motif, *defaut in liste:
+        chemin = os.getenv(variable) if variable else None
+        if not chemin and defaut:
+            chemin = chemin_projet(defaut[0])
+        resultat[f"{variable or defaut[0]}:{motif}"] = hash_chemin(chemin, cache, motif)
+    return resultat
+
+
+def signature_etape(etape, cache):
+    code = {fichier: hash_chemin(chemin_projet(fichier), cache)
+            for fichier in [etape["script"]] + etape["code"] + etape["fichiers"]}
+    return {
+        "entrees": hash_variables(etape["entrees"], cache),
+        "code": code,
+        "parametres": {nom: os.getenv(nom) for nom in etape["parametres"]},
+    }
+
+
+def etat_etape(etape, manifeste, cache):
+    """Renvoie (à_jour, raison, signature)."""
+    signature = signature_etape(etape, cache)
+
+    manquantes = [cle for cle, h in signature["entrees"].items() if h is None]
+    if manquantes:
+        return False, f"entrée introuvable : {', '.join(manquantes)}", signature
+
+    precedent = manifeste["etapes"].get(etape["nom"])
+    if precedent is None:
+        return False, "jamais terminée", signature
+
+    for partie, libelle in [("entrees", "entrées modifiées"), ("code", "code modifié"), ("parametres", "paramètres modifiés")]:
+        if precedent["signature"][partie] != signature[partie]:
+            changes = [cle for cle in signature[partie] if precedent["signature"][partie].get(cle) != signature[partie][cle]]
+            return False, f"{libelle} : {', '.join(changes)}", signature
+
+    sorties = hash_variables(etape["sorties"], cache)
+    if sorties != precedent["sorties"]:
+        return False, "sorties absentes ou modifiées", signature
+
+    return True, "à jour", signature
+
+
+# ----------------------------
+# EXÉCUTION
+# ----------------------------
+def lancer_etape(etape):
+    script = chemin_projet(etape["script"])
+    print(f"▶️  {etape['nom']} : python {etape['script']}")
+    debut = time.time()
+    resultat = subprocess.run([sys.executable, script], cwd=DOSSIER_PROJET)
+    duree = time.time() - debut
+    return resultat.returncode == 0, duree
+
+
+def executer(noms_etapes, forcer=False, afficher_seulement=False):
+    manifeste = charger_manifeste()
+    cache = manifeste.setdefault("cache_hash", {})
+
+    for etape in ETAPES:
+        if etape["nom"] not in noms_etapes:
+            continue
+
+        a_jour, raison, signature = etat_etape(etape, manifeste, cache)
+
+        if afficher_seulement:
+            print(f"{'✅' if a_jour else '🔄'} {etape['nom']:<12} {raison}")
+            continue
+
+        if a_jour and not forcer:
+            print(f"⏭️  {etape['nom']} : à jour, étape sautée")
+            sauvegarder_manifeste(manifeste)
+            continue
+
+        if raison.startswith("entrée introuvable"):
+            print(f"❌ {etape['nom']} : {raison}")
+            sauvegarder_manifeste(manifeste)
+            return False
+
+        print(f"🔄 {etape['nom']} : {'relance forcée' if a_jour else raison}")
+
+        # L'étape est retirée du manifeste AVANT de la lancer : si elle plante,
+        # ses sorties à moitié écrites ne seront pas considérées comme valides
+        manifeste["etapes"].pop(etape["nom"], None)
+        sauvegarder_manifeste(manifeste)
+
+        reussi, duree = lancer_etape(etape)
+        if not reussi:
+            print(f"❌ {etape['nom']} a échoué après {duree:.0f} s.")
+            print("   Corrigez le problème puis relancez : les étapes terminées seront sautées.")
+            return False
+
+        manifeste["etapes"][etape["nom"]] = {
+            "signature": signature,
+            "sorties": hash_variables(etape["sorties"], cache),
+            "duree_s": round(duree, 1),
+            "termine_le": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        sauvegarder_manifeste(manifeste)
+        print(f"✅ {etape['nom']} terminée en {duree:.0f} s")
+
+    return True
+
+
+if __name__ == "__main__":
+    noms_connus = [etape["nom"] for etape in ETAPES]
+
+    parser = argparse.ArgumentParser(description="Lance les étapes du pipeline en sautant celles qui sont à jour.")
+    parser.add_argument("--etapes", help=f"étapes à lancer, séparées par des virgules ({', '.join(noms_connus)})")
+    parser.add_argument("--toutes", action="store_true", help="lancer toutes les étapes")
+    parser.add_argument("--forcer", action="store_true", help="relancer même les étapes à jour")
+    parser.add_argument("--etat", action="store_true", help="afficher l'état des étapes sans rien lancer")
+    args = parser.parse_args()
+
+    if args.toutes:
+        noms = noms_connus
+    elif args.etapes:
+        noms = [nom.strip() for nom in args.etapes.split(",") if nom.strip()]
+        inconnues = [nom for nom in noms if nom not in noms_connus]
+        if inconnues:
+            print(f"❌ Étapes inconnues : {', '.join(inconnues)} (connues : {', '.join(noms_connus)})")
+            sys.exit(1)
+    else:
+        noms = ETAPES_PAR_DEFAUT
+
+    print(f"📋 Manifeste : {FICHIER_MANIFESTE}")
+    print("-" * 40)
+    ok = executer(noms, forcer=args.forcer, afficher_seulement=args.etat)
+    sys.exit(0 if ok else 1)